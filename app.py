@@ -1,12 +1,6 @@
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import LabelEncoder
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import cross_val_score, GridSearchCV
-from sklearn.metrics import classification_report
-from imblearn.over_sampling import SMOTE
-import pickle
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import os
 from datetime import datetime, timedelta
@@ -15,16 +9,33 @@ import joblib
 import bcrypt
 from firebase_admin import credentials, firestore, initialize_app
 import firebase_admin
-import requests
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
-import schedule
-import time
-import threading
 import json
+import heapq
+import threading
 import jwt
 from functools import wraps
 import pytz
+from artifacts import load_bundle, ArtifactBundleError, cervical_features, ovarian_features
+from cohort_index import CohortIndex, risk_category
+from forest_inference import compile_models, FusedForest
+from write_buffer import FIRESTORE_BATCH_LIMIT, WriteBuffer, after_commit, record_write, buffered_writes
+from write_behind import WriteBehindQueue
+from ttl_cache import TTLCache
+from label_codec import HISTORY_ENCODED_FIELDS, build_codecs, decode_records
+from concurrency import FanOut
+from report_jobs import ReportJobs, ReportStore, QueueFullError
+from response_cache import ResponseCache
+from population_cube import cervical_cube, ovarian_cube
+from history_sync import ChunkStore, HistorySync, META_COLUMNS
+from lookup_index import CostIndex, InventoryIndex, ReloadingIndex
+from risk_rules import CERVICAL_RISK_RULES, OVARIAN_CYSTS_RISK_RULES
+from normalization import (
+    normalize_hpv_result, normalize_pap_result, normalize_yes_no, normalize_screening_type
+)
+from token_revocation import RevocationList, RevocationListUnavailable
+import atexit
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -44,40 +55,151 @@ except Exception as e:
     logger.error(f"Error initializing Firebase: {e}")
     raise
 
-# Africa's Talking credentials (replace with your credentials)
-AFRICAS_TALKING_USERNAME = "your_username"
-AFRICAS_TALKING_API_KEY = "your_api_key"
+# Audit records that are never read back on the request path (education,
+# advanced education, risk comparisons) are written behind the response
+audit_writer = WriteBehindQueue(db, os.path.join(data_dir, "audit_spill.jsonl"))
+atexit.register(audit_writer.stop)
 
 # JWT Secret Key (replace with a secure key in production)
 JWT_SECRET = "your_jwt_secret_key"
 JWT_ALGORITHM = "HS256"
 
+# "strict" checks every token against users/{uid}/tokens in Firestore;
+# "stateless" trusts the signed exp claim and checks an in-memory revocation list
+TOKEN_VERIFICATION_MODE = os.environ.get("TOKEN_VERIFICATION_MODE", "strict").lower()
+if TOKEN_VERIFICATION_MODE not in ("strict", "stateless"):
+    raise ValueError(f"Invalid TOKEN_VERIFICATION_MODE: {TOKEN_VERIFICATION_MODE}")
+revocation_list = RevocationList(db, refresh_interval=float(os.environ.get("REVOCATION_REFRESH_INTERVAL", 60)))
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
 
-# Load datasets
-logger.info("Loading datasets...")
+# Load the trained models, encoders and cleaned datasets. Training happens
+# offline in train_models.py; the server only loads the resulting bundle.
+artifact_dir = os.environ.get("ARTIFACT_DIR", os.path.join(data_dir, "artifacts"))
+logger.info("Loading artifact bundle...")
 try:
-    cervical_data = pd.read_excel(os.path.join(data_dir, "Cervical Cancer Datasets_.xlsx"))
-    ovarian_data = pd.read_excel(os.path.join(data_dir, "Ovarian Cyst Track Data.xlsx"))
-    inventory_data = pd.read_excel(os.path.join(data_dir, "Resources Inventory Cost Sheet.xlsx"))
-    costs_data = pd.read_excel(os.path.join(data_dir, "Treatment Costs Sheet.xlsx"))
-except Exception as e:
-    logger.error(f"Error loading datasets: {e}")
+    bundle = load_bundle(artifact_dir, os.environ.get("ARTIFACT_VERSION"))
+except ArtifactBundleError as e:
+    logger.error(f"{e} Run `python train_models.py` to build an artifact bundle.")
     raise
 
+model_version = bundle.version
+# The forests are served from flat NumPy node arrays rather than sklearn, which
+# avoids sklearn's per-call validation and dispatch on one-row requests
+compiled_models = compile_models(bundle.models)
+cervical_model = compiled_models["cervical_model"]
+insurance_model = compiled_models["insurance_model"]
+management_model = compiled_models["management_model"]
+ultrasound_model = compiled_models["ultrasound_model"]
+
+# Heads that share a feature row are fused, so one traversal yields every
+# label and probability a recommendation request needs
+cervical_predictor = FusedForest({"action": cervical_model, "insurance": insurance_model})
+ovarian_predictor = FusedForest({"management": management_model, "ultrasound": ultrasound_model})
+encoders = bundle.encoders
+codecs = build_codecs(encoders)
+cervical_data = bundle.frames["cervical"]
+ovarian_data = bundle.frames["ovarian"]
+inventory_data = bundle.frames["inventory"]
+costs_data = bundle.frames["costs"]
+logger.info(f"Models and encoders loaded successfully (version {model_version}).")
+
+# Indexed views of the cost and inventory sheets, rebuilt when the CSVs change
+cost_index = ReloadingIndex(bundle.frame_path("costs"), CostIndex, frame=costs_data)
+inventory_index = ReloadingIndex(bundle.frame_path("inventory"), InventoryIndex, frame=inventory_data)
+
+# Score the reference cohorts once per model version for the risk comparison engine
+cohort_indexes = {
+    "cervical": CohortIndex(cervical_model, cervical_data, cervical_features, model_version),
+    "ovarian": CohortIndex(management_model, ovarian_data, ovarian_features, model_version)
+}
+
+# Fused call vs. the separate predict calls it replaces (both heads plus the
+# percentile path's second pass over the risk head)
+predictor_benchmarks = {
+    "cervical": cervical_predictor.benchmark(cervical_data[cervical_features].iloc[:1], [cervical_model, insurance_model, cervical_model], repeat=20),
+    "ovarian": ovarian_predictor.benchmark(ovarian_data[ovarian_features].iloc[:1], [ultrasound_model, management_model, management_model], repeat=20)
+}
+logger.info(f"Fused predictor timings per request: {predictor_benchmarks}")
+
+# Version of the population datasets; cached aggregate responses are keyed on it
+dataset_version = model_version
+dataset_revision = 0
+population_response_cache = ResponseCache(lambda: dataset_version,
+                                          max_age=int(os.environ.get("POPULATION_CACHE_MAX_AGE", 60)))
+
+# Region x age band x result aggregate cubes for population analytics
+population_cubes = {
+    "cervical": cervical_cube(cervical_data, encoders),
+    "ovarian": ovarian_cube(ovarian_data)
+}
+population_lock = threading.Lock()
+
+def ingest_history_rows(condition_type, rows):
+    """
+    Append synced patient_history rows (encoded like the cleaned frames) to the
+    population frame, cube and cohort index of a condition, and bump the
+    dataset version.
+    """
+    global cervical_data, ovarian_data, dataset_version, dataset_revision
+    rows = rows.drop(columns=[c for c in META_COLUMNS if c in rows.columns])
+    with population_lock:
+        # Columns of the cleaned frames that synced rows do not carry (such as the
+        # stray "Unnamed: 12" of the cervical CSV) are left empty
+        if condition_type == "cervical":
+            cervical_data = pd.concat([cervical_data, rows.reindex(columns=cervical_data.columns)], ignore_index=True)
+        else:
+            ovarian_data = pd.concat([ovarian_data, rows.reindex(columns=ovarian_data.columns)], ignore_index=True)
+        population_cubes[condition_type].add_frame(rows)
+        cohort_indexes[condition_type].add(rows)
+        dataset_revision += 1
+        dataset_version = f"{model_version}.{dataset_revision}"
+    return len(rows)
+
+# Live submissions under patient_history/*/{cervical,ovarian} are tailed into
+# the population datasets; rows synced before a restart come from the local store
+history_sync = HistorySync(db, ChunkStore(os.environ.get("HISTORY_STORE_DIR", os.path.join(data_dir, "history_store"))),
+                           encoders, ingest_history_rows, interval=float(os.environ.get("HISTORY_SYNC_INTERVAL", 30)))
+history_sync.replay_store()
+
+@app.before_request
+def start_history_sync():
+    history_sync.ensure_started()
+
 # Symptoms for ovarian cyst dataset
 symptoms = ["Pelvic Pain", "Bloating", "Nausea", "Fatigue", "Irregular Periods"]
 
+# Shared pool for the independent Firestore reads a request fans out
+fanout = FanOut(max_workers=int(os.environ.get("FANOUT_WORKERS", 8)))
+
+# Per-process cache of the user profile fields read on every authenticated call
+USER_PROFILE_FIELDS = ("region", "role", "phone")
+user_profile_cache = TTLCache(maxsize=int(os.environ.get("USER_CACHE_SIZE", 10000)),
+                              ttl=float(os.environ.get("USER_CACHE_TTL", 300)))
+
+def load_user_profile(user_uid):
+    user_doc = db.collection("users").document(user_uid).get()
+    if not user_doc.exists:
+        return None
+    user_data = user_doc.to_dict()
+    return {field: user_data.get(field) for field in USER_PROFILE_FIELDS}
+
+def get_user_profile(user_uid):
+    """Cached region/role/phone for a user, or None if the user does not exist."""
+    return user_profile_cache.get_or_load(user_uid, load_user_profile)
+
+def invalidate_user_profile(user_uid):
+    user_profile_cache.invalidate(user_uid)
+
 # Validate region based on logged-in user's data
 def validate_region(user_uid, region=None):
     try:
-        # Fetch the user's document to get their region
-        user_doc = db.collection("users").document(user_uid).get()
-        if user_doc.exists:
-            user_data = user_doc.to_dict()
-            valid_region = user_data.get("region", "").title().strip()
+        # Fetch the user's profile (cached) to get their region
+        user_data = get_user_profile(user_uid)
+        if user_data is not None:
+            valid_region = (user_data.get("region") or "").title().strip()
             if not valid_region:
                 raise ValueError(f"No region found for user {user_uid} in Firebase.")
             return valid_region
@@ -87,424 +209,6 @@ def validate_region(user_uid, region=None):
         logger.error(f"Error validating region for user {user_uid}: {e}")
         raise ValueError(f"Unable to validate region due to an error: {str(e)}")
 
-# Step 1: Clean Cervical Cancer Dataset
-logger.info("Cleaning Cervical Cancer data...")
-cervical_data = cervical_data.rename(columns={"Insrance Covered": "Insurance Covered"})
-cervical_data["Region"] = cervical_data["Region"].str.strip().str.title().replace({
-    "Pumwani ": "Pumwani",
-    "Kakamega ": "Kakamega",
-    "Machakos ": "Machakos"
-})
-cervical_data["HPV Test Result"] = cervical_data["HPV Test Result"].str.strip().str.title().replace({
-    "Negagtive": "Negative", "Negativee": "Negative", "Pos": "Positive", "Possitive": "Positive"
-})
-cervical_data["Pap Smear Result"] = cervical_data["Pap Smear Result"].str.strip().str.title().replace({
-    "N": "Negative", "Y": "Positive", "Neg": "Negative", "Negagtive": "Negative"
-})
-cervical_data["Smoking Status"] = cervical_data["Smoking Status"].str.strip().str.title().replace({"N": "No", "Y": "Yes"})
-cervical_data["STDs History"] = cervical_data["STDs History"].str.strip().str.title().replace({"N": "No", "Y": "Yes"})
-cervical_data["Insurance Covered"] = cervical_data["Insurance Covered"].str.strip().str.title().replace({"N": "No", "Y": "Yes"})
-cervical_data["Screening Type Last"] = cervical_data["Screening Type Last"].str.strip().str.upper().replace({
-    "Pap Smear": "PAP SMEAR", "Hpv Dna": "HPV DNA", "Via": "VIA"
-})
-cervical_data["Recommended Action"] = cervical_data["Recommended Action"].str.strip().str.title().replace({
-    "Coloscopy": "Colposcopy",
-    "Biospy": "Biopsy",
-    "Colposocpy": "Colposcopy",
-    "Repeat In 3 Years": "Repeat Pap Smear In 3 Years",
-    "Follow-Up": "Repeat Pap Smear In 3 Years",
-    "Follow Up": "Repeat Pap Smear In 3 Years",
-    "For Annual Follow Up And Pap Smear In 3 Years": "Annual Follow Up And Pap Smear In 3 Years",
-    "For Anual Follow Up And Pap Smear In 3 Years": "Annual Follow Up And Pap Smear In 3 Years",
-    "For Colposcopy Biospy, Cytology": "Colposcopy, Biopsy, Cytology",
-    "For Coloscopy Biosy, Cytology": "Colposcopy, Biopsy, Cytology",
-    "Forcolposcopy, Cytology Then Laser Therapy": "Colposcopy, Cytology, Laser Therapy",
-    "For Biopsy And Cytology With Tah Not Recommended": "Colposcopy, Biopsy, Cytology",
-    "For Colposcopy Cytology": "Colposcopy, Biopsy, Cytology",
-    "For Hpv Vaccine And Sexual Education": "Hpv Vaccine And Sexual Education",
-    "For Hpv Vaccination And Sexual Education": "Hpv Vaccine And Sexual Education",
-    "For Colposcopy Biopsy, Cytology +/- Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
-    "For Colposcopy Biopsy, Cytology +/-Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
-    "For Colposcopy Biospy, Cytology +/- Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
-    "For Colposcopy Biosy, Cytology+/- Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
-    "For Colposcopy Biopsy And Cytology+/- Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
-    "For Colposcpy Biopsy, Cytology": "Colposcopy, Biopsy, Cytology",
-    "For Colposocpy Biopsy, Cytology With Tah Not Recommended": "Colposcopy, Biopsy, Cytology",
-    "For Laser Therapy": "Laser Therapy",
-    "For Pap Smear": "Repeat Pap Smear In 3 Years",
-    "Repeat Pap Smear In 3Years": "Repeat Pap Smear In 3 Years",
-    "Repeat Pap Smear In 3 Years And For Hpv Vaccine": "Repeat Pap Smear In 3 Years",
-    "For Repeat Hpv Testing Annually And Pap Smear In 3 Years": "Repeat Pap Smear In 3 Years",
-    "For Hpv Vaccine, Lifestyle And Sexual Education": "Hpv Vaccine And Sexual Education",
-    "For Colposcopy Biopsy, Cytology +/-Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
-    "For Colposcopy Biopsy And Cytology+/- Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
-    "For Colposcopy Biospy, Cytology": "Colposcopy, Biopsy, Cytology",
-    "Repeat Pap Smear In 3Years": "Repeat Pap Smear In 3 Years"
-})
-
-# Handle missing values
-cervical_data = cervical_data.fillna({
-    "Age": cervical_data["Age"].median(),
-    "Sexual Partners": cervical_data["Sexual Partners"].median(),
-    "First Sexual Activity Age": cervical_data["First Sexual Activity Age"].median(),
-    "HPV Test Result": "Negative",
-    "Pap Smear Result": "Negative",
-    "Smoking Status": "No",
-    "STDs History": "No",
-    "Insurance Covered": "No",
-    "Screening Type Last": "PAP SMEAR",
-    "Recommended Action": "Repeat Pap Smear In 3 Years",
-    "Region": ""  # Placeholder for region, validated in API
-})
-
-# Encode categorical variables
-le_hpv = LabelEncoder()
-le_pap = LabelEncoder()
-le_smoking = LabelEncoder()
-le_std = LabelEncoder()
-le_insurance = LabelEncoder()
-le_screening = LabelEncoder()
-le_action = LabelEncoder()
-
-cervical_data["HPV Test Result"] = le_hpv.fit_transform(cervical_data["HPV Test Result"])
-cervical_data["Pap Smear Result"] = le_pap.fit_transform(cervical_data["Pap Smear Result"])
-cervical_data["Smoking Status"] = le_smoking.fit_transform(cervical_data["Smoking Status"])
-cervical_data["STDs History"] = le_std.fit_transform(cervical_data["STDs History"])
-cervical_data["Insurance Covered"] = le_insurance.fit_transform(cervical_data["Insurance Covered"])
-cervical_data["Screening Type Last"] = le_screening.fit_transform(cervical_data["Screening Type Last"])
-cervical_data["Recommended Action"] = le_action.fit_transform(cervical_data["Recommended Action"])
-
-# Save encoders
-for le, name in [
-    (le_hpv, "le_hpv"), (le_pap, "le_pap"), (le_smoking, "le_smoking"),
-    (le_std, "le_std"), (le_insurance, "le_insurance"), (le_screening, "le_screening"),
-    (le_action, "le_action")
-]:
-    pickle.dump(le, open(os.path.join(data_dir, f"{name}.pkl"), "wb"))
-
-cervical_data.to_csv(os.path.join(data_dir, "cervical_cleaned.csv"), index=False)
-logger.info("Cervical data cleaned!")
-
-# Step 2: Clean Ovarian Cyst Dataset
-logger.info("Cleaning Ovarian Cyst data...")
-ovarian_data.loc[ovarian_data["Age"] < 40, "Menopause Status"] = "Pre-Menopausal"
-ovarian_data["Menopause Status"] = ovarian_data["Menopause Status"].str.strip().str.title()
-ovarian_data["Ultrasound Features"] = ovarian_data["Ultrasound Features"].str.strip().str.title()
-ovarian_data["Recommended Management"] = ovarian_data["Recommended Management"].str.strip().str.title()
-ovarian_data["Region"] = ovarian_data["Region"].str.strip().str.title()
-
-# Create binary columns for symptoms
-for symptom in symptoms:
-    ovarian_data[symptom] = ovarian_data["Reported Symptoms"].apply(
-        lambda x: 1 if symptom.lower() in str(x).lower() else 0
-    )
-
-ovarian_data = ovarian_data.fillna({
-    "Age": ovarian_data["Age"].median(),
-    "Cyst Size cm": ovarian_data["Cyst Size cm"].median(),
-    "Cyst Growth Rate cm/month": ovarian_data["Cyst Growth Rate cm/month"].median(),
-    "CA 125 Level": ovarian_data["CA 125 Level"].median(),
-    "Menopause Status": "Pre-Menopausal",
-    "Ultrasound Features": "Simple Cyst",
-    "Recommended Management": "Observation",
-    "Reported Symptoms": "",
-    "Date of Exam": pd.Timestamp.now().floor("D"),
-    "Region": ""  # Placeholder for region, validated in API
-})
-
-le_menopause = LabelEncoder()
-le_ultrasound = LabelEncoder()
-le_management = LabelEncoder()
-
-ovarian_data["Menopause Status"] = le_menopause.fit_transform(ovarian_data["Menopause Status"])
-ovarian_data["Ultrasound Features"] = le_ultrasound.fit_transform(ovarian_data["Ultrasound Features"])
-ovarian_data["Recommended Management"] = le_management.fit_transform(ovarian_data["Recommended Management"])
-
-for le, name in [
-    (le_menopause, "le_menopause"), (le_ultrasound, "le_ultrasound"), (le_management, "le_management")
-]:
-    pickle.dump(le, open(os.path.join(data_dir, f"{name}.pkl"), "wb"))
-
-ovarian_data.to_csv(os.path.join(data_dir, "ovarian_cleaned.csv"), index=False)
-logger.info("Ovarian data cleaned!")
-
-# Step 3: Clean Inventory and Costs Datasets
-logger.info("Cleaning Inventory and Costs data...")
-inventory_data["Facility"] = inventory_data["Facility"].str.strip().str.title()
-inventory_data["Region"] = inventory_data["Region"].str.strip().str.title()
-costs_data["Facility"] = costs_data["Facility"].str.strip().str.title()
-costs_data["Region"] = costs_data["Region"].str.strip().str.title()
-costs_data["Service"] = costs_data["Service"].str.strip().str.title()
-costs_data["Category"] = costs_data["Category"].str.strip().str.title()
-costs_data["NHIF Covered"] = costs_data["NHIF Covered"].str.strip().str.title().replace({"N": "No", "Y": "Yes"})
-
-inventory_data = inventory_data.fillna({
-    "Available Stock": 0,
-    "Cost (KES)": inventory_data["Cost (KES)"].median()
-})
-costs_data = costs_data.fillna({
-    "Base Cost (KES)": costs_data["Base Cost (KES)"].median(),
-    "Insurance Copay (KES)": 0,
-    "Out-of-Pocket (KES)": costs_data["Out-of-Pocket (KES)"].median()
-})
-
-costs_data["Base Cost (KES)"] = costs_data["Base Cost (KES)"].round(2)
-costs_data["Insurance Copay (KES)"] = costs_data["Insurance Copay (KES)"].round(2)
-costs_data["Out-of-Pocket (KES)"] = costs_data["Out-of-Pocket (KES)"].round(2)
-
-inventory_data.to_csv(os.path.join(data_dir, "inventory_cleaned.csv"), index=False)
-costs_data.to_csv(os.path.join(data_dir, "costs_cleaned.csv"), index=False)
-logger.info("Inventory and Costs data cleaned!")
-
-# Step 4: Train Cervical Cancer Model
-logger.info("Training Cervical Cancer model...")
-cervical_data = pd.read_csv(os.path.join(data_dir, "cervical_cleaned.csv"))
-features = [
-    "Age", "Sexual Partners", "First Sexual Activity Age",
-    "HPV Test Result", "Pap Smear Result", "Smoking Status", "STDs History",
-    "Screening Type Last"
-]
-target = "Recommended Action"
-X = cervical_data[features]
-y = cervical_data[target]
-
-class_counts = y.value_counts()
-valid_classes = class_counts[class_counts >= 2].index
-if len(valid_classes) < len(class_counts):
-    logger.info(f"Filtering out classes with fewer than 2 samples: {list(class_counts[class_counts < 2].index)}")
-    valid_mask = y.isin(valid_classes)
-    X = X[valid_mask]
-    y = y[valid_mask]
-    cervical_data = cervical_data[valid_mask]
-
-min_samples = min(y.value_counts()) if not y.empty else 2
-cv_folds = min(5, max(2, min_samples))
-if min_samples >= 2:
-    smote = SMOTE(random_state=42, k_neighbors=min(5, min_samples-1))
-    try:
-        X_resampled, y_resampled = smote.fit_resample(X, y)
-    except ValueError as e:
-        logger.error(f"SMOTE failed: {e}. Falling back to original data.")
-        X_resampled, y_resampled = X, y
-else:
-    logger.warning("Not enough samples for SMOTE. Using original data.")
-    X_resampled, y_resampled = X, y
-    cv_folds = 2
-
-param_grid = {
-    "n_estimators": [100, 200],
-    "max_depth": [5, 10, None],
-    "min_samples_split": [2, 5],
-    "min_samples_leaf": [1, 2]
-}
-cervical_model = RandomForestClassifier(random_state=42)
-grid_search = GridSearchCV(cervical_model, param_grid, cv=cv_folds, scoring="accuracy", n_jobs=-1)
-grid_search.fit(X_resampled, y_resampled)
-cervical_model = grid_search.best_estimator_
-logger.info(f"Best parameters: {grid_search.best_params_}")
-
-if cv_folds >= 2:
-    cv_scores = cross_val_score(cervical_model, X_resampled, y_resampled, cv=cv_folds, scoring="accuracy")
-    logger.info(f"Cervical Model Cross-Validation Accuracy: {cv_scores.mean() * 100:.2f}% ± {cv_scores.std() * 100:.2f}%")
-else:
-    logger.info("Cross-validation skipped due to insufficient samples.")
-
-cervical_model.fit(X_resampled, y_resampled)
-predictions = cervical_model.predict(X)
-logger.info("Cervical Model Classification Report:")
-logger.info(classification_report(y, predictions, target_names=le_action.classes_[valid_classes], zero_division=0))
-pickle.dump(cervical_model, open(os.path.join(data_dir, "cervical_model.pkl"), "wb"))
-
-# Train Insurance Covered Model
-logger.info("Training Insurance Covered model...")
-insurance_features = [
-    "Age", "Sexual Partners", "First Sexual Activity Age",
-    "HPV Test Result", "Pap Smear Result", "Smoking Status", "STDs History",
-    "Screening Type Last"
-]
-insurance_target = "Insurance Covered"
-X_insurance = cervical_data[insurance_features]
-y_insurance = cervical_data[insurance_target]
-
-min_samples_insurance = min(y_insurance.value_counts()) if not y_insurance.empty else 2
-cv_folds_insurance = min(5, max(2, min_samples_insurance))
-if min_samples_insurance >= 2:
-    smote_insurance = SMOTE(random_state=42, k_neighbors=min(5, min_samples_insurance-1))
-    try:
-        X_insurance_resampled, y_insurance_resampled = smote_insurance.fit_resample(X_insurance, y_insurance)
-    except ValueError as e:
-        logger.error(f"SMOTE failed for insurance: {e}. Falling back to original data.")
-        X_insurance_resampled, y_insurance_resampled = X_insurance, y_insurance
-else:
-    logger.warning("Not enough samples for SMOTE in insurance data. Using original data.")
-    X_insurance_resampled, y_insurance_resampled = X_insurance, y_insurance
-    cv_folds_insurance = 2
-
-insurance_model = RandomForestClassifier(random_state=42)
-grid_search_insurance = GridSearchCV(insurance_model, param_grid, cv=cv_folds_insurance, scoring="accuracy", n_jobs=-1)
-grid_search_insurance.fit(X_insurance_resampled, y_insurance_resampled)
-insurance_model = grid_search_insurance.best_estimator_
-logger.info(f"Insurance Model Best parameters: {grid_search_insurance.best_params_}")
-
-if cv_folds_insurance >= 2:
-    cv_scores_insurance = cross_val_score(insurance_model, X_insurance_resampled, y_insurance_resampled, cv=cv_folds_insurance, scoring="accuracy")
-    logger.info(f"Insurance Model Cross-Validation Accuracy: {cv_scores_insurance.mean() * 100:.2f}% ± {cv_scores_insurance.std() * 100:.2f}%")
-else:
-    logger.info("Cross-validation skipped for insurance model due to insufficient samples.")
-
-insurance_model.fit(X_insurance_resampled, y_insurance_resampled)
-pickle.dump(insurance_model, open(os.path.join(data_dir, "insurance_model.pkl"), "wb"))
-
-# Step 5: Train Ovarian Cyst Models
-logger.info("Training Ovarian Cyst models...")
-ovarian_data = pd.read_csv(os.path.join(data_dir, "ovarian_cleaned.csv"))
-features = [
-    "Age", "Menopause Status", "Cyst Size cm", "Cyst Growth Rate cm/month", "CA 125 Level",
-    "Pelvic Pain", "Bloating", "Nausea", "Fatigue", "Irregular Periods"
-]
-target_management = "Recommended Management"
-target_ultrasound = "Ultrasound Features"
-
-X_management = ovarian_data[features]
-y_management = ovarian_data[target_management]
-
-min_samples_management = min(y_management.value_counts()) if not y_management.empty else 2
-cv_folds_management = min(5, max(2, min_samples_management))
-if min_samples_management >= 2:
-    smote_management = SMOTE(random_state=42, k_neighbors=min(5, min_samples_management-1))
-    try:
-        X_management_resampled, y_management_resampled = smote_management.fit_resample(X_management, y_management)
-    except ValueError as e:
-        logger.error(f"SMOTE failed for management: {e}. Falling back to original data.")
-        X_management_resampled, y_management_resampled = X_management, y_management
-else:
-    logger.warning("Not enough samples for SMOTE in management data. Using original data.")
-    X_management_resampled, y_management_resampled = X_management, y_management
-    cv_folds_management = 2
-
-management_model = RandomForestClassifier(random_state=42)
-grid_search_management = GridSearchCV(management_model, param_grid, cv=cv_folds_management, scoring="accuracy", n_jobs=-1)
-grid_search_management.fit(X_management_resampled, y_management_resampled)
-management_model = grid_search_management.best_estimator_
-logger.info(f"Management Model Best parameters: {grid_search_management.best_params_}")
-
-if cv_folds_management >= 2:
-    cv_scores_management = cross_val_score(management_model, X_management_resampled, y_management_resampled, cv=cv_folds_management, scoring="accuracy")
-    logger.info(f"Management Model Cross-Validation Accuracy: {cv_scores_management.mean() * 100:.2f}% ± {cv_scores_management.std() * 100:.2f}%")
-else:
-    logger.info("Cross-validation skipped for management model due to insufficient samples.")
-
-management_model.fit(X_management_resampled, y_management_resampled)
-predictions_management = management_model.predict(X_management)
-logger.info("Management Model Classification Report:")
-logger.info(classification_report(y_management, predictions_management, target_names=le_management.classes_, zero_division=0))
-pickle.dump(management_model, open(os.path.join(data_dir, "management_model.pkl"), "wb"))
-
-X_ultrasound = ovarian_data[features]
-y_ultrasound = ovarian_data[target_ultrasound]
-
-min_samples_ultrasound = min(y_ultrasound.value_counts()) if not y_ultrasound.empty else 2
-cv_folds_ultrasound = min(5, max(2, min_samples_ultrasound))
-if min_samples_ultrasound >= 2:
-    smote_ultrasound = SMOTE(random_state=42, k_neighbors=min(5, min_samples_ultrasound-1))
-    try:
-        X_ultrasound_resampled, y_ultrasound_resampled = smote_ultrasound.fit_resample(X_ultrasound, y_ultrasound)
-    except ValueError as e:
-        logger.error(f"SMOTE failed for ultrasound: {e}. Falling back to original data.")
-        X_ultrasound_resampled, y_ultrasound_resampled = X_ultrasound, y_ultrasound
-else:
-    logger.warning("Not enough samples for SMOTE in ultrasound data. Using original data.")
-    X_ultrasound_resampled, y_ultrasound_resampled = X_ultrasound, y_ultrasound
-    cv_folds_ultrasound = 2
-
-ultrasound_model = RandomForestClassifier(random_state=42)
-grid_search_ultrasound = GridSearchCV(ultrasound_model, param_grid, cv=cv_folds_ultrasound, scoring="accuracy", n_jobs=-1)
-grid_search_ultrasound.fit(X_ultrasound_resampled, y_ultrasound_resampled)
-ultrasound_model = grid_search_ultrasound.best_estimator_
-logger.info(f"Ultrasound Model Best parameters: {grid_search_ultrasound.best_params_}")
-
-if cv_folds_ultrasound >= 2:
-    cv_scores_ultrasound = cross_val_score(ultrasound_model, X_ultrasound_resampled, y_ultrasound_resampled, cv=cv_folds_ultrasound, scoring="accuracy")
-    logger.info(f"Ultrasound Model Cross-Validation Accuracy: {cv_scores_ultrasound.mean() * 100:.2f}% ± {cv_scores_ultrasound.std() * 100:.2f}%")
-else:
-    logger.info("Cross-validation skipped for ultrasound model due to insufficient samples.")
-
-ultrasound_model.fit(X_ultrasound_resampled, y_ultrasound_resampled)
-predictions_ultrasound = ultrasound_model.predict(X_ultrasound)
-logger.info("Ultrasound Model Classification Report:")
-logger.info(classification_report(y_ultrasound, predictions_ultrasound, target_names=le_ultrasound.classes_, zero_division=0))
-pickle.dump(ultrasound_model, open(os.path.join(data_dir, "ultrasound_model.pkl"), "wb"))
-
-# Load models and encoders
-try:
-    cervical_model = pickle.load(open(os.path.join(data_dir, "cervical_model.pkl"), "rb"))
-    insurance_model = pickle.load(open(os.path.join(data_dir, "insurance_model.pkl"), "rb"))
-    management_model = pickle.load(open(os.path.join(data_dir, "management_model.pkl"), "rb"))
-    ultrasound_model = pickle.load(open(os.path.join(data_dir, "ultrasound_model.pkl"), "rb"))
-    encoders = {
-        "le_hpv": pickle.load(open(os.path.join(data_dir, "le_hpv.pkl"), "rb")),
-        "le_pap": pickle.load(open(os.path.join(data_dir, "le_pap.pkl"), "rb")),
-        "le_smoking": pickle.load(open(os.path.join(data_dir, "le_smoking.pkl"), "rb")),
-        "le_std": pickle.load(open(os.path.join(data_dir, "le_std.pkl"), "rb")),
-        "le_insurance": pickle.load(open(os.path.join(data_dir, "le_insurance.pkl"), "rb")),
-        "le_screening": pickle.load(open(os.path.join(data_dir, "le_screening.pkl"), "rb")),
-        "le_action": pickle.load(open(os.path.join(data_dir, "le_action.pkl"), "rb")),
-        "le_menopause": pickle.load(open(os.path.join(data_dir, "le_menopause.pkl"), "rb")),
-        "le_ultrasound": pickle.load(open(os.path.join(data_dir, "le_ultrasound.pkl"), "rb")),
-        "le_management": pickle.load(open(os.path.join(data_dir, "le_management.pkl"), "rb"))
-    }
-    logger.info("Models and encoders loaded successfully.")
-except Exception as e:
-    logger.error(f"Error loading models or encoders: {e}")
-    raise
-
-# Helper functions for input normalization
-def normalize_hpv_result(value):
-    value = str(value).strip().lower()
-    if value in ['negative', 'neg', 'negagtive', 'negativee', 'n', 'no', '-']:
-        return 'Negative'
-    elif value in ['positive', 'pos', 'possitive', 'p', 'yes', '+']:
-        return 'Positive'
-    elif value.title() in ['Negative', 'Positive']:
-        return value.title()
-    else:
-        raise ValueError(f"Invalid HPV result: {value}")
-
-def normalize_pap_result(value):
-    value = str(value).strip().lower()
-    if value in ['negative', 'neg', 'negagtive', 'negativee', 'n', 'no', 'normal']:
-        return 'Negative'
-    elif value in ['positive', 'pos', 'possitive', 'p', 'yes', 'abnormal', 'y']:
-        return 'Positive'
-    elif value.title() in ['Negative', 'Positive']:
-        return value.title()
-    else:
-        raise ValueError(f"Invalid Pap smear result: {value}")
-
-def normalize_yes_no(value):
-    value = str(value).strip().lower()
-    if value in ['no', 'n', 'false', '0', 'negative', 'neg']:
-        return 'No'
-    elif value in ['yes', 'y', 'true', '1', 'positive', 'pos']:
-        return 'Yes'
-    elif value.title() in ['Yes', 'No']:
-        return value.title()
-    else:
-        raise ValueError(f"Invalid Yes/No value: {value}")
-
-def normalize_screening_type(value):
-    value = str(value).strip().upper()
-    if value in ['PAP SMEAR', 'PAP', 'PAPSMEAR', 'PAP_SMEAR', 'PAPS']:
-        return 'PAP SMEAR'
-    elif value in ['HPV DNA', 'HPV', 'HPVDNA', 'HPV_DNA', 'DNA']:
-        return 'HPV DNA'
-    elif value in ['VIA', 'VISUAL INSPECTION', 'VISUAL']:
-        return 'VIA'
-    elif value in ['PAP SMEAR', 'HPV DNA', 'VIA']:
-        return value
-    else:
-        raise ValueError(f"Invalid screening type: {value}")
-
 # Token verification decorator
 def token_required(f):
     @wraps(f)
@@ -523,13 +227,20 @@ def token_required(f):
         try:
             data = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
             user_uid = data['user_uid']
-            token_doc = db.collection("users").document(user_uid).collection("tokens").document(token).get()
-            if not token_doc.exists or token_doc.to_dict().get('expires_at') < datetime.now(pytz.UTC):
-                return jsonify({'status': 'error', 'message': 'Token is invalid or expired'}), 401
+            if TOKEN_VERIFICATION_MODE == "stateless":
+                if revocation_list.is_revoked(token):
+                    return jsonify({'status': 'error', 'message': 'Token has been revoked'}), 401
+            else:
+                token_doc = db.collection("users").document(user_uid).collection("tokens").document(token).get()
+                if not token_doc.exists or token_doc.to_dict().get('expires_at') < datetime.now(pytz.UTC):
+                    return jsonify({'status': 'error', 'message': 'Token is invalid or expired'}), 401
         except jwt.ExpiredSignatureError:
             return jsonify({'status': 'error', 'message': 'Token has expired'}), 401
         except jwt.InvalidTokenError:
             return jsonify({'status': 'error', 'message': 'Invalid token'}), 401
+        except RevocationListUnavailable as e:
+            logger.error(f"Token verification unavailable: {e}")
+            return jsonify({'status': 'error', 'message': 'Token verification is temporarily unavailable'}), 503
 
         return f(user_uid, *args, **kwargs)
     return decorated
@@ -606,7 +317,7 @@ def validate_recommendation_guidelines(user_uid, patient_data, predicted_recomme
                 "is_compliant": True
             }
 
-        db.collection("patient_history").document(user_uid).collection("validations").add({
+        record_write(db.collection("patient_history").document(user_uid).collection("validations"), {
             "timestamp": firestore.SERVER_TIMESTAMP,
             "patient_data": patient_data,
             "predicted_recommendation": predicted_recommendation,
@@ -618,86 +329,65 @@ def validate_recommendation_guidelines(user_uid, patient_data, predicted_recomme
         return {"error": str(e), "is_compliant": False}
 
 # Risk Comparison Engine
-def calculate_percentile_risk(user_uid, patient_data, condition_type):
+def cervical_feature_row(input_data):
+    """Encoded model features, in cervical_features order, for one prepared cervical input."""
+    row = {
+        "Age": input_data["age"],
+        "Sexual Partners": input_data["sexual_partners"],
+        "First Sexual Activity Age": input_data["first_sexual_activity_age"],
+        "HPV Test Result": encoders["le_hpv"].transform([input_data["hpv_result"]])[0],
+        "Pap Smear Result": encoders["le_pap"].transform([input_data["pap_smear_result"]])[0],
+        "Smoking Status": encoders["le_smoking"].transform([input_data["smoking_status"]])[0],
+        "STDs History": encoders["le_std"].transform([input_data["stds_history"]])[0],
+        "Screening Type Last": encoders["le_screening"].transform([input_data["screening_type_last"]])[0]
+    }
+    return np.array([[row[feature] for feature in cervical_features]], dtype=float)
+
+def ovarian_feature_row(input_data):
+    """Encoded model features, in ovarian_features order, for one prepared ovarian input."""
+    reported = [x.lower() for x in input_data.get("symptoms", [])]
+    row = {
+        "Age": input_data["age"],
+        "Menopause Status": encoders["le_menopause"].transform([input_data["menopause_status"]])[0],
+        "Cyst Size cm": input_data["cyst_size"],
+        "Cyst Growth Rate cm/month": input_data["cyst_growth_rate"],
+        "CA 125 Level": input_data["ca125_level"],
+        **{s: 1 if s.lower() in reported else 0 for s in symptoms}
+    }
+    return np.array([[row[feature] for feature in ovarian_features]], dtype=float)
+
+def calculate_model_percentile_risk(user_uid, patient_data, condition_type, risk_score=None):
+    """
+    Place a patient in the reference cohort. risk_score is the max-class
+    probability (0-100) from the condition's risk head; when the caller already
+    has it from a fused prediction the model is not run again.
+    """
     try:
-        risk_scores = []
-        if condition_type == "cervical":
-            for _, record in cervical_data.iterrows():
-                patient_df = pd.DataFrame([{
-                    "Age": record["Age"],
-                    "Sexual Partners": record["Sexual Partners"],
-                    "First Sexual Activity Age": record["First Sexual Activity Age"],
-                    "HPV Test Result": record["HPV Test Result"],
-                    "Pap Smear Result": record["Pap Smear Result"],
-                    "Smoking Status": record["Smoking Status"],
-                    "STDs History": record["STDs History"],
-                    "Screening Type Last": record["Screening Type Last"]
-                }])
-                probs = cervical_model.predict_proba(patient_df)[0]
-                risk_score = max(probs) * 100
-                risk_scores.append(risk_score)
-            patient_df = pd.DataFrame([{
-                "Age": patient_data["age"],
-                "Sexual Partners": patient_data["sexual_partners"],
-                "First Sexual Activity Age": patient_data["first_sexual_activity_age"],
-                "HPV Test Result": encoders["le_hpv"].transform([normalize_hpv_result(patient_data["hpv_result"])])[0],
-                "Pap Smear Result": encoders["le_pap"].transform([normalize_pap_result(patient_data["pap_smear_result"])])[0],
-                "Smoking Status": encoders["le_smoking"].transform([normalize_yes_no(patient_data["smoking_status"])])[0],
-                "STDs History": encoders["le_std"].transform([normalize_yes_no(patient_data["stds_history"])])[0],
-                "Screening Type Last": encoders["le_screening"].transform([normalize_screening_type(patient_data["screening_type_last"])])[0]
-            }])
-            patient_probs = cervical_model.predict_proba(patient_df)[0]
-            patient_risk = max(patient_probs) * 100
-        else:  # ovarian
-            for _, record in ovarian_data.iterrows():
-                patient_df = pd.DataFrame([{
-                    "Age": record["Age"],
-                    "Menopause Status": record["Menopause Status"],
-                    "Cyst Size cm": record["Cyst Size cm"],
-                    "Cyst Growth Rate cm/month": record["Cyst Growth Rate cm/month"],
-                    "CA 125 Level": record["CA 125 Level"],
-                    "Pelvic Pain": record["Pelvic Pain"],
-                    "Bloating": record["Bloating"],
-                    "Nausea": record["Nausea"],
-                    "Fatigue": record["Fatigue"],
-                    "Irregular Periods": record["Irregular Periods"]
-                }])
-                probs = management_model.predict_proba(patient_df)[0]
-                risk_score = max(probs) * 100
-                risk_scores.append(risk_score)
-            symptom_values = [1 if s.lower() in [x.lower() for x in patient_data.get("symptoms", [])] else 0 for s in symptoms]
-            patient_df = pd.DataFrame([{
-                "Age": patient_data["age"],
-                "Menopause Status": encoders["le_menopause"].transform([patient_data["menopause_status"]])[0],
-                "Cyst Size cm": patient_data["cyst_size"],
-                "Cyst Growth Rate cm/month": patient_data.get("cyst_growth_rate", ovarian_data["Cyst Growth Rate cm/month"].median()),
-                "CA 125 Level": patient_data["ca125_level"],
-                "Pelvic Pain": symptom_values[0],
-                "Bloating": symptom_values[1],
-                "Nausea": symptom_values[2],
-                "Fatigue": symptom_values[3],
-                "Irregular Periods": symptom_values[4]
-            }])
-            patient_probs = management_model.predict_proba(patient_df)[0]
-            patient_risk = max(patient_probs) * 100
-
-        percentile = (sum(r < patient_risk for r in risk_scores) / len(risk_scores)) * 100
-        risk_category = "Top 10%" if percentile >= 90 else "Top 25%" if percentile >= 75 else "Top 50%" if percentile >= 50 else "Bottom 50%"
+        if risk_score is None:
+            if condition_type == "cervical":
+                proba = cervical_predictor.predict(cervical_feature_row(patient_data))["action"].proba
+            else:  # ovarian
+                proba = ovarian_predictor.predict(ovarian_feature_row(patient_data))["management"].proba
+            risk_score = proba[0].max() * 100
+
+        cohort = cohort_indexes[condition_type]
+        patient_risk = float(risk_score)
+        percentile = cohort.percentile(patient_risk)
         
         result = {
             "risk_score": patient_risk,
             "percentile": percentile,
-            "risk_category": risk_category
+            "risk_category": risk_category(percentile)
         }
         
-        db.collection("patient_history").document(user_uid).collection("risk_comparisons").add({
+        audit_writer.submit(f"patient_history/{user_uid}/risk_comparisons", {
             "timestamp": firestore.SERVER_TIMESTAMP,
             "condition_type": condition_type,
             "risk_result": result
         })
         return result
     except Exception as e:
-        logger.error(f"Error in calculate_percentile_risk: {e}")
+        logger.error(f"Error in calculate_model_percentile_risk: {e}")
         return {"error": str(e)}
 
 # Myth-Busting & Education Content
@@ -722,7 +412,7 @@ def get_education_content(user_uid, patient_data, recommendation):
             content["what_this_means"] = "Abnormal results require further testing to assess potential risks."
             content["why_it_matters"] = "Colposcopy helps identify precancerous changes for timely intervention."
         
-        db.collection("patient_history").document(user_uid).collection("education").add({
+        audit_writer.submit(f"patient_history/{user_uid}/education", {
             "timestamp": firestore.SERVER_TIMESTAMP,
             "patient_data": patient_data,
             "recommendation": recommendation,
@@ -733,23 +423,33 @@ def get_education_content(user_uid, patient_data, recommendation):
         logger.error(f"Error in get_education_content: {e}")
         return {"error": str(e)}
 
-def generate_pdf_report(user_uid, patient_data, recommendation, filename="report.pdf"):
-    try:
-        c = canvas.Canvas(os.path.join(data_dir, filename), pagesize=letter)
-        c.drawString(100, 750, "Health Screening Report")
-        c.drawString(100, 730, f"Patient UID: {user_uid}")
-        c.drawString(100, 710, f"Date: {datetime.now().strftime('%Y-%m-%d')}")
-        c.drawString(100, 690, "Patient Data:")
-        y = 670
-        for key, value in patient_data.items():
-            c.drawString(120, y, f"{key}: {value}")
-            y -= 20
-        c.drawString(100, y-20, f"Recommendation: {recommendation}")
-        c.save()
-        return filename
-    except Exception as e:
-        logger.error(f"Error in generate_pdf_report: {e}")
-        return None
+def generate_pdf_report(path, user_uid, patient_data, recommendation, report_date):
+    c = canvas.Canvas(path, pagesize=letter)
+    c.drawString(100, 750, "Health Screening Report")
+    c.drawString(100, 730, f"Patient UID: {user_uid}")
+    c.drawString(100, 710, f"Date: {report_date}")
+    c.drawString(100, 690, "Patient Data:")
+    y = 670
+    for key, value in patient_data.items():
+        c.drawString(120, y, f"{key}: {value}")
+        y -= 20
+    c.drawString(100, y-20, f"Recommendation: {recommendation}")
+    c.save()
+
+# PDF reports are rendered off the request path into a content-addressed store
+report_jobs = ReportJobs(ReportStore(os.environ.get("REPORT_STORE_DIR", os.path.join(data_dir, "reports"))),
+                         generate_pdf_report,
+                         workers=int(os.environ.get("REPORT_WORKERS", 2)),
+                         max_pending=int(os.environ.get("REPORT_MAX_PENDING", 100)))
+
+def report_job_response(job):
+    response = {'status': 'success', 'job_id': job['job_id'], 'job_status': job['status'],
+                'status_url': f"/reports/{job['job_id']}"}
+    if job['status'] == 'done':
+        response['pdf_url'] = f"/reports/{job['job_id']}/pdf"
+    if job['status'] == 'failed':
+        response['error'] = job['error']
+    return response
 
 def get_specialist_contacts(region):
     try:
@@ -774,49 +474,6 @@ def aggregate_anonymized_data():
         logger.error(f"Error in aggregate_anonymized_data: {e}")
         return {"error": str(e)}
 
-# Reminder Service
-def send_sms_reminder(phone, message):
-    try:
-        url = "https://api.africastalking.com/version1/messaging"
-        headers = {
-            "ApiKey": AFRICAS_TALKING_API_KEY,
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-        data = {
-            "username": AFRICAS_TALKING_USERNAME,
-            "to": phone,
-            "message": message
-        }
-        response = requests.post(url, headers=headers, data=data)
-        return response.status_code == 201
-    except Exception as e:
-        logger.error(f"Error in send_sms_reminder: {e}")
-        return False
-
-def schedule_reminders():
-    try:
-        follow_ups = db.collection_group("follow_ups").where("follow_up_date", "<=", datetime.now() + timedelta(days=1)).get()
-        for follow_up in follow_ups:
-            data = follow_up.to_dict()
-            user_uid = follow_up.reference.parent.parent.id
-            user = db.collection("users").document(user_uid).get()
-            if user.exists and user.to_dict().get("phone"):
-                message = f"Reminder: Your follow-up appointment is scheduled for {data['follow_up_date'].strftime('%Y-%m-%d')}. Action: {data['action']}"
-                if send_sms_reminder(user.to_dict()["phone"], message):
-                    db.collection("patient_history").document(user_uid).collection("reminders").add({
-                        "timestamp": firestore.SERVER_TIMESTAMP,
-                        "message": message,
-                        "status": "sent"
-                    })
-    except Exception as e:
-        logger.error(f"Error in schedule_reminders: {e}")
-
-def run_scheduler():
-    schedule.every().day.at("08:00").do(schedule_reminders)
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
-
 # Doctor Features
 def generate_clinical_alerts(user_uid, patient_data, condition_type):
     try:
@@ -838,7 +495,7 @@ def generate_clinical_alerts(user_uid, patient_data, condition_type):
                     "timeline": "Within 1 week"
                 })
         
-        db.collection("patient_history").document(user_uid).collection("alerts").add({
+        record_write(db.collection("patient_history").document(user_uid).collection("alerts"), {
             "timestamp": firestore.SERVER_TIMESTAMP,
             "condition_type": condition_type,
             "alerts": alerts
@@ -869,7 +526,7 @@ def plan_resources(user_uid, recommendation, condition_type):
         }
         needed = resources.get(condition_type, {}).get(recommendation, ["General Equipment"])
         
-        db.collection("patient_history").document(user_uid).collection("resources").add({
+        record_write(db.collection("patient_history").document(user_uid).collection("resources"), {
             "timestamp": firestore.SERVER_TIMESTAMP,
             "condition_type": condition_type,
             "recommendation": recommendation,
@@ -882,14 +539,13 @@ def plan_resources(user_uid, recommendation, condition_type):
 
 def track_population_health(region=None):
     try:
+        filters = {"region": region} if region else {}
         insights = {
-            "high_risk_cervical": len(cervical_data[cervical_data["HPV Test Result"] == encoders["le_hpv"].transform(["Positive"])[0]]),
-            "high_risk_ovarian": len(ovarian_data[ovarian_data["CA 125 Level"] > 35])
+            "high_risk_cervical": population_cubes["cervical"].count(hpv="Positive", **filters),
+            "high_risk_ovarian": population_cubes["ovarian"].count(ca125_band=["35-200", ">200"], **filters)
         }
         if region:
             insights["region"] = region
-            insights["high_risk_cervical"] = len(cervical_data[(cervical_data["HPV Test Result"] == encoders["le_hpv"].transform(["Positive"])[0]) & (cervical_data["Region"] == region)])
-            insights["high_risk_ovarian"] = len(ovarian_data[(ovarian_data["CA 125 Level"] > 35) & (ovarian_data["Region"] == region)])
         return insights
     except Exception as e:
         logger.error(f"Error in track_population_health: {e}")
@@ -903,7 +559,7 @@ def generate_automated_care_plan(user_uid, recommendation, patient_data, conditi
             "educational_tip": "Regular screening is key!" if "Repeat" in recommendation or "Observation" in recommendation else "Follow specialist advice."
         }
         
-        db.collection("patient_history").document(user_uid).collection("care_plans").add({
+        record_write(db.collection("patient_history").document(user_uid).collection("care_plans"), {
             "timestamp": firestore.SERVER_TIMESTAMP,
             "condition_type": condition_type,
             "recommendation": recommendation,
@@ -915,8 +571,146 @@ def generate_automated_care_plan(user_uid, recommendation, patient_data, conditi
         return {}
 
 # Longitudinal Tracking
-def generate_patient_history_timeline(user_uid):
+# History pagination: pages are ordered by the server-side write timestamp and
+# continued from the id of the last document returned, so records committed in
+# one batch (identical timestamps) are never skipped
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", 50))
+MAX_HISTORY_PAGE_SIZE = 500
+SKIP_PAGE = object()
+CERVICAL_TIMELINE_FIELDS = [
+    "timestamp", "date", "age", "sexual_partners", "first_sexual_activity_age", "hpv_result", "pap_smear_result",
+    "smoking_status", "stds_history", "screening_type_last", "insurance_covered", "recommended_action", "treatment_response",
+    "risk_score", "risk_model_version"
+]
+OVARIAN_TIMELINE_FIELDS = [
+    "timestamp", "date", "age", "menopause_status", "cyst_size", "cyst_growth_rate", "ca125_level", "symptoms",
+    "ultrasound_features", "recommended_management", "treatment_response", "risk_score", "risk_model_version"
+]
+
+def read_page_args():
+    """
+    limit, order and per-condition cursors (cervical_start_after /
+    ovarian_start_after) from the query string. condition=cervical or
+    condition=ovarian pages through one subcollection only; the other is
+    reported as exhausted.
+    """
+    limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+    if limit < 1 or limit > MAX_HISTORY_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_HISTORY_PAGE_SIZE}")
+    order = request.args.get('order', 'asc').lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+    condition = request.args.get('condition', '').lower()
+    if condition not in ('', 'cervical', 'ovarian'):
+        raise ValueError("condition must be 'cervical' or 'ovarian'")
+    cursors = {name: request.args.get(f'{name}_start_after') for name in ('cervical', 'ovarian')}
+    if condition:
+        cursors[{'cervical': 'ovarian', 'ovarian': 'cervical'}[condition]] = SKIP_PAGE
+    return limit, order == 'desc', cursors
+
+def read_history_page(user_uid, collection_name, limit, start_after=None, fields=None, descending=False):
+    """
+    One page of a user's history subcollection ordered by timestamp. Returns
+    (snapshots, next cursor or None). fields limits the returned fields.
+    """
+    if start_after is SKIP_PAGE:
+        return [], None
+    collection_ref = db.collection("patient_history").document(user_uid).collection(collection_name)
+    query = collection_ref.order_by("timestamp", direction=firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING)
+    if fields:
+        query = query.select(fields)
+    if start_after:
+        cursor = collection_ref.document(start_after).get()
+        if not cursor.exists:
+            raise ValueError(f"Invalid {collection_name}_start_after cursor")
+        query = query.start_after(cursor)
+    records = query.limit(limit + 1).get()
+    if len(records) > limit:
+        return records[:limit], records[limit - 1].id
+    return records, None
+
+def scored_history_page(user_uid, collection_name, limit, start_after, fields, descending):
+    """read_history_page plus the risk score of every record on the page."""
+    records, next_cursor = read_history_page(user_uid, collection_name, limit, start_after, fields, descending)
+    return records, next_cursor, history_risk_scores(collection_name, records)
+
+def history_date(data):
+    date = data.get("date")
+    if not date:
+        return datetime.now().strftime("%Y-%m-%d")
+    return date.strftime("%Y-%m-%d") if hasattr(date, "strftime") else str(date)
+
+def history_feature_row(condition_type, data):
+    """Model feature row for a stored history record (older records may hold unnormalized labels)."""
+    if condition_type == "cervical":
+        return cervical_feature_row(dict(
+            data,
+            hpv_result=normalize_hpv_result(data["hpv_result"]),
+            pap_smear_result=normalize_pap_result(data["pap_smear_result"]),
+            smoking_status=normalize_yes_no(data["smoking_status"], strict=True),
+            stds_history=normalize_yes_no(data["stds_history"], strict=True),
+            screening_type_last=normalize_screening_type(data["screening_type_last"])
+        ))
+    return ovarian_feature_row(dict(
+        data,
+        cyst_growth_rate=data.get("cyst_growth_rate", ovarian_data["Cyst Growth Rate cm/month"].median())
+    ))
+
+def history_risk_scores(condition_type, records):
+    """
+    Risk score for every history snapshot. Scores stored on the document by the
+    current model version are reused; the rest are computed in one batched
+    prediction and written back to their documents.
+    """
+    scores = [None] * len(records)
+    stale, rows = [], []
+    for i, record in enumerate(records):
+        data = record.to_dict()
+        if data.get("risk_model_version") == model_version and data.get("risk_score") is not None:
+            scores[i] = data["risk_score"]
+            continue
+        try:
+            rows.append(history_feature_row(condition_type, data))
+            stale.append(i)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Cannot score {condition_type} history record {record.id}: {e}")
+    if stale:
+        if condition_type == "cervical":
+            proba = cervical_predictor.predict(np.vstack(rows))["action"].proba
+        else:
+            proba = ovarian_predictor.predict(np.vstack(rows))["management"].proba
+        computed = proba.max(axis=1) * 100
+        for i, risk_score in zip(stale, computed):
+            scores[i] = float(risk_score)
+        try:
+            for start in range(0, len(stale), FIRESTORE_BATCH_LIMIT):
+                batch = db.batch()
+                for i in stale[start:start + FIRESTORE_BATCH_LIMIT]:
+                    batch.update(records[i].reference, {"risk_score": scores[i], "risk_model_version": model_version})
+                batch.commit()
+        except Exception as e:
+            logger.error(f"Error storing recomputed {condition_type} risk scores: {e}")
+    return scores
+
+# Per-process cache of rendered timeline pages: user_uid -> {page key: history}.
+# Dropped when this process writes a new submission for the user; the TTL
+# bounds how long a page can miss a submission made through another process.
+history_timeline_cache = TTLCache(maxsize=int(os.environ.get("HISTORY_CACHE_SIZE", 2000)),
+                                  ttl=float(os.environ.get("HISTORY_CACHE_TTL", 60)))
+
+def cached_patient_history_timeline(user_uid, limit=HISTORY_PAGE_SIZE, cursors=None, descending=False):
+    page_key = (limit, tuple(sorted((cursors or {}).items(), key=lambda item: item[0])), descending)
+    pages = history_timeline_cache.get(user_uid) or {}
+    if page_key in pages:
+        return pages[page_key]
+    history = generate_patient_history_timeline(user_uid, limit, cursors, descending)
+    if "error" not in history:
+        history_timeline_cache.set(user_uid, {**pages, page_key: history})
+    return history
+
+def generate_patient_history_timeline(user_uid, limit=HISTORY_PAGE_SIZE, cursors=None, descending=False):
     try:
+        cursors = cursors or {}
         history = {
             "user_uid": user_uid,
             "cervical_timeline": [],
@@ -924,23 +718,14 @@ def generate_patient_history_timeline(user_uid):
             "risk_progression": []
         }
         
-        cervical_records = db.collection("patient_history").document(user_uid).collection("cervical").get()
-        for record in cervical_records:
+        (cervical_records, cervical_next, cervical_scores), (ovarian_records, ovarian_next, ovarian_scores) = fanout.gather(
+            lambda: scored_history_page(user_uid, "cervical", limit, cursors.get("cervical"), CERVICAL_TIMELINE_FIELDS, descending),
+            lambda: scored_history_page(user_uid, "ovarian", limit, cursors.get("ovarian"), OVARIAN_TIMELINE_FIELDS, descending)
+        )
+        for record, risk_score in zip(cervical_records, cervical_scores):
             data = record.to_dict()
-            patient_df = pd.DataFrame([{
-                "Age": data["age"],
-                "Sexual Partners": data["sexual_partners"],
-                "First Sexual Activity Age": data["first_sexual_activity_age"],
-                "HPV Test Result": encoders["le_hpv"].transform([normalize_hpv_result(data["hpv_result"])])[0],
-                "Pap Smear Result": encoders["le_pap"].transform([normalize_pap_result(data["pap_smear_result"])])[0],
-                "Smoking Status": encoders["le_smoking"].transform([normalize_yes_no(data["smoking_status"])])[0],
-                "STDs History": encoders["le_std"].transform([normalize_yes_no(data["stds_history"])])[0],
-                "Screening Type Last": encoders["le_screening"].transform([normalize_screening_type(data["screening_type_last"])])[0]
-            }])
-            probs = cervical_model.predict_proba(patient_df)[0]
-            risk_score = max(probs) * 100
             history["cervical_timeline"].append({
-                "date": data["date"].strftime("%Y-%m-%d") if data.get("date") else datetime.now().strftime("%Y-%m-%d"),
+                "date": history_date(data),
                 "hpv_result": data["hpv_result"],
                 "pap_smear_result": data["pap_smear_result"],
                 "insurance_covered": data["insurance_covered"],
@@ -950,31 +735,16 @@ def generate_patient_history_timeline(user_uid):
                 "treatment_response": data.get("treatment_response", "N/A")
             })
             history["risk_progression"].append({
-                "date": data["date"].strftime("%Y-%m-%d") if data.get("date") else datetime.now().strftime("%Y-%m-%d"),
+                "date": history_date(data),
                 "risk_score": risk_score,
-                "condition": "Cervical"
+                "condition": "Cervical",
+                "timestamp": data["timestamp"]
             })
 
-        ovarian_records = db.collection("patient_history").document(user_uid).collection("ovarian").get()
-        for record in ovarian_records:
+        for record, risk_score in zip(ovarian_records, ovarian_scores):
             data = record.to_dict()
-            symptom_values = [1 if s.lower() in [x.lower() for x in data.get("symptoms", [])] else 0 for s in symptoms]
-            patient_df = pd.DataFrame([{
-                "Age": data["age"],
-                "Menopause Status": encoders["le_menopause"].transform([data["menopause_status"]])[0],
-                "Cyst Size cm": data["cyst_size"],
-                "Cyst Growth Rate cm/month": data.get("cyst_growth_rate", ovarian_data["Cyst Growth Rate cm/month"].median()),
-                "CA 125 Level": data["ca125_level"],
-                "Pelvic Pain": symptom_values[0],
-                "Bloating": symptom_values[1],
-                "Nausea": symptom_values[2],
-                "Fatigue": symptom_values[3],
-                "Irregular Periods": symptom_values[4]
-            }])
-            probs = management_model.predict_proba(patient_df)[0]
-            risk_score = max(probs) * 100
             history["ovarian_timeline"].append({
-                "date": data["date"].strftime("%Y-%m-%d") if data.get("date") else datetime.now().strftime("%Y-%m-%d"),
+                "date": history_date(data),
                 "ultrasound_features": data["ultrasound_features"],
                 "recommended_management": data["recommended_management"],
                 "symptoms": data["symptoms"],
@@ -982,16 +752,25 @@ def generate_patient_history_timeline(user_uid):
                 "treatment_response": data.get("treatment_response", "N/A")
             })
             history["risk_progression"].append({
-                "date": data["date"].strftime("%Y-%m-%d") if data.get("date") else datetime.now().strftime("%Y-%m-%d"),
+                "date": history_date(data),
                 "risk_score": risk_score,
-                "condition": "Ovarian"
+                "condition": "Ovarian",
+                "timestamp": data["timestamp"]
             })
 
-        history["cervical_timeline"] = sorted(history["cervical_timeline"], key=lambda x: x["date"])
-        history["ovarian_timeline"] = sorted(history["ovarian_timeline"], key=lambda x: x["date"])
-        history["risk_progression"] = sorted(history["risk_progression"], key=lambda x: x["date"])
+        # Both timelines come back in timestamp order; only the combined
+        # progression needs merging
+        history["risk_progression"] = list(heapq.merge(
+            [p for p in history["risk_progression"] if p["condition"] == "Cervical"],
+            [p for p in history["risk_progression"] if p["condition"] == "Ovarian"],
+            key=lambda p: p["timestamp"], reverse=descending))
+        for point in history["risk_progression"]:
+            del point["timestamp"]
+        history["next_cursor"] = {"cervical": cervical_next, "ovarian": ovarian_next}
         
         return history
+    except ValueError:
+        raise
     except Exception as e:
         logger.error(f"Error in generate_patient_history_timeline: {e}")
         return {"error": str(e)}
@@ -1031,7 +810,7 @@ def generate_advanced_education(user_uid, patient_data, recommendation, conditio
             "lifestyle_recommendations": lifestyle_recommendations
         }
         
-        db.collection("patient_history").document(user_uid).collection("advanced_education").add({
+        audit_writer.submit(f"patient_history/{user_uid}/advanced_education", {
             "timestamp": firestore.SERVER_TIMESTAMP,
             "condition_type": condition_type,
             "patient_data": patient_data,
@@ -1110,6 +889,7 @@ def login():
             logger.error(f"Firestore error saving token for user_uid {user_uid}: {str(firestore_err)}")
             return jsonify({'status': 'error', 'message': 'Internal server error during token storage'}), 500
 
+        user_profile_cache.set(user_uid, {field: user_data.get(field) for field in USER_PROFILE_FIELDS})
         logger.info(f"Login successful for user_uid: {user_uid}")
         return jsonify({
             'status': 'success',
@@ -1173,6 +953,7 @@ def register():
         # Save user to Firestore
         user_ref = users_ref.add(user_data)[1]
         user_uid = user_ref.id
+        invalidate_user_profile(user_uid)
 
         logger.info(f'Registered new user with uid: {user_uid}')
         return jsonify({'status': 'success', 'user_uid': user_uid, 'message': 'Account created successfully! Please login.'}), 201
@@ -1180,118 +961,182 @@ def register():
         logger.error(f'Unexpected error in /register: {str(e)}', exc_info=True)
         return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
 
-    
+@app.route('/logout', methods=['POST'])
+@token_required
+def logout(user_uid):
+    try:
+        token = request.headers['Authorization'].split(" ")[1]
+        claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        expires_at = datetime.fromtimestamp(claims['exp'], pytz.UTC)
+        db.collection("users").document(user_uid).collection("tokens").document(token).delete()
+        revocation_list.revoke(token, user_uid, expires_at)
+        logger.info(f"Logout successful for user_uid: {user_uid}")
+        return jsonify({'status': 'success', 'message': 'Logged out'})
+    except Exception as e:
+        logger.error(f"Error in /logout for user_uid {user_uid}: {e}")
+        return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
+
+@app.route('/profile', methods=['PUT'])
+@token_required
+def update_profile(user_uid):
+    try:
+        data = request.json or {}
+        updates = {field: data[field] for field in ('region', 'phone', 'fullName', 'username') if data.get(field)}
+        if not updates:
+            return jsonify({'status': 'error', 'message': 'No updatable fields provided'}), 400
+        db.collection("users").document(user_uid).update(updates)
+        invalidate_user_profile(user_uid)
+        logger.info(f'Updated profile fields {list(updates)} for user {user_uid}')
+        return jsonify({'status': 'success', 'updated': list(updates)})
+    except Exception as e:
+        logger.error(f'Error in /profile for user {user_uid}: {e}')
+        return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
+
+@app.route('/cache_stats', methods=['GET'])
+@token_required
+def cache_stats(user_uid):
+    return jsonify({
+        'user_profiles': user_profile_cache.stats(),
+        'history_timelines': history_timeline_cache.stats(),
+        'population_responses': population_response_cache.stats(),
+        'history_sync': dict(history_sync.stats, dataset_version=dataset_version),
+        'fanout': fanout.stats(),
+        'report_jobs': report_jobs.stats(),
+        'token_revocations': dict(revocation_list.stats, mode=TOKEN_VERIFICATION_MODE)
+    })
+    
+@app.route('/inference_stats', methods=['GET'])
+@token_required
+def inference_stats(user_uid):
+    return jsonify({
+        'model_version': model_version,
+        'predictors': {
+            'cervical': {**cervical_predictor.timing(), 'startup_benchmark': predictor_benchmarks['cervical']},
+            'ovarian': {**ovarian_predictor.timing(), 'startup_benchmark': predictor_benchmarks['ovarian']}
+        }
+    })
+
 @app.route('/patient', methods=['GET'])
 @token_required
 def get_patient_data(user_uid):
     try:
-        cervical_records = db.collection("patient_history").document(user_uid).collection("cervical").get()
-        ovarian_records = db.collection("patient_history").document(user_uid).collection("ovarian").get()
-
-        cervical_dict = []
-        if cervical_records:
-            for r in cervical_records:
-                data = r.to_dict()
-                for key, encoder in [
-                    ('hpv_result', encoders['le_hpv']),
-                    ('pap_smear_result', encoders['le_pap']),
-                    ('smoking_status', encoders['le_smoking']),
-                    ('stds_history', encoders['le_std']),
-                    ('insurance_covered', encoders['le_insurance']),
-                    ('screening_type_last', encoders['le_screening']),
-                    ('recommended_action', encoders['le_action'])
-                ]:
-                    if key in data and data[key] is not None:
-                        try:
-                            if isinstance(data[key], str) and data[key] in encoder.classes_:
-                                continue
-                            data[key] = encoder.inverse_transform([int(data[key])])[0]
-                        except (ValueError, IndexError, AttributeError) as e:
-                            logger.error(f"Error decoding {key} for user {user_uid}: {e}")
-                            data[key] = str(data[key])
-                cervical_dict.append(data)
-
-        ovarian_dict = []
-        if ovarian_records:
-            for r in ovarian_records:
-                data = r.to_dict()
-                for key, encoder in [
-                    ('menopause_status', encoders['le_menopause']),
-                    ('ultrasound_features', encoders['le_ultrasound']),
-                    ('recommended_management', encoders['le_management'])
-                ]:
-                    if key in data and data[key] is not None:
-                        try:
-                            if isinstance(data[key], str) and data[key] in encoder.classes_:
-                                continue
-                            data[key] = encoder.inverse_transform([int(data[key])])[0]
-                        except (ValueError, IndexError, AttributeError) as e:
-                            logger.error(f"Error decoding {key} for user {user_uid}: {e}")
-                            data[key] = str(data[key])
-                ovarian_dict.append(data)
-
-        if not cervical_dict and not ovarian_dict:
+        limit, descending, cursors = read_page_args()
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+        if fields and 'timestamp' not in fields:
+            fields.append('timestamp')
+        (cervical_records, cervical_next), (ovarian_records, ovarian_next) = fanout.gather(
+            lambda: read_history_page(user_uid, "cervical", limit, cursors["cervical"], fields, descending),
+            lambda: read_history_page(user_uid, "ovarian", limit, cursors["ovarian"], fields, descending)
+        )
+
+        cervical_dict = [r.to_dict() for r in cervical_records]
+        ovarian_dict = [r.to_dict() for r in ovarian_records]
+        for records, fields in [(cervical_dict, HISTORY_ENCODED_FIELDS["cervical"]),
+                                (ovarian_dict, HISTORY_ENCODED_FIELDS["ovarian"])]:
+            for _, key, value in decode_records(records, fields, codecs):
+                logger.error(f"Error decoding {key} for user {user_uid}: {value!r} is not a known label or code")
+
+        if not cervical_dict and not ovarian_dict and not any(isinstance(c, str) for c in cursors.values()):
             logger.warning(f"No patient data found for user_uid: {user_uid}")
             return jsonify({'cervical': [], 'ovarian': [], 'message': 'No patient history data available'}), 404
 
-        return jsonify({'cervical': cervical_dict, 'ovarian': ovarian_dict})
+        return jsonify({
+            'cervical': cervical_dict,
+            'ovarian': ovarian_dict,
+            'next_cursor': {'cervical': cervical_next, 'ovarian': ovarian_next}
+        })
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         logger.error(f'Error in /patient for user {user_uid}: {e}')
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
-def override_cervical_recommendation(hpv, pap_smear, age):
-    try:
-        if hpv == "Negative" and pap_smear == "Negative":
-            return encoders['le_action'].transform(["Repeat Pap Smear In 3 Years"])[0]
-        elif hpv == "Positive" and pap_smear == "Positive":
-            return encoders['le_action'].transform(["Colposcopy, Biopsy, Cytology"])[0]
-        elif age < 25 and hpv == "Positive":
-            return encoders['le_action'].transform(["Hpv Vaccine And Sexual Education"])[0]
-        return None
-    except ValueError as e:
-        logger.error(f"Error in override_cervical_recommendation: {e}")
-        return None
+# Guideline overrides of the predicted cervical action, in priority order. The
+# conditions work on scalars and on NumPy arrays alike.
+CERVICAL_ACTION_OVERRIDES = [
+    (lambda hpv, pap_smear, age: (hpv == "Negative") & (pap_smear == "Negative"), "Repeat Pap Smear In 3 Years"),
+    (lambda hpv, pap_smear, age: (hpv == "Positive") & (pap_smear == "Positive"), "Colposcopy, Biopsy, Cytology"),
+    (lambda hpv, pap_smear, age: (age < 25) & (hpv == "Positive"), "Hpv Vaccine And Sexual Education")
+]
+
+def override_cervical_actions(actions, hpv, pap_smear, ages):
+    """Encoded predicted actions with the first matching guideline override applied to each row."""
+    actions = np.array(actions, copy=True)
+    matched = np.zeros(len(actions), dtype=bool)
+    for condition, label in CERVICAL_ACTION_OVERRIDES:
+        hit = np.asarray(condition(np.asarray(hpv), np.asarray(pap_smear), np.asarray(ages))) & ~matched
+        matched |= hit
+        if hit.any() and label in codecs['le_action'].codes:
+            actions[hit] = codecs['le_action'].codes[label]
+    return actions
+
+def prepare_cervical_input(data, region):
+    """Validate and normalize one cervical recommendation payload."""
+    required_fields = {
+        'age': int,
+        'sexual_partners': int,
+        'first_sexual_activity_age': int,
+        'hpv_result': str,
+        'pap_smear_result': str,
+        'smoking_status': str,
+        'stds_history': str,
+        'screening_type_last': str
+    }
+    for field, type_cast in required_fields.items():
+        if field not in data:
+            raise ValueError(f"Missing required field: {field}")
+        try:
+            data[field] = type_cast(data[field])
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid type for {field}: {data[field]}")
+
+    input_data = {
+        'age': data['age'],
+        'sexual_partners': data['sexual_partners'],
+        'first_sexual_activity_age': data['first_sexual_activity_age'],
+        'hpv_result': normalize_hpv_result(data['hpv_result']),
+        'pap_smear_result': normalize_pap_result(data['pap_smear_result']),
+        'smoking_status': normalize_yes_no(data['smoking_status'], strict=True),
+        'stds_history': normalize_yes_no(data['stds_history'], strict=True),
+        'screening_type_last': normalize_screening_type(data['screening_type_last']),
+        'region': region,
+        'date': data.get('date', datetime.now().strftime("%Y-%m-%d")),
+        'treatment_response': data.get('treatment_response', 'N/A')
+    }
+    return input_data
+
+def prepare_ovarian_input(data, region):
+    """Validate and normalize one ovarian recommendation payload."""
+    reported_symptoms = data.get('symptoms', [])
+    if not isinstance(reported_symptoms, list) or not all(isinstance(s, str) for s in reported_symptoms):
+        raise ValueError("symptoms must be a list of strings")
+    input_data = {
+        'age': int(data['age']),
+        'menopause_status': data['menopause_status'].title(),
+        'cyst_size': float(data['cyst_size']),
+        'cyst_growth_rate': float(data.get('cyst_growth_rate', ovarian_data['Cyst Growth Rate cm/month'].median())),
+        'ca125_level': float(data['ca125_level']),
+        'symptoms': reported_symptoms,
+        'region': region,
+        'ultrasound_features': data.get('ultrasound_features', '').title().strip(),
+        'date': data.get('date', datetime.now().strftime("%Y-%m-%d")),
+        'treatment_response': data.get('treatment_response', 'N/A')
+    }
+
+    if input_data['menopause_status'] not in encoders['le_menopause'].classes_:
+        input_data['menopause_status'] = 'Pre-Menopausal' if input_data['age'] < 40 else 'Post-Menopausal'
+    return input_data
 
 @app.route('/cervical_recommendation', methods=['POST'])
 @token_required
+@buffered_writes(db)
 def cervical_recommendation(user_uid):
     try:
         data = request.json
         view = request.args.get('view', 'patient')
-        # Validate and use the user's region from Firebase
-        region = validate_region(user_uid)
-        # Check for required fields with defaults
-        required_fields = {
-            'age': int,
-            'sexual_partners': int,
-            'first_sexual_activity_age': int,
-            'hpv_result': str,
-            'pap_smear_result': str,
-            'smoking_status': str,
-            'stds_history': str,
-            'screening_type_last': str
-        }
-        for field, type_cast in required_fields.items():
-            if field not in data:
-                raise ValueError(f"Missing required field: {field}")
-            try:
-                data[field] = type_cast(data[field])
-            except (ValueError, TypeError):
-                raise ValueError(f"Invalid type for {field}: {data[field]}")
-
-        input_data = {
-            'age': data['age'],
-            'sexual_partners': data['sexual_partners'],
-            'first_sexual_activity_age': data['first_sexual_activity_age'],
-            'hpv_result': normalize_hpv_result(data['hpv_result']),
-            'pap_smear_result': normalize_pap_result(data['pap_smear_result']),
-            'smoking_status': normalize_yes_no(data['smoking_status']),
-            'stds_history': normalize_yes_no(data['stds_history']),
-            'screening_type_last': normalize_screening_type(data['screening_type_last']),
-            'region': region,
-            'date': data.get('date', datetime.now().strftime("%Y-%m-%d")),
-            'treatment_response': data.get('treatment_response', 'N/A')
-        }
+        # The user's region (Firebase) is looked up while the payload is validated and scored
+        region_lookup = fanout.submit(validate_region, user_uid)
+        input_data = prepare_cervical_input(data, None)
 
         for field, encoder in [
             ('hpv_result', encoders['le_hpv']),
@@ -1306,35 +1151,29 @@ def cervical_recommendation(user_uid):
                     'message': f"Invalid {field}: {input_data[field]}. Must be one of {list(encoder.classes_)}"
                 }), 400
 
-        patient_data = pd.DataFrame([{
-            'Age': input_data['age'],
-            'Sexual Partners': input_data['sexual_partners'],
-            'First Sexual Activity Age': input_data['first_sexual_activity_age'],
-            'HPV Test Result': encoders['le_hpv'].transform([input_data['hpv_result']])[0],
-            'Pap Smear Result': encoders['le_pap'].transform([input_data['pap_smear_result']])[0],
-            'Smoking Status': encoders['le_smoking'].transform([input_data['smoking_status']])[0],
-            'STDs History': encoders['le_std'].transform([input_data['stds_history']])[0],
-            'Screening Type Last': encoders['le_screening'].transform([input_data['screening_type_last']])[0]
-        }])
-
-        override = override_cervical_recommendation(input_data['hpv_result'], input_data['pap_smear_result'], input_data['age'])
-        prediction_action = override if override is not None else cervical_model.predict(patient_data)[0]
+        heads = cervical_predictor.predict(cervical_feature_row(input_data))
+        input_data['region'] = region_lookup.result()
+        prediction_action = override_cervical_actions(heads["action"].labels[:1], [input_data['hpv_result']],
+                                                      [input_data['pap_smear_result']], [input_data['age']])[0]
         recommended_action = encoders['le_action'].inverse_transform([prediction_action])[0]
-        insurance_prediction = insurance_model.predict(patient_data)[0]
-        insurance_covered = encoders['le_insurance'].inverse_transform([insurance_prediction])[0]
+        insurance_covered = encoders['le_insurance'].inverse_transform([heads["insurance"].labels[0]])[0]
         validation = validate_recommendation_guidelines(user_uid, input_data, recommended_action)
-        percentile_risk = calculate_percentile_risk(user_uid, input_data, "cervical")
+        risk_score = float(heads["action"].proba[0].max() * 100)
+        percentile_risk = calculate_model_percentile_risk(user_uid, input_data, "cervical", risk_score)
         education_content = get_education_content(user_uid, input_data, recommended_action)
         clinical_alerts = generate_clinical_alerts(user_uid, input_data, "cervical")
         care_plan = generate_automated_care_plan(user_uid, recommended_action, input_data, "cervical")
         advanced_education = generate_advanced_education(user_uid, input_data, recommended_action, "cervical")
 
-        db.collection("patient_history").document(user_uid).collection("cervical").add({
+        record_write(db.collection("patient_history").document(user_uid).collection("cervical"), {
             "timestamp": firestore.SERVER_TIMESTAMP,
             **input_data,
             "recommended_action": recommended_action,
-            "insurance_covered": insurance_covered
+            "insurance_covered": insurance_covered,
+            "risk_score": risk_score,
+            "risk_model_version": model_version
         })
+        after_commit(lambda: history_timeline_cache.invalidate(user_uid))
 
         response = {
             'patient_data' if view.lower() == 'doctor' else 'your_info': input_data,
@@ -1358,28 +1197,14 @@ def cervical_recommendation(user_uid):
     
 @app.route('/ovarian_recommendation', methods=['POST'])
 @token_required
+@buffered_writes(db)
 def ovarian_recommendation(user_uid):
     try:
         data = request.json
         view = request.args.get('view', 'patient')
-        symptom_values = [1 if s.lower() in [x.lower() for x in data.get('symptoms', [])] else 0 for s in symptoms]
-        # Validate and use the user's region from Firebase
-        region = validate_region(user_uid)
-        input_data = {
-            'age': int(data['age']),
-            'menopause_status': data['menopause_status'].title(),
-            'cyst_size': float(data['cyst_size']),
-            'cyst_growth_rate': float(data.get('cyst_growth_rate', ovarian_data['Cyst Growth Rate cm/month'].median())),
-            'ca125_level': float(data['ca125_level']),
-            'symptoms': data.get('symptoms', []),
-            'region': region,
-            'ultrasound_features': data.get('ultrasound_features', '').title().strip(),
-            'date': data.get('date', datetime.now().strftime("%Y-%m-%d")),
-            'treatment_response': data.get('treatment_response', 'N/A')
-        }
-
-        if input_data['menopause_status'] not in encoders['le_menopause'].classes_:
-            input_data['menopause_status'] = 'Pre-Menopausal' if input_data['age'] < 40 else 'Post-Menopausal'
+        # The user's region (Firebase) is looked up while the payload is validated and scored
+        region_lookup = fanout.submit(validate_region, user_uid)
+        input_data = prepare_ovarian_input(data, None)
 
         ultrasound_val = None
         if input_data['ultrasound_features']:
@@ -1391,39 +1216,30 @@ def ovarian_recommendation(user_uid):
                     'message': f"Invalid ultrasound_features: {input_data['ultrasound_features']}. Must be one of {list(encoders['le_ultrasound'].classes_)}"
                 }), 400
 
-        patient_data = pd.DataFrame([{
-            'Age': input_data['age'],
-            'Menopause Status': encoders['le_menopause'].transform([input_data['menopause_status']])[0],
-            'Cyst Size cm': input_data['cyst_size'],
-            'Cyst Growth Rate cm/month': input_data['cyst_growth_rate'],
-            'CA 125 Level': input_data['ca125_level'],
-            'Pelvic Pain': symptom_values[0],
-            'Bloating': symptom_values[1],
-            'Nausea': symptom_values[2],
-            'Fatigue': symptom_values[3],
-            'Irregular Periods': symptom_values[4]
-        }])
-
+        heads = ovarian_predictor.predict(ovarian_feature_row(input_data))
+        input_data['region'] = region_lookup.result()
         if ultrasound_val is None:
-            ultrasound_prediction = ultrasound_model.predict(patient_data)[0]
-            ultrasound_features = encoders['le_ultrasound'].inverse_transform([ultrasound_prediction])[0]
+            ultrasound_features = encoders['le_ultrasound'].inverse_transform([heads["ultrasound"].labels[0]])[0]
         else:
             ultrasound_features = input_data['ultrasound_features']
 
-        management_prediction = management_model.predict(patient_data)[0]
-        recommended_management = encoders['le_management'].inverse_transform([management_prediction])[0]
-        percentile_risk = calculate_percentile_risk(user_uid, input_data, "ovarian")
+        recommended_management = encoders['le_management'].inverse_transform([heads["management"].labels[0]])[0]
+        risk_score = float(heads["management"].proba[0].max() * 100)
+        percentile_risk = calculate_model_percentile_risk(user_uid, input_data, "ovarian", risk_score)
         education_content = get_education_content(user_uid, input_data, recommended_management)
         clinical_alerts = generate_clinical_alerts(user_uid, input_data, "ovarian")
         care_plan = generate_automated_care_plan(user_uid, recommended_management, input_data, "ovarian")
         advanced_education = generate_advanced_education(user_uid, input_data, recommended_management, "ovarian")
 
-        db.collection("patient_history").document(user_uid).collection("ovarian").add({
+        record_write(db.collection("patient_history").document(user_uid).collection("ovarian"), {
             "timestamp": firestore.SERVER_TIMESTAMP,
             **input_data,
             "recommended_management": recommended_management,
-            "ultrasound_features": ultrasound_features
+            "ultrasound_features": ultrasound_features,
+            "risk_score": risk_score,
+            "risk_model_version": model_version
         })
+        after_commit(lambda: history_timeline_cache.invalidate(user_uid))
 
         response = {
             'patient_data' if view.lower() == 'doctor' else 'your_info': input_data,
@@ -1443,12 +1259,237 @@ def ovarian_recommendation(user_uid):
         logger.error(f'Error in /ovarian_recommendation for user {user_uid}: {e}')
         return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
 
+# Batch recommendations
+MAX_BATCH_RECORDS = 5000
+
+def commit_history_batch(user_uid, collection_name, records):
+    """Write history records in WriteBatch commits (see write_buffer.FIRESTORE_BATCH_LIMIT)."""
+    collection_ref = db.collection("patient_history").document(user_uid).collection(collection_name)
+    buffer = WriteBuffer(db)
+    for record in records:
+        buffer.add(collection_ref, {"timestamp": firestore.SERVER_TIMESTAMP, **record})
+    buffer.commit()
+    history_timeline_cache.invalidate(user_uid)
+
+def read_batch_records():
+    data = request.json or {}
+    records = data.get('records')
+    if not isinstance(records, list) or not records:
+        raise ValueError("'records' must be a non-empty list")
+    if len(records) > MAX_BATCH_RECORDS:
+        raise ValueError(f"Too many records: {len(records)} (maximum {MAX_BATCH_RECORDS})")
+    return records
+
+def encode_batch_column(values, encoder_name, field, valid, errors):
+    """Encode a column with the encoder's lookup table, flagging rows with unknown labels as errors."""
+    codes = codecs[encoder_name].encode(values)
+    known = codes >= 0
+    for i in np.flatnonzero(valid & ~known):
+        errors[i] = f"Invalid {field}: {values[i]}. Must be one of {list(encoders[encoder_name].classes_)}"
+    return np.where(known, codes, 0), valid & known
+
+def batch_response(results, errors):
+    items = [results[i] if i in results else {'index': i, 'status': 'error', 'message': errors[i]} for i in sorted({**results, **errors})]
+    return jsonify({
+        'status': 'success',
+        'processed': len(results),
+        'failed': len(errors),
+        'results': items
+    })
+
+@app.route('/cervical_recommendation/batch', methods=['POST'])
+@token_required
+def cervical_recommendation_batch(user_uid):
+    """
+    Score many cervical screening records in one call. Records are normalized
+    individually, then encoded and scored column-wise with a single predict /
+    fused prediction. Invalid records are reported per index.
+    """
+    try:
+        records = read_batch_records()
+        region = validate_region(user_uid)
+
+        inputs, errors = {}, {}
+        for i, record in enumerate(records):
+            try:
+                if not isinstance(record, dict):
+                    raise ValueError("Record must be an object")
+                inputs[i] = prepare_cervical_input(dict(record), region)
+            except (ValueError, TypeError, KeyError) as e:
+                errors[i] = f"Invalid input: {str(e)}"
+
+        results = {}
+        if inputs:
+            indices = np.array(sorted(inputs))
+            rows = [inputs[i] for i in indices]
+            valid = np.ones(len(rows), dtype=bool)
+            row_errors = {}
+            columns = {}
+            for field, column, encoder_name in [
+                ('hpv_result', 'HPV Test Result', 'le_hpv'),
+                ('pap_smear_result', 'Pap Smear Result', 'le_pap'),
+                ('smoking_status', 'Smoking Status', 'le_smoking'),
+                ('stds_history', 'STDs History', 'le_std'),
+                ('screening_type_last', 'Screening Type Last', 'le_screening')
+            ]:
+                columns[column], valid = encode_batch_column([r[field] for r in rows], encoder_name, field, valid, row_errors)
+            for j, message in row_errors.items():
+                errors[int(indices[j])] = message
+
+            if valid.any():
+                keep = np.flatnonzero(valid)
+                rows = [rows[j] for j in keep]
+                indices = indices[keep]
+                patient_frame = pd.DataFrame({
+                    'Age': [r['age'] for r in rows],
+                    'Sexual Partners': [r['sexual_partners'] for r in rows],
+                    'First Sexual Activity Age': [r['first_sexual_activity_age'] for r in rows],
+                    **{column: codes[keep] for column, codes in columns.items()}
+                })[cervical_features]
+
+                heads = cervical_predictor.predict(patient_frame)
+                actions = override_cervical_actions(heads["action"].labels, [r['hpv_result'] for r in rows],
+                                                    [r['pap_smear_result'] for r in rows], [r['age'] for r in rows])
+                recommended_actions = encoders['le_action'].inverse_transform(actions)
+                insurance_covered = encoders['le_insurance'].inverse_transform(heads["insurance"].labels)
+
+                cohort = cohort_indexes["cervical"]
+                risk_scores = heads["action"].proba.max(axis=1) * 100
+                percentiles = cohort.percentiles(risk_scores)
+
+                history = []
+                for j, (index, input_data) in enumerate(zip(indices, rows)):
+                    history.append({
+                        **input_data,
+                        "recommended_action": recommended_actions[j],
+                        "insurance_covered": insurance_covered[j],
+                        "risk_score": float(risk_scores[j]),
+                        "risk_model_version": model_version
+                    })
+                    results[int(index)] = {
+                        'index': int(index),
+                        'status': 'success',
+                        'patient_data': input_data,
+                        'recommended_action': recommended_actions[j],
+                        'insurance_covered': insurance_covered[j],
+                        'percentile_risk': {
+                            'risk_score': float(risk_scores[j]),
+                            'percentile': float(percentiles[j]),
+                            'risk_category': risk_category(percentiles[j])
+                        }
+                    }
+                commit_history_batch(user_uid, "cervical", history)
+
+        return batch_response(results, errors)
+    except ValueError as e:
+        logger.error(f'Error in /cervical_recommendation/batch for user {user_uid}: {e}')
+        return jsonify({'status': 'error', 'message': f'Invalid input: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f'Error in /cervical_recommendation/batch for user {user_uid}: {e}')
+        return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
+
+@app.route('/ovarian_recommendation/batch', methods=['POST'])
+@token_required
+def ovarian_recommendation_batch(user_uid):
+    """
+    Score many ovarian records in one call with a single fused prediction.
+    Invalid records are reported per index.
+    """
+    try:
+        records = read_batch_records()
+        region = validate_region(user_uid)
+
+        inputs, errors = {}, {}
+        for i, record in enumerate(records):
+            try:
+                if not isinstance(record, dict):
+                    raise ValueError("Record must be an object")
+                inputs[i] = prepare_ovarian_input(record, region)
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                errors[i] = f"Invalid input: {str(e)}"
+
+        results = {}
+        if inputs:
+            indices = np.array(sorted(inputs))
+            rows = [inputs[i] for i in indices]
+            valid = np.ones(len(rows), dtype=bool)
+            row_errors = {}
+            menopause_codes, valid = encode_batch_column([r['menopause_status'] for r in rows], 'le_menopause', 'menopause_status', valid, row_errors)
+            provided_ultrasound = np.array([bool(r['ultrasound_features']) for r in rows])
+            ultrasound_values = np.array([r['ultrasound_features'] for r in rows], dtype=object)
+            unknown_ultrasound = provided_ultrasound & ~np.isin(ultrasound_values, encoders['le_ultrasound'].classes_)
+            for j in np.flatnonzero(valid & unknown_ultrasound):
+                row_errors[j] = f"Invalid ultrasound_features: {ultrasound_values[j]}. Must be one of {list(encoders['le_ultrasound'].classes_)}"
+            valid &= ~unknown_ultrasound
+            for j, message in row_errors.items():
+                errors[int(indices[j])] = message
+
+            if valid.any():
+                keep = np.flatnonzero(valid)
+                rows = [rows[j] for j in keep]
+                indices = indices[keep]
+                symptom_matrix = np.array([
+                    [1 if s.lower() in [x.lower() for x in r['symptoms']] else 0 for s in symptoms]
+                    for r in rows
+                ]).reshape(len(rows), len(symptoms))
+                patient_frame = pd.DataFrame({
+                    'Age': [r['age'] for r in rows],
+                    'Menopause Status': menopause_codes[keep],
+                    'Cyst Size cm': [r['cyst_size'] for r in rows],
+                    'Cyst Growth Rate cm/month': [r['cyst_growth_rate'] for r in rows],
+                    'CA 125 Level': [r['ca125_level'] for r in rows],
+                    **{symptom: symptom_matrix[:, k] for k, symptom in enumerate(symptoms)}
+                })[ovarian_features]
+
+                heads = ovarian_predictor.predict(patient_frame)
+                predicted_ultrasound = encoders['le_ultrasound'].inverse_transform(heads["ultrasound"].labels)
+                ultrasound_features = np.where(provided_ultrasound[keep], ultrasound_values[keep], predicted_ultrasound)
+                recommended_management = encoders['le_management'].inverse_transform(heads["management"].labels)
+
+                cohort = cohort_indexes["ovarian"]
+                risk_scores = heads["management"].proba.max(axis=1) * 100
+                percentiles = cohort.percentiles(risk_scores)
+
+                history = []
+                for j, (index, input_data) in enumerate(zip(indices, rows)):
+                    history.append({
+                        **input_data,
+                        "recommended_management": recommended_management[j],
+                        "ultrasound_features": ultrasound_features[j],
+                        "risk_score": float(risk_scores[j]),
+                        "risk_model_version": model_version
+                    })
+                    results[int(index)] = {
+                        'index': int(index),
+                        'status': 'success',
+                        'patient_data': input_data,
+                        'ultrasound_features': ultrasound_features[j],
+                        'recommended_management': recommended_management[j],
+                        'percentile_risk': {
+                            'risk_score': float(risk_scores[j]),
+                            'percentile': float(percentiles[j]),
+                            'risk_category': risk_category(percentiles[j])
+                        }
+                    }
+                commit_history_batch(user_uid, "ovarian", history)
+
+        return batch_response(results, errors)
+    except ValueError as e:
+        logger.error(f'Error in /ovarian_recommendation/batch for user {user_uid}: {e}')
+        return jsonify({'status': 'error', 'message': f'Invalid input: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f'Error in /ovarian_recommendation/batch for user {user_uid}: {e}')
+        return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
+
 @app.route('/patient_history', methods=['GET'])
 @token_required
 def get_patient_history(user_uid):
     try:
-        history = generate_patient_history_timeline(user_uid)
+        limit, descending, cursors = read_page_args()
+        history = cached_patient_history_timeline(user_uid, limit, cursors, descending)
         return jsonify(history)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         logger.error(f'Error in /patient_history: {e}')
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
@@ -1463,6 +1504,7 @@ def get_specialists(region):
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
 @app.route('/population_health', methods=['GET'])
+@population_response_cache.cached(vary=('region',))
 def get_population_health():
     try:
         region = request.args.get('region', '').title().strip()
@@ -1472,7 +1514,40 @@ def get_population_health():
         logger.error(f'Error in /population_health: {e}')
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
+@app.route('/population_health/query', methods=['GET'])
+@population_response_cache.cached(vary=None)
+def query_population_health():
+    """
+    Counts from the population cubes. condition is cervical or ovarian;
+    group_by is a comma-separated list of dimensions; any other argument
+    named after a dimension filters on a comma-separated list of labels.
+    """
+    try:
+        condition = request.args.get('condition', 'cervical').strip().lower()
+        if condition not in population_cubes:
+            return jsonify({'status': 'error', 'message': f'Invalid condition: {condition}. Must be one of {list(population_cubes)}'}), 400
+        cube = population_cubes[condition]
+        group_by = [name.strip() for name in request.args.get('group_by', '').split(',') if name.strip()]
+        filters = {
+            name: [label.strip() for label in value.split(',') if label.strip()]
+            for name, value in request.args.items() if name not in ('condition', 'group_by')
+        }
+        result = cube.query(filters, group_by)
+        return jsonify({
+            'condition': condition,
+            'group_by': group_by,
+            'filters': filters,
+            'dimensions': cube.describe(),
+            **result
+        })
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'Error in /population_health/query: {e}')
+        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+
 @app.route('/anonymized_data', methods=['GET'])
+@population_response_cache.cached()
 def get_anonymized_data():
     try:
         data = aggregate_anonymized_data()
@@ -1481,21 +1556,44 @@ def get_anonymized_data():
         logger.error(f'Error in /anonymized_data: {e}')
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
-@app.route('/generate_pdf/<user_uid>', methods=['POST'])
+@app.route('/generate_pdf', methods=['POST'])
+@app.route('/generate_pdf/<patient_uid>', methods=['POST'])
 @token_required
-def generate_pdf(user_uid):
+def generate_pdf(user_uid, patient_uid=None):
+    """Queue a PDF report for the caller. Poll /reports/<job_id> and download from /reports/<job_id>/pdf."""
     try:
-        data = request.json
-        patient_data = data['patient_data']
-        recommendation = data['recommendation']
-        filename = generate_pdf_report(user_uid, patient_data, recommendation)
-        if filename:
-            return jsonify({'status': 'success', 'filename': filename})
-        return jsonify({'status': 'error', 'message': 'Failed to generate PDF'})
+        if patient_uid is not None and patient_uid != user_uid:
+            return jsonify({'status': 'error', 'message': 'Reports can only be generated for your own account'}), 403
+        data = request.json or {}
+        if not isinstance(data.get('patient_data'), dict) or 'recommendation' not in data:
+            return jsonify({'status': 'error', 'message': "'patient_data' (object) and 'recommendation' are required"}), 400
+        job = report_jobs.submit(user_uid, data['patient_data'], data['recommendation'], datetime.now().strftime('%Y-%m-%d'))
+        return jsonify(report_job_response(job)), 200 if job['status'] == 'done' else 202
+    except QueueFullError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 503
     except Exception as e:
-        logger.error(f'Error in /generate_pdf/{user_uid}: {e}')
+        logger.error(f'Error in /generate_pdf for user {user_uid}: {e}')
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
+@app.route('/reports/<job_id>', methods=['GET'])
+@token_required
+def get_report_job(user_uid, job_id):
+    job = report_jobs.get(job_id, user_uid)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Unknown report job'}), 404
+    return jsonify(report_job_response(job))
+
+@app.route('/reports/<job_id>/pdf', methods=['GET'])
+@token_required
+def download_report(user_uid, job_id):
+    job = report_jobs.get(job_id, user_uid)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Unknown report job'}), 404
+    if job['status'] != 'done' or not report_jobs.store.has_pdf(job_id):
+        return jsonify(report_job_response(job)), 409
+    return send_file(report_jobs.store.pdf_path(job_id), mimetype='application/pdf', as_attachment=True,
+                     download_name=f"report-{job['job_id'][:12]}.pdf", conditional=True, etag=job_id)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
@@ -1618,8 +1716,8 @@ def cervical_risk_assessment(user_uid):
 
         # Additional calculations using storage_data format
         percentile_risk = calculate_percentile_risk(user_uid, storage_data, "cervical")
-        education_content = get_education_content(user_uid, storage_data, risk_level)
-        care_plan = generate_automated_care_plan(user_uid, risk_level, storage_data, "cervical")
+        education_content = get_risk_education_content(user_uid, storage_data, risk_level)
+        care_plan = generate_risk_care_plan(user_uid, risk_level, storage_data, "cervical")
 
         # Store in database
         db.collection("patient_history").document(user_uid).collection("cervical_risk").add({
@@ -1650,173 +1748,10 @@ def cervical_risk_assessment(user_uid):
 def calculate_cervical_risk_score(data):
     """
     Calculate cervical cancer risk score based on clinical factors, lifestyle, and symptoms.
+    Weights and thresholds live in risk_rules.CERVICAL_RISK_RULES.
     """
-    risk_score = 0
-    
-    # Age-based risk (cervical cancer peaks in 30s-40s)
-    age = data['patient_info']['age']
-    if 25 <= age <= 29:
-        risk_score += 12
-    elif 30 <= age <= 39:
-        risk_score += 20
-    elif 40 <= age <= 49:
-        risk_score += 18
-    elif 50 <= age <= 59:
-        risk_score += 12
-    elif age >= 60:
-        risk_score += 8
-    
-    # Sexual activity risk factors
-    sexual_partners = data['patient_info']['sexual_partners']
-    if sexual_partners >= 6:
-        risk_score += 18
-    elif sexual_partners >= 3:
-        risk_score += 12
-    elif sexual_partners >= 2:
-        risk_score += 8
-    
-    # Early sexual activity
-    age_first_sex = data['patient_info']['age_first_sex']
-    if age_first_sex <= 16:
-        risk_score += 12
-    elif age_first_sex <= 18:
-        risk_score += 8
-    
-    # Smoking (major risk factor)
-    if normalize_yes_no(data['patient_info']['smoking']):
-        risk_score += 20
-    
-    # Medical history risk factors
-    if normalize_yes_no(data['medical_history']['family_cancer_history']):
-        risk_score += 12
-    
-    if normalize_yes_no(data['medical_history']['previous_stds']):
-        risk_score += 15
-    
-    if normalize_yes_no(data['medical_history']['hiv_status']):
-        risk_score += 25
-    
-    if normalize_yes_no(data['medical_history']['taking_immune_drugs']):
-        risk_score += 15
-    
-    # HPV vaccination (protective factor)
-    if normalize_yes_no(data['lifestyle']['hpv_vaccination']):
-        risk_score -= 15  # Reduces risk significantly
-    
-    # Lifestyle factors
-    exercise_freq = data['lifestyle']['exercise_frequency'].lower()
-    if exercise_freq in ['rarely', 'never']:
-        risk_score += 8
-    elif exercise_freq == 'regularly':
-        risk_score -= 3
-    
-    diet_quality = data['lifestyle']['diet_quality'].lower()
-    if diet_quality == 'poor':
-        risk_score += 8
-    elif diet_quality == 'excellent':
-        risk_score -= 3
-    
-    alcohol_consumption = data['lifestyle']['alcohol_consumption'].lower()
-    if alcohol_consumption in ['heavy', 'excessive']:
-        risk_score += 10
-    elif alcohol_consumption == 'moderate':
-        risk_score += 3
-    
-    stress_level = data['lifestyle']['stress_level'].lower()
-    if stress_level == 'high':
-        risk_score += 8
-    elif stress_level == 'very high':
-        risk_score += 12
-    
-    sleep_quality = data['lifestyle']['sleep_quality'].lower()
-    if sleep_quality == 'poor':
-        risk_score += 6
-    elif sleep_quality == 'very poor':
-        risk_score += 10
-    
-    # Contraceptive use (long-term oral contraceptives slightly increase risk)
-    contraceptive = data['lifestyle']['contraceptive_use'].lower()
-    if 'oral' in contraceptive and 'long-term' in contraceptive:
-        risk_score += 5
-    
-    # Lack of screening (major risk factor)
-    last_screening = data['medical_history']['last_screening'].lower()
-    if last_screening == 'never':
-        risk_score += 20
-    elif 'year' in last_screening:
-        try:
-            years_ago = int(last_screening.split()[0])
-            if years_ago >= 5:
-                risk_score += 15
-            elif years_ago >= 3:
-                risk_score += 10
-        except:
-            risk_score += 8
-    
-    # Symptom-based risk assessment
-    symptom_score = 0
-    
-    # Bleeding symptoms (high concern)
-    bleeding_symptoms = data.get('bleeding_symptoms', {})
-    if normalize_yes_no(bleeding_symptoms.get('bleeding_between_periods', 'No')):
-        symptom_score += 15
-    if normalize_yes_no(bleeding_symptoms.get('bleeding_after_sex', 'No')):
-        symptom_score += 20
-    if normalize_yes_no(bleeding_symptoms.get('bleeding_after_menopause', 'No')):
-        symptom_score += 25
-    if normalize_yes_no(bleeding_symptoms.get('periods_heavier_than_before', 'No')):
-        symptom_score += 12
-    if normalize_yes_no(bleeding_symptoms.get('periods_longer_than_before', 'No')):
-        symptom_score += 12
-    
-    # Discharge symptoms
-    other_symptoms = data.get('other_symptoms', {})
-    if normalize_yes_no(other_symptoms.get('unusual_discharge', 'No')):
-        symptom_score += 12
-    if normalize_yes_no(other_symptoms.get('discharge_smells_bad', 'No')):
-        symptom_score += 15
-    if normalize_yes_no(other_symptoms.get('discharge_color_change', 'No')):
-        symptom_score += 12
-    
-    # Pain symptoms
-    if normalize_yes_no(other_symptoms.get('pain_during_sex', 'No')):
-        symptom_score += 15
-    if normalize_yes_no(other_symptoms.get('pelvic_pain', 'No')):
-        symptom_score += 18
-    
-    # Urinary symptoms
-    if normalize_yes_no(other_symptoms.get('painful_urination', 'No')):
-        symptom_score += 10
-    if normalize_yes_no(other_symptoms.get('blood_in_urine', 'No')):
-        symptom_score += 15
-    if normalize_yes_no(other_symptoms.get('frequent_urination', 'No')):
-        symptom_score += 8
-    
-    # Bowel symptoms
-    if normalize_yes_no(other_symptoms.get('rectal_bleeding', 'No')):
-        symptom_score += 20
-    if normalize_yes_no(other_symptoms.get('painful_bowel_movements', 'No')):
-        symptom_score += 15
-    
-    # General symptoms
-    general_symptoms = data.get('general_symptoms', {})
-    if normalize_yes_no(general_symptoms.get('unexplained_weight_loss', 'No')):
-        symptom_score += 20
-    if normalize_yes_no(general_symptoms.get('constant_tiredness', 'No')):
-        symptom_score += 8
-    if normalize_yes_no(general_symptoms.get('leg_swelling', 'No')):
-        symptom_score += 15
-    if normalize_yes_no(general_symptoms.get('back_pain', 'No')):
-        symptom_score += 12
-    
-    # Add symptom score to risk score
-    risk_score += symptom_score
-    
-    # Ensure risk score is reasonable (not negative, capped at 100)
-    risk_score = max(0, min(risk_score, 100))
-    
+    risk_score, symptom_score = CERVICAL_RISK_RULES.score_parts(data)
     logger.info(f"Cervical cancer risk calculation: base_risk={risk_score-symptom_score}, symptom_score={symptom_score}, total={risk_score}")
-    
     return risk_score
 
 
@@ -1874,15 +1809,6 @@ def calculate_insurance_coverage(data, risk_level):
     return "Yes" if coverage_score >= 75 else "Possibly"
 
 
-# Helper function - modified to return Yes/No instead of 0/1
-def normalize_yes_no(value):
-    """Convert various inputs to Yes/No format"""
-    if value is None:
-        return "No"
-    value = str(value).strip().lower()
-    return "Yes" if value in ['yes', 'y', '1', 'true'] else "No"
-
-
 def calculate_percentile_risk(user_uid, storage_data, cancer_type):
     """
     Calculate percentile risk for cervical cancer based on population data
@@ -1994,9 +1920,9 @@ def get_percentile_interpretation(percentile):
         return "This indicates a lower risk level, but preventive care remains important."
 
 
-def get_education_content(user_uid, storage_data, risk_level):
+def get_risk_education_content(user_uid, storage_data, risk_level):
     """
-    Generate educational content without FAQs - focused on practical guidance
+    Generate educational content for a risk assessment without FAQs - focused on practical guidance
     """
     try:
         content = {
@@ -2066,9 +1992,9 @@ def get_education_content(user_uid, storage_data, risk_level):
         }
 
 
-def generate_automated_care_plan(user_uid, risk_level, storage_data, cancer_type):
+def generate_risk_care_plan(user_uid, risk_level, storage_data, cancer_type):
     """
-    Generate automated care plan with practical, patient-friendly recommendations
+    Generate a risk assessment care plan with practical, patient-friendly recommendations
     """
     try:
         care_plan = {
@@ -2280,168 +2206,10 @@ def ovarian_cysts_assessment(user_uid):
 def calculate_ovarian_cysts_risk_score(data):
     """
     Calculate ovarian cysts risk score based on clinical, lifestyle, and symptom factors.
-    Uses weight_status to align with endpoint validation, includes smoking status and PCOS-symptom interactions,
-    with adjusted symptom weights for moderate risk differentiation.
+    Weights and thresholds live in risk_rules.OVARIAN_CYSTS_RISK_RULES.
     """
-    risk_score = 0
-    symptom_score = 0
-    
-    # Age-based risk (ovarian cysts more common in reproductive years)
-    age = data['patient_info']['age']
-    if 20 <= age <= 35:
-        risk_score += 15
-    elif 36 <= age <= 45:
-        risk_score += 12
-    elif 46 <= age <= 55:
-        risk_score += 8
-    elif age > 55:
-        risk_score += 5
-    
-    # Menstrual cycle factors
-    cycle_length = data['patient_info']['menstrual_cycle_length']
-    if cycle_length > 35 or cycle_length < 21:
-        risk_score += 12
-    
-    if normalize_yes_no(data['patient_info']['menstrual_irregularity']):
-        risk_score += 5  # Reduced for moderate risk
-    
-    # Pregnancy history (nulliparity increases risk)
-    if not normalize_yes_no(data['patient_info']['pregnancy_history']):
-        risk_score += 10
-    
-    # Family history
-    if normalize_yes_no(data['patient_info']['family_history_ovarian']):
-        risk_score += 12
-    
-    # Medical history risk factors
-    if normalize_yes_no(data['medical_history']['pcos_diagnosis']):
-        risk_score += 30  # Strong risk factor
-    
-    if normalize_yes_no(data['medical_history']['endometriosis']):
-        risk_score += 20
-    
-    if normalize_yes_no(data['medical_history']['previous_ovarian_cysts']):
-        risk_score += 25  # High recurrence risk
-    
-    if normalize_yes_no(data['medical_history']['hormone_therapy']):
-        risk_score += 10
-    
-    if normalize_yes_no(data['medical_history']['fertility_treatments']):
-        risk_score += 15
-    
-    # Smoking history (increases hormonal disruption risk)
-    smoking_status = data.get('lifestyle', {}).get('smoking_status', 'No')
-    if normalize_yes_no(smoking_status):
-        risk_score += 10
-    
-    # Weight status (aligned with endpoint validation)
-    weight_status = data.get('lifestyle', {}).get('weight_status', 'normal').lower()
-    if weight_status in ['obese', 'overweight']:
-        risk_score += 12
-    elif weight_status == 'underweight':
-        risk_score += 8
-    
-    # Lifestyle factors
-    exercise_freq = data['lifestyle']['exercise_frequency'].lower()
-    if exercise_freq in ['rarely', 'never']:
-        risk_score += 8
-    elif exercise_freq == 'regularly':
-        risk_score -= 3
-    
-    diet_quality = data['lifestyle']['diet_quality'].lower()
-    if diet_quality == 'poor':
-        risk_score += 8
-    elif diet_quality == 'excellent':
-        risk_score -= 3
-    
-    stress_level = data['lifestyle']['stress_level'].lower()
-    if stress_level == 'high':
-        risk_score += 10
-    elif stress_level == 'very high':
-        risk_score += 15
-    
-    # Contraceptive use (oral contraceptives may reduce risk)
-    contraceptive = data['lifestyle']['contraceptive_use'].lower()
-    if 'oral' in contraceptive or 'pill' in contraceptive:
-        risk_score -= 8
-    
-    # Lack of recent screening
-    last_exam = data['medical_history']['last_pelvic_exam'].lower()
-    if last_exam == 'never':
-        risk_score += 15
-    elif 'year' in last_exam:
-        try:
-            years_ago = int(last_exam.split()[0])
-            if years_ago >= 3:
-                risk_score += 10
-            elif years_ago >= 2:
-                risk_score += 5
-        except:
-            risk_score += 5
-    
-    # Symptom-based risk assessment with adjusted weights
-    pelvic_symptoms = data.get('pelvic_symptoms', {})
-    if normalize_yes_no(pelvic_symptoms.get('pelvic_pain', 'No')):
-        symptom_score += 10  # Reduced from 25
-    if normalize_yes_no(pelvic_symptoms.get('abdominal_bloating', 'No')):
-        symptom_score += 8
-    if normalize_yes_no(pelvic_symptoms.get('feeling_full_quickly', 'No')):
-        symptom_score += 8
-    if normalize_yes_no(pelvic_symptoms.get('frequent_urination', 'No')):
-        symptom_score += 8
-    if normalize_yes_no(pelvic_symptoms.get('difficulty_emptying_bladder', 'No')):
-        symptom_score += 8
-    if normalize_yes_no(pelvic_symptoms.get('pain_during_sex', 'No')):
-        symptom_score += 8
-    
-    menstrual_symptoms = data.get('menstrual_symptoms', {})
-    if normalize_yes_no(menstrual_symptoms.get('irregular_periods', 'No')):
-        symptom_score += 5  # Reduced from 20
-    if normalize_yes_no(menstrual_symptoms.get('heavy_periods', 'No')):
-        symptom_score += 8
-    if normalize_yes_no(menstrual_symptoms.get('painful_periods', 'No')):
-        symptom_score += 6
-    if normalize_yes_no(menstrual_symptoms.get('spotting_between_periods', 'No')):
-        symptom_score += 8
-    if normalize_yes_no(menstrual_symptoms.get('missed_periods', 'No')):
-        symptom_score += 8
-    
-    hormonal_symptoms = data.get('hormonal_symptoms', {})
-    if normalize_yes_no(hormonal_symptoms.get('breast_tenderness', 'No')):
-        symptom_score += 6
-    if normalize_yes_no(hormonal_symptoms.get('mood_changes', 'No')):
-        symptom_score += 6
-    if normalize_yes_no(hormonal_symptoms.get('weight_gain', 'No')):
-        symptom_score += 6
-    if normalize_yes_no(hormonal_symptoms.get('acne_changes', 'No')):
-        symptom_score += 6
-    if normalize_yes_no(hormonal_symptoms.get('hair_growth_changes', 'No')):
-        symptom_score += 6
-    
-    general_symptoms = data.get('general_symptoms', {})
-    if normalize_yes_no(general_symptoms.get('nausea_vomiting', 'No')):
-        symptom_score += 8
-    if normalize_yes_no(general_symptoms.get('back_pain', 'No')):
-        symptom_score += 6
-    if normalize_yes_no(general_symptoms.get('leg_pain', 'No')):
-        symptom_score += 6
-    if normalize_yes_no(general_symptoms.get('fatigue', 'No')):
-        symptom_score += 6
-    
-    # Interaction term: PCOS + irregular periods or pelvic pain
-    if (normalize_yes_no(data['medical_history']['pcos_diagnosis']) and
-        (normalize_yes_no(menstrual_symptoms.get('irregular_periods', 'No')) or
-         normalize_yes_no(pelvic_symptoms.get('pelvic_pain', 'No')))):
-        risk_score += 10  # Synergistic effect
-    
-    # Add symptom score to risk score
-    risk_score += symptom_score
-    
-    # Ensure risk score is reasonable (not negative, capped at 100)
-    risk_score = max(0, min(risk_score, 100))
-    
+    risk_score, symptom_score = OVARIAN_CYSTS_RISK_RULES.score_parts(data)
     logger.info(f"Ovarian cysts risk calculation: base_risk={risk_score-symptom_score}, symptom_score={symptom_score}, total={risk_score}")
-    
     return risk_score
 
 def determine_ovarian_cysts_risk_level(risk_score):
@@ -2707,26 +2475,14 @@ def check_inventory():
         region = data.get('region', '').strip().title()
         item = data.get('item', '').strip().lower()
 
-        filtered_data = inventory_data.copy()
+        inventory_list = inventory_index.get().search(region, item)
 
-        if region:
-            filtered_data = filtered_data[filtered_data['Region'].str.title() == region]
-
-        if item:
-            filtered_data = filtered_data[
-                filtered_data['Item'].str.lower().str.contains(item)
-            ]
-
-        if filtered_data.empty:
+        if not inventory_list:
             return jsonify({
                 'status': 'error',
                 'message': 'No inventory found for the given criteria'
             }), 404
 
-        inventory_list = filtered_data[[
-            'Region', 'Facility', 'Item', 'Available Stock', 'Cost (KES)'
-        ]].to_dict(orient='records')
-
         return jsonify({
             'status': 'success',
             'inventory': inventory_list,
@@ -2747,14 +2503,9 @@ def calculate_cost():
         region = data['region'].title().strip()
         service = data['service'].title().strip()
         category = data['category'].title().strip()
-        cost_row = costs_data[
-            (costs_data['Region'] == region) &
-            (costs_data['Service'] == service) &
-            (costs_data['Category'] == category)
-        ]
-        if cost_row.empty:
+        cost_details = cost_index.get().lookup(region, service, category)
+        if cost_details is None:
             return jsonify({'status': 'error', 'message': 'No matching service found'}), 404
-        cost_details = cost_row.iloc[0].to_dict()
         return jsonify({
             'status': 'success',
             'region': region,
@@ -2771,13 +2522,8 @@ def calculate_cost():
         logger.error(f'Error in /cost: {e}')
         return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
 
+# Development server only; production runs `gunicorn -c gunicorn.conf.py app:app`.
+# Follow-up reminders are sent by a separate process: `python reminder_worker.py`
 if __name__ == '__main__':
     logger.info("Starting Flask API server...")
     app.run(debug=True, host='0.0.0.0', port=5000)
-# Start scheduler thread
-scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-scheduler_thread.start()
-
-if __name__ == '__main__':
-    logger.info('Starting Server...')
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
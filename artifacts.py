@@ -0,0 +1,189 @@
+"""
+Versioned model artifact bundles.
+
+A bundle is a directory under ``data/artifacts/<version>/`` holding the four
+RandomForest models, the LabelEncoders and the cleaned datasets, together with
+a ``manifest.json`` describing what was written. ``data/artifacts/LATEST``
+names the bundle the API server loads at startup.
+
+Bundles are produced offline by ``train_models.py``; the server never trains.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+from datetime import datetime
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+LATEST_POINTER = "LATEST"
+
+MODEL_NAMES = ["cervical_model", "insurance_model", "management_model", "ultrasound_model"]
+ENCODER_NAMES = [
+    "le_hpv", "le_pap", "le_smoking", "le_std", "le_insurance", "le_screening",
+    "le_action", "le_menopause", "le_ultrasound", "le_management"
+]
+
+# Feature columns the models in a bundle are trained on
+cervical_features = [
+    "Age", "Sexual Partners", "First Sexual Activity Age",
+    "HPV Test Result", "Pap Smear Result", "Smoking Status", "STDs History",
+    "Screening Type Last"
+]
+ovarian_features = [
+    "Age", "Menopause Status", "Cyst Size cm", "Cyst Growth Rate cm/month", "CA 125 Level",
+    "Pelvic Pain", "Bloating", "Nausea", "Fatigue", "Irregular Periods"
+]
+
+FRAME_FILES = {
+    "cervical": "cervical_cleaned.csv",
+    "ovarian": "ovarian_cleaned.csv",
+    "inventory": "inventory_cleaned.csv",
+    "costs": "costs_cleaned.csv"
+}
+
+
+class ArtifactBundleError(RuntimeError):
+    """Raised when an artifact bundle is missing or incomplete."""
+
+
+class ArtifactBundle:
+    """Models, encoders and cleaned frames loaded from one bundle version."""
+
+    def __init__(self, version, path, models, encoders, frames, manifest):
+        self.version = version
+        self.path = path
+        self.models = models
+        self.encoders = encoders
+        self.frames = frames
+        self.manifest = manifest
+
+    def frame_path(self, name):
+        return os.path.join(self.path, FRAME_FILES[name])
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_bundle(artifact_root, models, encoders, frames, metadata=None):
+    """
+    Write a new bundle and point LATEST at it. Returns the bundle version.
+
+    Files are written to a staging directory first and renamed into place, so
+    a crashed training run never leaves a half-written bundle behind.
+    """
+    missing = [name for name in MODEL_NAMES if name not in models] + \
+              [name for name in ENCODER_NAMES if name not in encoders] + \
+              [name for name in FRAME_FILES if name not in frames]
+    if missing:
+        raise ArtifactBundleError(f"Cannot save bundle, missing artifacts: {missing}")
+
+    os.makedirs(artifact_root, exist_ok=True)
+    staging_dir = os.path.join(artifact_root, f".staging-{os.getpid()}")
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    files = {}
+    for name in MODEL_NAMES:
+        with open(os.path.join(staging_dir, f"{name}.pkl"), "wb") as f:
+            pickle.dump(models[name], f)
+        files[f"{name}.pkl"] = None
+    for name in ENCODER_NAMES:
+        with open(os.path.join(staging_dir, f"{name}.pkl"), "wb") as f:
+            pickle.dump(encoders[name], f)
+        files[f"{name}.pkl"] = None
+    for name, filename in FRAME_FILES.items():
+        frames[name].to_csv(os.path.join(staging_dir, filename), index=False)
+        files[filename] = None
+
+    content_hash = hashlib.sha256()
+    for filename in sorted(files):
+        files[filename] = _file_digest(os.path.join(staging_dir, filename))
+        content_hash.update(f"{filename}:{files[filename]}".encode())
+    version = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{content_hash.hexdigest()[:8]}"
+
+    manifest = {
+        "version": version,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "models": MODEL_NAMES,
+        "encoders": ENCODER_NAMES,
+        "frames": FRAME_FILES,
+        "files": files,
+        "metadata": metadata or {}
+    }
+    with open(os.path.join(staging_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    bundle_dir = os.path.join(artifact_root, version)
+    os.replace(staging_dir, bundle_dir)
+
+    pointer_tmp = os.path.join(artifact_root, f".{LATEST_POINTER}.tmp")
+    with open(pointer_tmp, "w") as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(artifact_root, LATEST_POINTER))
+
+    logger.info(f"Saved artifact bundle {version} to {bundle_dir}")
+    return version
+
+
+def resolve_version(artifact_root, version=None):
+    """Return the requested version, or the one named by LATEST."""
+    if version:
+        return version
+    pointer = os.path.join(artifact_root, LATEST_POINTER)
+    if not os.path.exists(pointer):
+        raise ArtifactBundleError(f"No artifact bundle found: {pointer} does not exist.")
+    with open(pointer) as f:
+        version = f.read().strip()
+    if not version:
+        raise ArtifactBundleError(f"Artifact pointer {pointer} is empty.")
+    return version
+
+
+def load_bundle(artifact_root, version=None):
+    """
+    Load a bundle (LATEST by default). Raises ArtifactBundleError if the bundle
+    or any file listed in its manifest is missing.
+    """
+    version = resolve_version(artifact_root, version)
+    bundle_dir = os.path.join(artifact_root, version)
+    manifest_path = os.path.join(bundle_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise ArtifactBundleError(f"Artifact bundle {version} has no manifest at {manifest_path}.")
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    missing = [name for name in manifest.get("files", {}) if not os.path.exists(os.path.join(bundle_dir, name))]
+    if missing:
+        raise ArtifactBundleError(f"Artifact bundle {version} is incomplete, missing: {missing}")
+
+    try:
+        models = {}
+        for name in manifest["models"]:
+            with open(os.path.join(bundle_dir, f"{name}.pkl"), "rb") as f:
+                models[name] = pickle.load(f)
+        encoders = {}
+        for name in manifest["encoders"]:
+            with open(os.path.join(bundle_dir, f"{name}.pkl"), "rb") as f:
+                encoders[name] = pickle.load(f)
+        frames = {
+            name: pd.read_csv(os.path.join(bundle_dir, filename))
+            for name, filename in manifest["frames"].items()
+        }
+    except (KeyError, OSError, pickle.UnpicklingError) as e:
+        raise ArtifactBundleError(f"Failed to load artifact bundle {version}: {e}") from e
+
+    logger.info(f"Loaded artifact bundle {version} from {bundle_dir}")
+    return ArtifactBundle(version, bundle_dir, models, encoders, frames, manifest)
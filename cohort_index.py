@@ -0,0 +1,58 @@
+"""
+Cohort scoring index for the risk comparison engine.
+
+The reference cohort (the cleaned training frame) is scored once per model
+version with a single batched predict_proba call. The max-class probabilities
+are kept as a sorted NumPy array, so placing a patient in the cohort is one
+np.searchsorted call instead of a forest evaluation per cohort row.
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CohortIndex:
+    def __init__(self, model, frame, features, model_version=None):
+        self.model = model
+        self.features = list(features)
+        self.model_version = model_version
+        self.scores = np.sort(self.score(frame))
+        logger.info(f"Built cohort index over {len(self.scores)} records (model version {model_version})")
+
+    def __len__(self):
+        return len(self.scores)
+
+    def score(self, frame):
+        """Max-class probability (as a 0-100 score) for every row of frame."""
+        if len(frame) == 0:
+            return np.empty(0)
+        probs = self.model.predict_proba(frame[self.features])
+        return probs.max(axis=1) * 100
+
+    def add(self, frame):
+        """Score new cohort rows and merge them in. The sorted array is replaced, never modified in place."""
+        new_scores = self.score(frame)
+        if len(new_scores):
+            self.scores = np.sort(np.concatenate([self.scores, new_scores]))
+        return len(new_scores)
+
+    def percentile(self, risk_score):
+        """Percentage of the cohort scoring strictly below risk_score."""
+        scores = self.scores
+        if not len(scores):
+            raise ValueError("Cohort index is empty")
+        return float(np.searchsorted(scores, risk_score, side="left") / len(scores) * 100)
+
+    def percentiles(self, risk_scores):
+        """Vectorised percentile() for an array of scores."""
+        scores = self.scores
+        if not len(scores):
+            raise ValueError("Cohort index is empty")
+        return np.searchsorted(scores, np.asarray(risk_scores), side="left") / len(scores) * 100
+
+
+def risk_category(percentile):
+    return "Top 10%" if percentile >= 90 else "Top 25%" if percentile >= 75 else "Top 50%" if percentile >= 50 else "Bottom 50%"
@@ -0,0 +1,79 @@
+"""
+Concurrent fan-out of independent blocking calls within one request.
+
+A handler that needs several independent Firestore reads (the cervical and
+ovarian history pages, a user profile next to model work) hands them to
+FanOut.gather() or FanOut.submit(). They run on one thread pool shared by
+every request in the process, so the handler waits for the slowest read
+instead of the sum of all of them. The Firestore client is thread-safe and
+spends its time waiting on the network, so threads are enough here.
+
+The pool is created lazily per process (gunicorn forks workers after the app
+is loaded, and pool threads do not survive a fork). A call made from a pool
+thread runs inline, so fanned-out work can fan out again without waiting on
+a pool that its own callers have filled.
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class FanOut:
+    def __init__(self, max_workers=8, name="fanout"):
+        self.max_workers = max_workers
+        self.name = name
+        self.stats_counts = {"submitted": 0, "inline": 0}
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _pool(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name,
+                                                        initializer=self._mark_pool_thread)
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _mark_pool_thread(self):
+        self._local.in_pool = True
+
+    def submit(self, fn, *args, **kwargs):
+        """Start fn(*args, **kwargs) on the pool. Returns a Future."""
+        if getattr(self._local, "in_pool", False):
+            self.stats_counts["inline"] += 1
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+        self.stats_counts["submitted"] += 1
+        return self._pool().submit(fn, *args, **kwargs)
+
+    def gather(self, *calls):
+        """
+        Run zero-argument callables concurrently and return their results in
+        order. The last call runs on the calling thread. Every call finishes
+        before the first exception (in call order) is raised.
+        """
+        if not calls:
+            return []
+        futures = [self.submit(call) for call in calls[:-1]]
+        last = Future()
+        try:
+            last.set_result(calls[-1]())
+        except Exception as e:
+            last.set_exception(e)
+        futures.append(last)
+        errors = [f.exception() for f in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        return [f.result() for f in futures]
+
+    def stats(self):
+        return dict(self.stats_counts, max_workers=self.max_workers)
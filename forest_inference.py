@@ -0,0 +1,268 @@
+"""
+NumPy inference engine for the trained RandomForest classifiers.
+
+CompiledForest flattens every tree of a fitted RandomForestClassifier into
+shared node arrays (feature, threshold, left, right, missing_go_to_left) and a
+per-leaf class-probability table. Prediction walks all trees for all rows one
+depth level at a time with array indexing, so a one-row request costs a few
+dozen small NumPy operations instead of sklearn's per-call input validation
+and joblib dispatch.
+
+The arithmetic follows sklearn exactly: inputs are cast to float32 before
+comparing against the float64 thresholds, leaf probabilities are taken the
+way the installed sklearn computes them, and tree probabilities are summed
+in estimator order and divided by the number of trees.
+
+Run ``python forest_inference.py`` to check a bundle's compiled models
+against sklearn on its stored training frames.
+"""
+
+import argparse
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ForestParityError(AssertionError):
+    """Raised when a compiled forest disagrees with the sklearn model it was built from."""
+
+
+def _tree_values_are_fractions():
+    """
+    sklearn >= 1.4 stores class fractions in tree_.value and predict_proba
+    returns them unchanged; older versions store weighted class counts and
+    normalise them on every call.
+    """
+    import sklearn
+    major, minor = (int(part) for part in sklearn.__version__.split(".")[:2])
+    return (major, minor) >= (1, 4)
+
+
+class CompiledForest:
+    def __init__(self, feature, threshold, left, right, missing_go_to_left, leaf_proba, roots, classes, feature_names=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_go_to_left = missing_go_to_left
+        self.leaf_proba = leaf_proba
+        self.roots = roots
+        self.classes_ = classes
+        self.feature_names = list(feature_names) if feature_names is not None else None
+
+    @classmethod
+    def from_sklearn(cls, model):
+        features, thresholds, lefts, rights, missing, probas, roots = [], [], [], [], [], [], []
+        offset = 0
+        normalise = not _tree_values_are_fractions()
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            leaf = tree.children_left == -1
+            roots.append(offset)
+            features.append(np.where(leaf, -1, tree.feature))
+            thresholds.append(tree.threshold)
+            # Leaves point at themselves so finished rows stay put while others descend
+            lefts.append(np.where(leaf, np.arange(tree.node_count), tree.children_left) + offset)
+            rights.append(np.where(leaf, np.arange(tree.node_count), tree.children_right) + offset)
+            missing_go_to_left = getattr(tree, "missing_go_to_left", None)
+            missing.append(np.zeros(tree.node_count, dtype=bool) if missing_go_to_left is None else missing_go_to_left.astype(bool))
+            value = tree.value[:, 0, :model.n_classes_].astype(np.float64)
+            if normalise:
+                normalizer = value.sum(axis=1, keepdims=True)
+                normalizer[normalizer == 0.0] = 1.0
+                value = value / normalizer
+            probas.append(value)
+            offset += tree.node_count
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.intp),
+            right=np.concatenate(rights).astype(np.intp),
+            missing_go_to_left=np.concatenate(missing),
+            leaf_proba=np.concatenate(probas),
+            roots=np.asarray(roots, dtype=np.intp),
+            classes=np.asarray(model.classes_),
+            feature_names=getattr(model, "feature_names_in_", None)
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def _as_array(self, X):
+        if hasattr(X, "columns") and self.feature_names is not None:
+            X = X[self.feature_names]
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return X
+
+    def apply(self, X):
+        """Leaf node index reached in every tree, shape (n_trees, n_rows)."""
+        X = self._as_array(X)
+        n_rows = X.shape[0]
+        rows = np.broadcast_to(np.arange(n_rows), (self.n_trees, n_rows))
+        nodes = np.repeat(self.roots[:, None], n_rows, axis=1)
+        while True:
+            feature = self.feature[nodes]
+            active = feature >= 0
+            if not active.any():
+                return nodes
+            values = X[rows, np.where(active, feature, 0)].astype(np.float64)
+            go_left = (values <= self.threshold[nodes]) | (np.isnan(values) & self.missing_go_to_left[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        proba = np.zeros((leaves.shape[1], len(self.classes_)))
+        for tree_leaves in leaves:
+            proba += self.leaf_proba[tree_leaves]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+HeadPrediction = namedtuple("HeadPrediction", ["labels", "proba"])
+
+
+class FusedForest:
+    """
+    Several compiled forests over the same feature columns (one per output
+    "head") merged into one node array set. A single traversal finds the
+    leaves of every tree of every head, and each head's probabilities are then
+    read from its own leaf table.
+    """
+
+    def __init__(self, heads):
+        self.heads = []
+        features, thresholds, lefts, rights, missing, roots = [], [], [], [], [], []
+        node_offset = tree_offset = 0
+        feature_names = None
+        for name, forest in heads.items():
+            if feature_names is None:
+                feature_names = forest.feature_names
+            elif forest.feature_names is not None and list(forest.feature_names) != list(feature_names):
+                raise ValueError(f"Head {name} uses different feature columns")
+            features.append(forest.feature)
+            thresholds.append(forest.threshold)
+            lefts.append(forest.left + node_offset)
+            rights.append(forest.right + node_offset)
+            missing.append(forest.missing_go_to_left)
+            roots.append(forest.roots + node_offset)
+            self.heads.append((name, slice(tree_offset, tree_offset + forest.n_trees), node_offset,
+                               forest.leaf_proba, forest.classes_))
+            node_offset += forest.n_nodes
+            tree_offset += forest.n_trees
+        self.forest = CompiledForest(
+            np.concatenate(features), np.concatenate(thresholds), np.concatenate(lefts), np.concatenate(rights),
+            np.concatenate(missing), None, np.concatenate(roots), None, feature_names)
+        self.feature_names = self.forest.feature_names
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "rows": 0, "seconds": 0.0}
+
+    def predict(self, X):
+        """{head name: HeadPrediction(labels, proba)} for every row of X."""
+        started = time.perf_counter()
+        result = self._predict(X)
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.stats["calls"] += 1
+            self.stats["rows"] += len(next(iter(result.values())).labels)
+            self.stats["seconds"] += elapsed
+        return result
+
+    def _predict(self, X):
+        leaves = self.forest.apply(X)
+        result = {}
+        for name, trees, node_offset, leaf_proba, classes in self.heads:
+            head_leaves = leaves[trees] - node_offset
+            proba = np.zeros((leaves.shape[1], len(classes)))
+            for tree_leaves in head_leaves:
+                proba += leaf_proba[tree_leaves]
+            proba /= len(head_leaves)
+            result[name] = HeadPrediction(classes.take(np.argmax(proba, axis=1)), proba)
+        return result
+
+    def timing(self):
+        calls = self.stats["calls"]
+        return {
+            "heads": [name for name, *_ in self.heads],
+            "calls": calls,
+            "rows": self.stats["rows"],
+            "avg_call_ms": round(self.stats["seconds"] / calls * 1000, 4) if calls else 0.0
+        }
+
+    def benchmark(self, X, separate, repeat=50):
+        """
+        Time one fused call against the separate per-model predict_proba calls
+        it replaces (given as a list of models). Returns milliseconds per call.
+        """
+        X = self.forest._as_array(X)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            self._predict(X)
+        fused = (time.perf_counter() - started) / repeat
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for model in separate:
+                model.predict_proba(X)
+        separate_time = (time.perf_counter() - started) / repeat
+        return {"fused_ms": round(fused * 1000, 4), "separate_ms": round(separate_time * 1000, 4)}
+
+
+def compile_models(models):
+    """CompiledForest for every model in a {name: RandomForestClassifier} dict."""
+    return {name: CompiledForest.from_sklearn(model) for name, model in models.items()}
+
+
+def check_parity(model, compiled, X, atol=1e-9):
+    """
+    Compare a compiled forest with its sklearn model on X. Returns the maximum
+    absolute probability difference; raises ForestParityError if any label
+    differs or a probability is off by more than atol.
+    """
+    expected = model.predict_proba(X)
+    actual = compiled.predict_proba(X)
+    max_diff = float(np.abs(expected - actual).max()) if len(expected) else 0.0
+    mismatched = int((model.predict(X) != compiled.predict(X)).sum())
+    if mismatched or max_diff > atol:
+        raise ForestParityError(
+            f"Compiled forest disagrees with sklearn: {mismatched} label mismatches, max probability diff {max_diff:.3g}")
+    return max_diff
+
+
+def main():
+    from artifacts import load_bundle, cervical_features, ovarian_features
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Check compiled forests against sklearn for an artifact bundle.")
+    parser.add_argument("--artifact-dir", default="data/artifacts")
+    parser.add_argument("--version", default=None)
+    args = parser.parse_args()
+
+    bundle = load_bundle(args.artifact_dir, args.version)
+    inputs = {
+        "cervical_model": bundle.frames["cervical"][cervical_features],
+        "insurance_model": bundle.frames["cervical"][cervical_features],
+        "management_model": bundle.frames["ovarian"][ovarian_features],
+        "ultrasound_model": bundle.frames["ovarian"][ovarian_features]
+    }
+    for name, compiled in compile_models(bundle.models).items():
+        max_diff = check_parity(bundle.models[name], compiled, inputs[name])
+        logger.info(f"{name}: {compiled.n_trees} trees, {compiled.n_nodes} nodes, "
+                    f"{len(inputs[name])} rows match sklearn (max probability diff {max_diff:.3g})")
+
+
+if __name__ == "__main__":
+    main()
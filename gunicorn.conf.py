@@ -0,0 +1,43 @@
+"""
+Gunicorn configuration for the API server.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master (preload_app), so the artifact bundle
+(forests, encoders, cleaned frames) is loaded a single time. Before the first
+fork the master moves everything it has allocated into the garbage
+collector's permanent generation (gc.freeze). Collections in the workers then
+never write to those objects' headers, and the workers keep sharing the
+model pages copy-on-write instead of each ending up with a private copy.
+
+The master must not talk to Firestore before forking: the gRPC channel is
+created lazily on first use and is not fork-safe. Background threads
+(write-behind flusher, revocation refresher, history sync, fan-out and
+report pools) start lazily in each worker.
+Follow-up reminders are not sent from the API processes at all; run
+reminder_worker.py as its own process.
+
+Settings can be overridden with PORT, WEB_CONCURRENCY, GUNICORN_THREADS and
+GUNICORN_TIMEOUT.
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '7860')}"
+preload_app = True
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is imported, before workers fork
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Froze {gc.get_freeze_count()} objects for copy-on-write sharing with workers")
+
@@ -0,0 +1,283 @@
+"""
+Incremental sync of live patient_history submissions into the population
+datasets.
+
+HistorySync tails the cervical and ovarian history records with a
+collection_group query ordered by their server timestamp, starting from a
+watermark: the newest timestamp already seen, plus the paths of the records
+at exactly that timestamp so boundary records are not counted twice. New
+records are encoded into rows shaped like the cleaned dataset frames and
+handed to the on_rows callback, which appends them to the in-memory frames
+and aggregates.
+
+Synced rows are also appended to a columnar local store: one .npz chunk of
+column arrays per sync pass and condition. At startup the store is replayed
+first, so a restart only fetches what arrived since the last chunk. Several
+processes may sync at once; the one holding the store's writer lock writes
+the chunks, the others only update their own memory.
+
+Each process keeps two watermarks per condition: what it has applied to its
+own memory, and (while it is the writer) what the store holds. The store
+watermark is read from the chunks when a process becomes the writer and only
+advances past rows that were actually written, so a writer taking over from
+one that died stores exactly the rows missing from the store, whatever its
+own memory already holds. Rows are applied to memory before they are
+persisted.
+
+Firestore needs a collection-group index on timestamp for the "cervical" and
+"ovarian" collection groups.
+"""
+
+import fcntl
+import glob
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from artifacts import cervical_features, ovarian_features
+
+logger = logging.getLogger(__name__)
+
+SYMPTOMS = ["Pelvic Pain", "Bloating", "Nausea", "Fatigue", "Irregular Periods"]
+META_COLUMNS = ["_doc", "_timestamp"]
+
+
+def _codes(values, encoder):
+    lookup = {label: code for code, label in enumerate(encoder.classes_)}
+    return np.array([lookup.get(value, -1) for value in values], dtype=np.int64)
+
+
+def cervical_rows(records, encoders):
+    """Encoded frame (cleaned-dataset columns) for cervical history records; unencodable records are dropped."""
+    frame = pd.DataFrame({
+        "Patient ID": [r.get("_doc", "") for r in records],
+        "Age": pd.to_numeric([r.get("age") for r in records], errors="coerce"),
+        "Sexual Partners": pd.to_numeric([r.get("sexual_partners") for r in records], errors="coerce"),
+        "First Sexual Activity Age": pd.to_numeric([r.get("first_sexual_activity_age") for r in records], errors="coerce"),
+        "HPV Test Result": _codes([r.get("hpv_result") for r in records], encoders["le_hpv"]),
+        "Pap Smear Result": _codes([r.get("pap_smear_result") for r in records], encoders["le_pap"]),
+        "Smoking Status": _codes([r.get("smoking_status") for r in records], encoders["le_smoking"]),
+        "STDs History": _codes([r.get("stds_history") for r in records], encoders["le_std"]),
+        "Region": [str(r.get("region") or "").title() for r in records],
+        "Insurance Covered": _codes([r.get("insurance_covered") for r in records], encoders["le_insurance"]),
+        "Screening Type Last": _codes([r.get("screening_type_last") for r in records], encoders["le_screening"]),
+        "Recommended Action": _codes([r.get("recommended_action") for r in records], encoders["le_action"])
+    })
+    valid = frame[cervical_features].notna().all(axis=1) & (frame[cervical_features] >= 0).all(axis=1)
+    return frame[valid.to_numpy()].reset_index(drop=True), valid.to_numpy()
+
+
+def ovarian_rows(records, encoders):
+    """Encoded frame (cleaned-dataset columns) for ovarian history records; unencodable records are dropped."""
+    symptom_sets = [{str(s).lower() for s in (r.get("symptoms") or [])} for r in records]
+    frame = pd.DataFrame({
+        "Patient ID": [r.get("_doc", "") for r in records],
+        "Age": pd.to_numeric([r.get("age") for r in records], errors="coerce"),
+        "Menopause Status": _codes([r.get("menopause_status") for r in records], encoders["le_menopause"]),
+        "Cyst Size cm": pd.to_numeric([r.get("cyst_size") for r in records], errors="coerce"),
+        "Cyst Growth Rate cm/month": pd.to_numeric([r.get("cyst_growth_rate") for r in records], errors="coerce"),
+        "CA 125 Level": pd.to_numeric([r.get("ca125_level") for r in records], errors="coerce"),
+        "Ultrasound Features": _codes([r.get("ultrasound_features") for r in records], encoders["le_ultrasound"]),
+        "Reported Symptoms": [", ".join(r.get("symptoms") or []) for r in records],
+        "Recommended Management": _codes([r.get("recommended_management") for r in records], encoders["le_management"]),
+        "Date of Exam": [str(r.get("date") or "") for r in records],
+        "Region": [str(r.get("region") or "").title() for r in records],
+        **{symptom: np.array([int(symptom.lower() in s) for s in symptom_sets], dtype=np.int64) for symptom in SYMPTOMS}
+    })
+    valid = frame[ovarian_features].notna().all(axis=1) & (frame[["Menopause Status", "Recommended Management"]] >= 0).all(axis=1)
+    return frame[valid.to_numpy()].reset_index(drop=True), valid.to_numpy()
+
+
+ROW_BUILDERS = {"cervical": cervical_rows, "ovarian": ovarian_rows}
+
+
+class ChunkStore:
+    """Directory of <condition>-<seq>.npz chunks, each holding one column array per frame column."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = None
+
+    def acquire_writer(self):
+        """Become the process that writes chunks. Returns True if this process holds the lock."""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(os.path.join(self.path, ".writer.lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def chunks(self, condition):
+        return sorted(glob.glob(os.path.join(self.path, f"{condition}-*.npz")))
+
+    def append(self, condition, frame):
+        existing = self.chunks(condition)
+        seq = int(os.path.basename(existing[-1])[len(condition) + 1:-4]) + 1 if existing else 0
+        path = os.path.join(self.path, f"{condition}-{seq:08d}.npz")
+        tmp_path = path[:-4] + ".tmp.npz"
+        arrays = {}
+        for column in frame.columns:
+            values = frame[column].to_numpy()
+            arrays[column] = values.astype(str) if values.dtype == object else values
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        return path
+
+    def watermark(self, condition):
+        """(newest stored timestamp, docs stored at it) for a condition; (None, set()) for an empty store."""
+        newest, docs = None, set()
+        for path in self.chunks(condition):
+            with np.load(path, allow_pickle=False) as chunk:
+                timestamps, paths = chunk["_timestamp"], chunk["_doc"]
+            if not len(timestamps):
+                continue
+            chunk_newest = timestamps.max()
+            if newest is None or chunk_newest > newest:
+                newest, docs = float(chunk_newest), set()
+            if chunk_newest == newest:
+                docs |= set(paths[timestamps == chunk_newest].tolist())
+        return newest, docs
+
+    def load(self, condition):
+        frames = []
+        for path in self.chunks(condition):
+            with np.load(path, allow_pickle=False) as chunk:
+                frames.append(pd.DataFrame({column: chunk[column] for column in chunk.files}))
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def _after(records, watermark):
+    """Records past a (timestamp, docs at that timestamp) watermark."""
+    newest, seen = watermark
+    return [r for r in records
+            if newest is None or r["_timestamp"] > newest or (r["_timestamp"] == newest and r["_doc"] not in seen)]
+
+
+def _advance(watermark, records):
+    """The watermark moved past records (which must all be past it)."""
+    newest = max(r["_timestamp"] for r in records)
+    at_newest = {r["_doc"] for r in records if r["_timestamp"] == newest}
+    if watermark[0] == newest:
+        at_newest |= watermark[1]
+    return newest, at_newest
+
+
+class HistorySync:
+    def __init__(self, db, store, encoders, on_rows, interval=30.0, page_size=500):
+        """on_rows(condition, frame) receives each batch of new encoded rows (frame columns plus _doc/_timestamp)."""
+        self.db = db
+        self.store = store
+        self.encoders = encoders
+        self.on_rows = on_rows
+        self.interval = interval
+        self.page_size = page_size
+        # (newest timestamp, docs at it) applied to this process's memory, and held by the store
+        self.watermarks = {condition: (None, set()) for condition in ROW_BUILDERS}
+        self.stored = {}
+        self.stats = {"passes": 0, "records": 0, "rows": 0, "skipped": 0, "stored_rows": 0, "errors": 0,
+                      "last_sync": None}
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def replay_store(self):
+        """Feed the locally stored rows to on_rows and set the watermarks from them."""
+        for condition in ROW_BUILDERS:
+            frame = self.store.load(condition)
+            if frame is None or not len(frame):
+                continue
+            newest = float(frame["_timestamp"].max())
+            self.on_rows(condition, frame)
+            self.watermarks[condition] = (newest, set(frame.loc[frame["_timestamp"] == newest, "_doc"]))
+            logger.info(f"Replayed {len(frame)} synced {condition} history rows from {self.store.path}")
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._run, name="history-sync", daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            try:
+                self.sync_once()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error syncing patient history: {e}")
+            time.sleep(self.interval)
+
+    def _fetch(self, condition, since):
+        """Every record with a timestamp at or after since (a POSIX timestamp, or None for all)."""
+        query = self.db.collection_group(condition)
+        if since is not None:
+            query = query.where("timestamp", ">=", datetime.fromtimestamp(since, timezone.utc))
+        query = query.order_by("timestamp").limit(self.page_size)
+        records, last = [], None
+        while True:
+            page = (query.start_after(last) if last is not None else query).get()
+            for snapshot in page:
+                data = snapshot.to_dict()
+                timestamp = data.get("timestamp")
+                if timestamp is None:
+                    continue
+                data["_doc"] = str(snapshot.reference.path)
+                data["_timestamp"] = timestamp.timestamp()
+                records.append(data)
+            if len(page) < self.page_size:
+                return records
+            last = page[-1]
+
+    def _frame(self, condition, records):
+        frame, valid = ROW_BUILDERS[condition](records, self.encoders)
+        frame["_doc"] = np.array([r["_doc"] for r in records])[valid]
+        frame["_timestamp"] = np.array([r["_timestamp"] for r in records], dtype=float)[valid]
+        return frame
+
+    def sync_once(self):
+        """Fetch and apply everything newer than the watermarks. Returns {condition: rows added}."""
+        with self._sync_lock:
+            added = {}
+            writer = self.store.acquire_writer()
+            for condition in ROW_BUILDERS:
+                applied = self.watermarks[condition]
+                if writer and condition not in self.stored:
+                    self.stored[condition] = self.store.watermark(condition)
+                stored = self.stored[condition] if writer else applied
+                starts = [applied[0], stored[0]]
+                records = self._fetch(condition, None if None in starts else min(starts))
+                new = _after(records, applied)
+                unstored = _after(records, stored) if writer else []
+                if not new and not unstored:
+                    continue
+                docs = {r["_doc"] for r in new} | {r["_doc"] for r in unstored}
+                frame = self._frame(condition, [r for r in records if r["_doc"] in docs])
+                if new:
+                    rows = frame[frame["_doc"].isin({r["_doc"] for r in new})].reset_index(drop=True)
+                    if len(rows):
+                        self.on_rows(condition, rows)
+                    self.watermarks[condition] = _advance(applied, new)
+                    self.stats["records"] += len(new)
+                    self.stats["rows"] += len(rows)
+                    self.stats["skipped"] += len(new) - len(rows)
+                    added[condition] = len(rows)
+                if unstored:
+                    rows = frame[frame["_doc"].isin({r["_doc"] for r in unstored})].reset_index(drop=True)
+                    if len(rows):
+                        self.store.append(condition, rows)
+                    self.stored[condition] = _advance(stored, unstored)
+                    self.stats["stored_rows"] += len(rows)
+            self.stats["passes"] += 1
+            self.stats["last_sync"] = time.time()
+            return added
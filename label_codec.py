@@ -0,0 +1,167 @@
+"""
+Lookup-table encoding and decoding for the fitted LabelEncoders.
+
+LabelEncoder.transform / inverse_transform run sklearn's input validation on
+every call, which dominates when they are called once per field per record.
+LabelCodec precomputes both directions from the encoder's classes_: an array
+of labels indexed by code, and a dict from label to code. Whole columns are
+converted with dict/array lookups, and only values that miss the tables
+(numeric strings, out-of-range codes) take the slow path.
+
+Patient history records hold the label for each encoded field, but older
+records may hold the integer code instead; decode_records() turns every
+such field back into its label, one column at a time across all records.
+
+Run ``python label_codec.py`` to compare decode_records() with the
+per-record inverse_transform loop on a synthetic history.
+"""
+
+import argparse
+import logging
+import random
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Encoded fields of the patient_history records, by subcollection
+HISTORY_ENCODED_FIELDS = {
+    "cervical": {
+        "hpv_result": "le_hpv",
+        "pap_smear_result": "le_pap",
+        "smoking_status": "le_smoking",
+        "stds_history": "le_std",
+        "insurance_covered": "le_insurance",
+        "screening_type_last": "le_screening",
+        "recommended_action": "le_action"
+    },
+    "ovarian": {
+        "menopause_status": "le_menopause",
+        "ultrasound_features": "le_ultrasound",
+        "recommended_management": "le_management"
+    }
+}
+
+_MISSING = object()
+
+
+class LabelCodec:
+    def __init__(self, classes):
+        self.labels = np.asarray(classes, dtype=object)
+        self.codes = {label: code for code, label in enumerate(self.labels)}
+        # Labels decode to themselves; integer codes (and equal floats/NumPy ints) to their label
+        self._decode_table = {**{code: label for code, label in enumerate(self.labels)},
+                              **{label: label for label in self.labels}}
+
+    def encode(self, values):
+        """Integer codes for a column of labels; unknown labels get -1."""
+        return np.fromiter((self.codes.get(value, -1) for value in values), dtype=np.int64, count=len(values))
+
+    def decode_column(self, values):
+        """
+        Decode a column whose entries are labels, integer codes or None.
+        Returns (decoded values, indices that could not be decoded); those
+        entries are returned as strings and None stays None.
+        """
+        decoded = []
+        failed = []
+        for i, value in enumerate(values):
+            try:
+                label = self._decode_table.get(value, _MISSING)
+            except TypeError:  # unhashable
+                label = _MISSING
+            if label is _MISSING and value is not None:
+                try:
+                    code = int(value)
+                    label = self.labels[code] if 0 <= code < len(self.labels) else _MISSING
+                except (TypeError, ValueError):
+                    pass
+                if label is _MISSING:
+                    failed.append(i)
+                    label = str(value)
+            decoded.append(value if value is None else label)
+        return decoded, failed
+
+
+def build_codecs(encoders):
+    """LabelCodec for every LabelEncoder in an {name: encoder} dict."""
+    return {name: LabelCodec(encoder.classes_) for name, encoder in encoders.items()}
+
+
+def decode_records(records, fields, codecs):
+    """
+    Replace the encoded fields ({field: encoder name}) of record dicts with
+    their labels, in place. Returns [(record index, field, value)] for the
+    values that could not be decoded.
+    """
+    errors = []
+    for field, encoder_name in fields.items():
+        present = [i for i, record in enumerate(records) if field in record]
+        if not present:
+            continue
+        values = [records[i][field] for i in present]
+        decoded, failed = codecs[encoder_name].decode_column(values)
+        for i, label in zip(present, decoded):
+            records[i][field] = label
+        errors.extend((present[j], field, values[j]) for j in failed)
+    return errors
+
+
+def _decode_one_by_one(records, fields, encoders):
+    """The per-record inverse_transform loop decode_records replaces."""
+    for data in records:
+        for key, encoder_name in fields.items():
+            encoder = encoders[encoder_name]
+            if key in data and data[key] is not None:
+                try:
+                    if isinstance(data[key], str) and data[key] in encoder.classes_:
+                        continue
+                    data[key] = encoder.inverse_transform([int(data[key])])[0]
+                except (ValueError, IndexError, AttributeError):
+                    data[key] = str(data[key])
+
+
+def main():
+    from artifacts import load_bundle
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark column-wise label decoding against inverse_transform.")
+    parser.add_argument("--artifact-dir", default="data/artifacts")
+    parser.add_argument("--version", default=None)
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--encoded-share", type=float, default=0.3,
+                        help="share of fields stored as integer codes, as in older records")
+    args = parser.parse_args()
+
+    encoders = load_bundle(args.artifact_dir, args.version).encoders
+    codecs = build_codecs(encoders)
+    rng = random.Random(0)
+    for condition, fields in HISTORY_ENCODED_FIELDS.items():
+        records = []
+        for _ in range(args.records):
+            record = {}
+            for field, encoder_name in fields.items():
+                code = rng.randrange(len(encoders[encoder_name].classes_))
+                record[field] = code if rng.random() < args.encoded_share else str(encoders[encoder_name].classes_[code])
+            records.append(record)
+
+        expected = [dict(record) for record in records]
+        started = time.perf_counter()
+        _decode_one_by_one(expected, fields, encoders)
+        loop_time = time.perf_counter() - started
+
+        actual = [dict(record) for record in records]
+        started = time.perf_counter()
+        decode_records(actual, fields, codecs)
+        column_time = time.perf_counter() - started
+
+        if actual != expected:
+            raise AssertionError(f"{condition}: column-wise decoding differs from inverse_transform")
+        logger.info(f"{condition}: {args.records} records x {len(fields)} fields, inverse_transform loop "
+                    f"{loop_time * 1000:.1f} ms, column-wise lookup {column_time * 1000:.1f} ms "
+                    f"({loop_time / column_time:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Prebuilt in-memory indexes over the cost and inventory sheets.
+
+CostIndex answers /cost with one dict lookup on (region, service, category).
+InventoryIndex answers /inventory from per-region row lists plus a trigram
+inverted index over item names, so a substring search only verifies the rows
+that share every trigram with the query instead of scanning the whole sheet.
+
+ReloadingIndex rebuilds an index when its CSV changes on disk and swaps it in
+with a single reference assignment, so readers always see either the old or
+the new index in full.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_COLUMNS = ['Region', 'Facility', 'Item', 'Available Stock', 'Cost (KES)']
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CostIndex:
+    def __init__(self, frame):
+        self.rows = {}
+        for row in frame.to_dict(orient='records'):
+            # Keep the first row per key, as the old filter + iloc[0] did
+            self.rows.setdefault((row['Region'], row['Service'], row['Category']), row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lookup(self, region, service, category):
+        return self.rows.get((region, service, category))
+
+
+class InventoryIndex:
+    def __init__(self, frame):
+        self.records = frame[INVENTORY_COLUMNS].to_dict(orient='records')
+        self.items = [str(item).lower() for item in frame['Item']]
+        self.by_region = {}
+        self.trigrams = {}
+        for position, (record, item) in enumerate(zip(self.records, self.items)):
+            region = str(record['Region']).title()
+            self.by_region.setdefault(region, []).append(position)
+            for gram in _trigrams(item):
+                self.trigrams.setdefault((region, gram), []).append(position)
+                self.trigrams.setdefault((None, gram), []).append(position)
+
+    def __len__(self):
+        return len(self.records)
+
+    def search(self, region='', item=''):
+        """
+        Rows in sheet order whose region equals region (title case) and whose
+        item name contains item (lower case). Empty arguments do not filter.
+        """
+        region_key = region or None
+        if region_key is not None and region_key not in self.by_region:
+            return []
+        if len(item) >= 3:
+            postings = [self.trigrams.get((region_key, gram), ()) for gram in _trigrams(item)]
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates.intersection_update(posting)
+                if not candidates:
+                    return []
+            positions = sorted(candidates)
+        else:
+            positions = self.by_region[region_key] if region_key is not None else range(len(self.records))
+        if item:
+            positions = [p for p in positions if item in self.items[p]]
+        return [self.records[p] for p in positions]
+
+
+class ReloadingIndex:
+    """
+    Holds an index built from a CSV file and rebuilds it when the file's
+    modification time changes. The file is checked at most once every
+    check_interval seconds; a failed rebuild keeps serving the previous index.
+    """
+
+    def __init__(self, path, builder, frame=None, check_interval=5.0):
+        self.path = path
+        self.builder = builder
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = self._stat()
+        self._checked_at = time.monotonic()
+        self._index = builder(frame if frame is not None else pd.read_csv(path))
+        self.reloads = 0
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval and self._lock.acquire(blocking=False):
+            try:
+                self._checked_at = now
+                mtime = self._stat()
+                if mtime is not None and mtime != self._mtime:
+                    self._index = self.builder(pd.read_csv(self.path))
+                    self._mtime = mtime
+                    self.reloads += 1
+                    logger.info(f"Reloaded {self.builder.__name__} from {self.path}")
+            except Exception as e:
+                logger.error(f"Error reloading {self.builder.__name__} from {self.path}, keeping previous index: {e}")
+            finally:
+                self._lock.release()
+        return self._index
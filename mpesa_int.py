@@ -1,8 +1,12 @@
 from flask import Flask, request, jsonify
 import requests
+from requests.adapters import HTTPAdapter
 import base64
 from datetime import datetime
-import json
+import os
+import threading
+import time
+from mpesa_payments import CallbackJournal, PaymentStore, PaymentProcessor
 
 app = Flask(__name__)
 
@@ -18,38 +22,156 @@ CALLBACK_URL = "https://httpbin.org/post"  # Dummy URL for testing
 TOKEN_URL = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
 STK_PUSH_URL = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
 
-def get_access_token():
-    """Generate access token for M-Pesa API"""
-    try:
-        # Check if credentials are set
-        if CONSUMER_KEY == "YOUR_ACTUAL_CONSUMER_KEY" or CONSUMER_SECRET == "YOUR_ACTUAL_CONSUMER_SECRET":
+class CircuitOpenError(Exception):
+    """Raised instead of calling M-Pesa while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for
+    reset_timeout seconds. The first call after that is let through as a
+    trial; success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half_open" and self._trial_running):
+                raise CircuitOpenError("M-Pesa is unavailable, try again shortly")
+            if state == "half_open":
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class MpesaClient:
+    """
+    Daraja API client. The OAuth access token is cached and refreshed shortly
+    before it expires; a lock makes concurrent requests wait for one refresh
+    instead of each fetching their own token. All calls share one pooled
+    session with explicit connect/read timeouts and go through a circuit
+    breaker.
+    """
+
+    def __init__(self, consumer_key, consumer_secret, token_url=TOKEN_URL, stk_push_url=STK_PUSH_URL,
+                 timeout=(3.05, 15), refresh_margin=60, pool_size=10, breaker=None):
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.token_url = token_url
+        self.stk_push_url = stk_push_url
+        self.timeout = timeout
+        self.refresh_margin = refresh_margin
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    def _request(self, method, url, **kwargs):
+        self.breaker.before_call()
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _fetch_token(self):
+        if self.consumer_key == "YOUR_ACTUAL_CONSUMER_KEY" or self.consumer_secret == "YOUR_ACTUAL_CONSUMER_SECRET":
             print("ERROR: Please replace CONSUMER_KEY and CONSUMER_SECRET with your actual credentials!")
             return None
-            
-        # Encode consumer key and secret
-        credentials = f"{CONSUMER_KEY}:{CONSUMER_SECRET}"
-        encoded_credentials = base64.b64encode(credentials.encode()).decode()
-        
-        headers = {
+        encoded_credentials = base64.b64encode(f"{self.consumer_key}:{self.consumer_secret}".encode()).decode()
+        print("Requesting access token...")
+        response = self._request("GET", self.token_url, headers={
             'Authorization': f'Basic {encoded_credentials}',
             'Content-Type': 'application/json'
-        }
-        
-        print(f"Requesting access token...")
-        response = requests.get(TOKEN_URL, headers=headers)
+        })
         print(f"Token response status: {response.status_code}")
-        
-        if response.status_code == 200:
-            token_data = response.json()
-            print("Access token obtained successfully!")
-            return token_data.get('access_token')
-        else:
+        if response.status_code != 200:
             print(f"Token request failed: {response.text}")
             return None
-            
-    except Exception as e:
-        print(f"Error getting access token: {e}")
-        return None
+        token_data = response.json()
+        self._token = token_data.get('access_token')
+        self._token_expires_at = time.monotonic() + int(token_data.get('expires_in', 3599)) - self.refresh_margin
+        return self._token
+
+    def get_access_token(self):
+        """Cached access token, refreshed by one caller when it is about to expire"""
+        if self._token and time.monotonic() < self._token_expires_at:
+            return self._token
+        with self._token_lock:
+            if self._token and time.monotonic() < self._token_expires_at:
+                return self._token
+            return self._fetch_token()
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+            self._token_expires_at = 0.0
+
+    def stk_push(self, payload):
+        """Send an STK push request. Returns the response, or None if no access token could be obtained."""
+        for attempt in range(2):
+            access_token = self.get_access_token()
+            if not access_token:
+                return None
+            response = self._request("POST", self.stk_push_url, json=payload, headers={
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json'
+            })
+            # A token revoked before its expiry is fetched again once
+            if response.status_code != 401 or attempt:
+                return response
+            self.invalidate_token()
+
+
+mpesa_client = MpesaClient(CONSUMER_KEY, CONSUMER_SECRET)
+
+# Callbacks are journaled and acknowledged at once, then applied to the payments table in the background
+MPESA_DATA_DIR = os.environ.get("MPESA_DATA_DIR", os.path.abspath("data"))
+callback_journal = CallbackJournal(os.path.join(MPESA_DATA_DIR, "mpesa_callbacks.jsonl"))
+payment_store = PaymentStore(os.path.join(MPESA_DATA_DIR, "payments.db"))
+payment_processor = PaymentProcessor(callback_journal, payment_store)
+
+@app.before_request
+def start_payment_processor():
+    # Started per process (after any fork) so a journal left unprocessed by a
+    # restart is applied without waiting for the next callback
+    payment_processor.start()
 
 def generate_password():
     """Generate password for STK push"""
@@ -87,23 +209,9 @@ def initiate_payment():
         elif not phone_number.startswith('254'):
             phone_number = '254' + phone_number
         
-        # Get access token
-        access_token = get_access_token()
-        if not access_token:
-            return jsonify({
-                'success': False,
-                'message': 'Failed to get access token'
-            }), 500
-        
         # Generate password and timestamp
         password, timestamp = generate_password()
         
-        # Prepare STK push request
-        stk_headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
         stk_payload = {
             "BusinessShortCode": BUSINESS_SHORT_CODE,
             "Password": password,
@@ -118,10 +226,26 @@ def initiate_payment():
             "TransactionDesc": transaction_desc
         }
         
-        # Send STK push request with timeout and better error handling
+        # Send STK push request (cached token, pooled connection, timeouts)
         print(f"Sending STK push to {phone_number} for KES {amount}...")
         
-        response = requests.post(STK_PUSH_URL, json=stk_payload, headers=stk_headers, timeout=30)
+        try:
+            response = mpesa_client.stk_push(stk_payload)
+        except CircuitOpenError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 503
+        except requests.RequestException as e:
+            return jsonify({
+                'success': False,
+                'message': f'M-Pesa request failed: {e}'
+            }), 504
+        if response is None:
+            return jsonify({
+                'success': False,
+                'message': 'Failed to get access token'
+            }), 500
         
         print(f"STK push response status: {response.status_code}")
         print(f"STK push response: {response.text}")
@@ -130,6 +254,8 @@ def initiate_payment():
             response_data = response.json()
             
             if response_data.get('ResponseCode') == '0':
+                payment_store.record_request(response_data.get('CheckoutRequestID'), response_data.get('MerchantRequestID'),
+                                             phone_number, amount, account_reference)
                 return jsonify({
                     'success': True,
                     'message': 'STK push sent successfully',
@@ -158,35 +284,41 @@ def initiate_payment():
 
 @app.route('/mpesa/callback', methods=['POST'])
 def callback():
-    """Handle M-Pesa callback"""
+    """Handle M-Pesa callback: journal it durably, acknowledge, process asynchronously"""
     try:
-        callback_data = request.get_json()
-        
-        # Log the callback data (in production, save to database)
-        print("M-Pesa Callback Data:")
-        print(json.dumps(callback_data, indent=2))
-        
-        # Extract important information
-        stk_callback = callback_data.get('Body', {}).get('stkCallback', {})
-        result_code = stk_callback.get('ResultCode')
-        
-        if result_code == 0:
-            # Payment successful
-            print("Payment was successful!")
-            # Process successful payment here
-            
-        else:
-            # Payment failed
-            print(f"Payment failed with code: {result_code}")
-            # Handle failed payment here
-        
-        # Always return success to M-Pesa
+        callback_data = request.get_json(force=True, silent=True)
+        if callback_data is None:
+            return jsonify({'ResultCode': 1, 'ResultDesc': 'Invalid payload'}), 200
+        callback_journal.append(callback_data)
+        payment_processor.notify()
         return jsonify({'ResultCode': 0, 'ResultDesc': 'Success'}), 200
         
     except Exception as e:
         print(f"Callback error: {e}")
         return jsonify({'ResultCode': 1, 'ResultDesc': 'Error'}), 200
 
+@app.route('/mpesa/payment/<checkout_request_id>', methods=['GET'])
+def payment_status(checkout_request_id):
+    """Payment status from the local payments table (no call to Safaricom)"""
+    payment = payment_store.get(checkout_request_id)
+    if payment is None:
+        return jsonify({
+            'success': False,
+            'message': 'Unknown checkout request id'
+        }), 404
+    return jsonify({
+        'success': True,
+        'checkout_request_id': payment['checkout_request_id'],
+        'status': payment['status'],
+        'result_code': payment['result_code'],
+        'result_desc': payment['result_desc'],
+        'mpesa_receipt_number': payment['mpesa_receipt_number'],
+        'amount': payment['amount'],
+        'phone_number': payment['phone_number'],
+        'transaction_date': payment['transaction_date'],
+        'updated_at': payment['updated_at']
+    }), 200
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Simple health check endpoint"""
@@ -197,5 +329,7 @@ if __name__ == '__main__':
     print("Available endpoints:")
     print("POST /mpesa/payment - Initiate payment")
     print("POST /mpesa/callback - M-Pesa callback")
+    print("GET /mpesa/payment/<checkout_request_id> - Payment status")
     print("GET /health - Health check")
+    payment_processor.start()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,250 @@
+"""
+Durable M-Pesa callback ingestion.
+
+The callback endpoint only appends the raw payload to CallbackJournal (one
+JSON line, written with a single O_APPEND write and fsynced) and acknowledges
+Safaricom. PaymentProcessor tails the journal on a background thread and
+applies each entry to PaymentStore, a SQLite table keyed by
+CheckoutRequestID. The journal offset is committed in the same SQLite
+transaction as the payment update, so after a crash processing resumes
+exactly where it stopped. A duplicate callback for a payment that already
+has a final result is counted and ignored. An entry that cannot be applied
+(the callback endpoint accepts any JSON) is moved to the dead_callbacks
+table so it never holds up the entries behind it.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+
+
+class CallbackJournal:
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def append(self, payload):
+        line = (json.dumps({"received_at": datetime.utcnow().isoformat(), "payload": payload},
+                           separators=(",", ":")) + "\n").encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def read_from(self, offset, max_entries=500):
+        """[(end offset, entry)] for the complete lines after offset."""
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written line; picked up on the next pass
+                offset += len(line)
+                try:
+                    entries.append((offset, json.loads(line)))
+                except ValueError:
+                    logger.error(f"Skipping unreadable journal line ending at offset {offset}")
+                    entries.append((offset, None))
+                if len(entries) >= max_entries:
+                    break
+        return entries
+
+
+class PaymentStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS payments (
+                    checkout_request_id TEXT PRIMARY KEY,
+                    merchant_request_id TEXT,
+                    phone_number TEXT,
+                    amount REAL,
+                    account_reference TEXT,
+                    status TEXT NOT NULL,
+                    result_code INTEGER,
+                    result_desc TEXT,
+                    mpesa_receipt_number TEXT,
+                    transaction_date TEXT,
+                    callback_count INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS journal_offset (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    offset INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO journal_offset (id, offset) VALUES (1, 0);
+                CREATE TABLE IF NOT EXISTS dead_callbacks (
+                    journal_offset INTEGER PRIMARY KEY,
+                    received_at TEXT,
+                    payload TEXT,
+                    error TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                );
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def record_request(self, checkout_request_id, merchant_request_id, phone_number, amount, account_reference):
+        """Register an STK push as pending. If its callback arrived first, only the request details are filled in."""
+        now = datetime.utcnow().isoformat()
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                INSERT INTO payments (checkout_request_id, merchant_request_id, phone_number, amount,
+                                      account_reference, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (checkout_request_id) DO UPDATE SET
+                    phone_number = excluded.phone_number,
+                    amount = excluded.amount,
+                    account_reference = excluded.account_reference
+            """, (checkout_request_id, merchant_request_id, phone_number, amount, account_reference, PENDING, now, now))
+
+    def get(self, checkout_request_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM payments WHERE checkout_request_id = ?", (checkout_request_id,)).fetchone()
+        return dict(row) if row else None
+
+    def apply_journal(self, journal, max_entries=500):
+        """
+        Apply the next journal entries in one transaction. Returns (entries
+        read, applied, duplicates, dead). Only one process advances the
+        offset at a time.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            offset = conn.execute("SELECT offset FROM journal_offset WHERE id = 1").fetchone()[0]
+            entries = journal.read_from(offset, max_entries)
+            applied = duplicates = dead = 0
+            for offset, entry in entries:
+                if entry is None:
+                    continue
+                conn.execute("SAVEPOINT entry")
+                try:
+                    outcome = self._apply(conn, entry)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO entry")
+                    logger.error(f"Dead M-Pesa callback at journal offset {offset}: {e!r}")
+                    conn.execute("""
+                        INSERT OR REPLACE INTO dead_callbacks (journal_offset, received_at, payload, error, created_at)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (offset, entry.get("received_at") if isinstance(entry, dict) else None,
+                          json.dumps(entry.get("payload") if isinstance(entry, dict) else entry, default=str),
+                          repr(e), datetime.utcnow().isoformat()))
+                    outcome = "dead"
+                conn.execute("RELEASE entry")
+                applied += outcome == "applied"
+                duplicates += outcome == "duplicate"
+                dead += outcome == "dead"
+            conn.execute("UPDATE journal_offset SET offset = ? WHERE id = 1", (offset,))
+            conn.execute("COMMIT")
+            return len(entries), applied, duplicates, dead
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _apply(conn, entry):
+        stk_callback = (entry.get("payload") or {}).get("Body", {}).get("stkCallback", {})
+        checkout_request_id = stk_callback.get("CheckoutRequestID")
+        if not checkout_request_id:
+            logger.warning("Journal entry without a CheckoutRequestID, skipping")
+            return "skipped"
+        result_code = stk_callback.get("ResultCode")
+        metadata = {item.get("Name"): item.get("Value")
+                    for item in stk_callback.get("CallbackMetadata", {}).get("Item", [])}
+        status = "completed" if result_code == 0 else "failed"
+        now = datetime.utcnow().isoformat()
+        conn.execute("""
+            INSERT OR IGNORE INTO payments (checkout_request_id, merchant_request_id, phone_number, amount,
+                                            status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (checkout_request_id, stk_callback.get("MerchantRequestID"),
+              str(metadata["PhoneNumber"]) if metadata.get("PhoneNumber") else None,
+              metadata.get("Amount"), PENDING, entry.get("received_at", now), now))
+        updated = conn.execute("""
+            UPDATE payments SET status = ?, result_code = ?, result_desc = ?, mpesa_receipt_number = ?,
+                                transaction_date = ?, callback_count = callback_count + 1, updated_at = ?
+            WHERE checkout_request_id = ? AND status = ?
+        """, (status, result_code, stk_callback.get("ResultDesc"), metadata.get("MpesaReceiptNumber"),
+              str(metadata["TransactionDate"]) if metadata.get("TransactionDate") else None,
+              now, checkout_request_id, PENDING)).rowcount
+        if updated:
+            return "applied"
+        conn.execute("UPDATE payments SET callback_count = callback_count + 1 WHERE checkout_request_id = ?",
+                     (checkout_request_id,))
+        return "duplicate"
+
+
+class PaymentProcessor:
+    """Background thread applying journal entries to the payment store, started lazily per process."""
+
+    def __init__(self, journal, store, poll_interval=1.0):
+        self.journal = journal
+        self.store = store
+        self.poll_interval = poll_interval
+        self.stats = {"applied": 0, "duplicates": 0, "dead": 0, "errors": 0}
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._wakeup = threading.Event()
+                threading.Thread(target=self._run, name="mpesa-callback-processor", daemon=True).start()
+                self._pid = os.getpid()
+
+    def start(self):
+        """Start the processor in this process; it first applies whatever the journal holds."""
+        self._ensure_started()
+
+    def notify(self):
+        self._ensure_started()
+        self._wakeup.set()
+
+    def process_pending(self):
+        """Apply everything currently in the journal. Returns the number of entries applied."""
+        total = 0
+        while True:
+            read, applied, duplicates, dead = self.store.apply_journal(self.journal)
+            self.stats["applied"] += applied
+            self.stats["duplicates"] += duplicates
+            self.stats["dead"] += dead
+            total += applied
+            if not read:
+                return total
+
+    def _run(self):
+        while True:
+            try:
+                self.process_pending()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error processing M-Pesa callbacks: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
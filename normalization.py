@@ -0,0 +1,92 @@
+"""
+Input normalization for free-text categorical fields.
+
+Each field has a frozen lookup table from the lower-cased, stripped spelling to
+its canonical label, so normalizing a value is one dict lookup instead of a
+chain of list membership tests. normalize_series() applies the same tables to
+a whole pandas column for batch scoring and dataset cleaning.
+"""
+
+from types import MappingProxyType
+
+
+def _table(groups):
+    return MappingProxyType({alias: label for label, aliases in groups.items() for alias in aliases})
+
+
+HPV_RESULT = _table({
+    "Negative": ["negative", "neg", "negagtive", "negativee", "n", "no", "-"],
+    "Positive": ["positive", "pos", "possitive", "p", "yes", "+"]
+})
+PAP_RESULT = _table({
+    "Negative": ["negative", "neg", "negagtive", "negativee", "n", "no", "normal"],
+    "Positive": ["positive", "pos", "possitive", "p", "yes", "abnormal", "y"]
+})
+YES_NO = _table({
+    "No": ["no", "n", "false", "0", "negative", "neg"],
+    "Yes": ["yes", "y", "true", "1", "positive", "pos"]
+})
+SCREENING_TYPE = _table({
+    "PAP SMEAR": ["pap smear", "pap", "papsmear", "pap_smear", "paps"],
+    "HPV DNA": ["hpv dna", "hpv", "hpvdna", "hpv_dna", "dna"],
+    "VIA": ["via", "visual inspection", "visual"]
+})
+
+
+def _key(value):
+    return str(value).strip().lower()
+
+
+def normalize_hpv_result(value):
+    key = _key(value)
+    try:
+        return HPV_RESULT[key]
+    except KeyError:
+        raise ValueError(f"Invalid HPV result: {key}") from None
+
+
+def normalize_pap_result(value):
+    key = _key(value)
+    try:
+        return PAP_RESULT[key]
+    except KeyError:
+        raise ValueError(f"Invalid Pap smear result: {key}") from None
+
+
+def normalize_screening_type(value):
+    key = _key(value)
+    try:
+        return SCREENING_TYPE[key]
+    except KeyError:
+        raise ValueError(f"Invalid screening type: {key.upper()}") from None
+
+
+def normalize_yes_no(value, strict=False):
+    """
+    Convert various inputs to "Yes"/"No". Missing or unrecognised values are
+    treated as "No", unless strict is set, in which case they raise ValueError.
+    """
+    if value is None:
+        if strict:
+            raise ValueError("Invalid Yes/No value: None")
+        return "No"
+    key = _key(value)
+    label = YES_NO.get(key)
+    if label is None:
+        if strict:
+            raise ValueError(f"Invalid Yes/No value: {key}")
+        return "No"
+    return label
+
+
+def is_yes(value):
+    """True if value normalizes to "Yes"; use this for conditions, not normalize_yes_no()."""
+    return value is not None and YES_NO.get(_key(value)) == "Yes"
+
+
+def normalize_series(series, table):
+    """
+    Vectorized lookup of a whole column. Unrecognised and missing entries come
+    back as NaN so the caller can reject, default or keep them.
+    """
+    return series.astype(str).str.strip().str.lower().map(table)
@@ -0,0 +1,186 @@
+"""
+Precomputed aggregate cubes for population analytics.
+
+A PopulationCube holds one NumPy count array with an axis per dimension
+(region, age band, test results, CA-125 band, ...). Every record adds one to
+the cell its dimension values select, so any filter/group-by combination is
+answered by indexing and summing that small array instead of scanning the
+patient rows.
+
+The cubes are built from the cleaned datasets at load time and take new
+records incrementally through add_records(); an update builds the new count
+array on the side and swaps it in, so readers never see a half-applied batch.
+Region is the only open-ended dimension: a region seen for the first time
+grows its axis.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class Dimension:
+    """Categorical axis. Values are labels, or (for frames of encoded data) integer codes into labels."""
+
+    def __init__(self, name, column, key, labels=(), growable=False):
+        self.name = name
+        self.column = column  # column in the cleaned frames
+        self.key = key        # field in patient_history records
+        self.labels = list(labels)
+        self.growable = growable
+        self._lookup = {str(label).lower(): i for i, label in enumerate(self.labels)}
+
+    def index(self, label):
+        """Position of a label (case-insensitive), or None."""
+        return self._lookup.get(str(label).strip().lower())
+
+    def code(self, value):
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return -1
+        i = self.index(value)
+        if i is None and self.growable:
+            i = len(self.labels)
+            self.labels.append(value)
+            self._lookup[str(value).strip().lower()] = i
+        return -1 if i is None else i
+
+    def codes(self, values):
+        values = np.asarray(values)
+        if not self.growable and values.dtype.kind in "iu":
+            return np.where((values >= 0) & (values < len(self.labels)), values, -1).astype(np.intp)
+        return np.fromiter((self.code(v) for v in values), dtype=np.intp, count=len(values))
+
+
+class Bands(Dimension):
+    """Numeric axis cut at edges; right=True puts a value equal to an edge in the lower band."""
+
+    def __init__(self, name, column, key, edges, labels, right=False):
+        super().__init__(name, column, key, labels)
+        self.edges = np.asarray(edges, dtype=float)
+        self.right = right
+
+    def codes(self, values):
+        values = pd.to_numeric(pd.Series(np.asarray(values, dtype=object)), errors="coerce").to_numpy(dtype=float)
+        codes = np.digitize(values, self.edges, right=self.right).astype(np.intp)
+        codes[np.isnan(values)] = -1
+        return codes
+
+    def code(self, value):
+        return int(self.codes([value])[0])
+
+
+class PopulationCube:
+    def __init__(self, name, dimensions):
+        self.name = name
+        self.dimensions = list(dimensions)
+        self._by_name = {dim.name: axis for axis, dim in enumerate(self.dimensions)}
+        self.counts = np.zeros([len(dim.labels) for dim in self.dimensions], dtype=np.int64)
+        self.skipped = 0  # records missing a dimension value
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def _add(self, columns):
+        with self._lock:
+            codes = np.stack([dim.codes(values) for dim, values in zip(self.dimensions, columns)])
+            keep = (codes >= 0).all(axis=0)
+            self.skipped += int((~keep).sum())
+            counts = np.zeros([len(dim.labels) for dim in self.dimensions], dtype=np.int64)
+            counts[tuple(slice(0, n) for n in self.counts.shape)] = self.counts
+            np.add.at(counts, tuple(codes[:, keep]), 1)
+            self.counts = counts
+            return int(keep.sum())
+
+    def add_frame(self, frame):
+        """Add every row of a cleaned (encoded) dataset frame. Returns the number of rows counted."""
+        if not len(frame):
+            return 0
+        return self._add([frame[dim.column].to_numpy() for dim in self.dimensions])
+
+    def add_records(self, records):
+        """Add patient_history records (decoded labels, as stored in Firestore). Returns the number counted."""
+        records = list(records)
+        if not records:
+            return 0
+        return self._add([[record.get(dim.key) for record in records] for dim in self.dimensions])
+
+    def query(self, filters=None, group_by=()):
+        """
+        Counts for the records matching filters ({dimension: [labels]}),
+        grouped by the group_by dimensions. Returns {"total", "groups"};
+        groups with a zero count are left out. Unknown dimensions and unknown
+        labels of fixed dimensions raise ValueError; unknown regions match
+        nothing.
+        """
+        filters = filters or {}
+        if len(set(group_by)) != len(group_by):
+            raise ValueError("group_by must not repeat a dimension")
+        for name in list(filters) + list(group_by):
+            if name not in self._by_name:
+                raise ValueError(f"Unknown dimension: {name}. Must be one of {list(self._by_name)}")
+        counts = self.counts
+        selection = []
+        for axis, dim in enumerate(self.dimensions):
+            if dim.name not in filters:
+                selection.append(np.arange(counts.shape[axis]))
+                continue
+            positions = []
+            for label in filters[dim.name]:
+                i = dim.index(label)
+                if i is None and not dim.growable:
+                    raise ValueError(f"Invalid {dim.name}: {label}. Must be one of {dim.labels}")
+                if i is not None and i < counts.shape[axis]:
+                    positions.append(i)
+            selection.append(np.array(sorted(set(positions)), dtype=np.intp))
+        sub = counts[np.ix_(*selection)]
+        group_axes = [self._by_name[name] for name in group_by]
+        summed = sub.sum(axis=tuple(axis for axis in range(sub.ndim) if axis not in group_axes))
+        # summed keeps the grouped axes in cube order; reorder them to group_by order
+        summed = np.transpose(summed, np.argsort(np.argsort(group_axes))) if group_axes else summed
+        groups = []
+        for cell in np.argwhere(summed > 0):
+            group = {name: self.dimensions[axis].labels[selection[axis][i]]
+                     for name, axis, i in zip(group_by, group_axes, cell)}
+            group["count"] = int(summed[tuple(cell)])
+            groups.append(group)
+        return {"total": int(summed.sum()), "groups": groups}
+
+    def count(self, **filters):
+        """Number of records matching filters given as dimension=label or dimension=[labels]."""
+        filters = {name: [value] if isinstance(value, str) else list(value) for name, value in filters.items()}
+        return self.query(filters)["total"]
+
+    def describe(self):
+        return {dim.name: list(dim.labels) for dim in self.dimensions}
+
+
+AGE_BAND_EDGES = [25, 35, 45, 55, 65]
+AGE_BAND_LABELS = ["<25", "25-34", "35-44", "45-54", "55-64", "65+"]
+# CA-125 above 35 U/mL is elevated; upper bounds are inclusive
+CA125_BAND_EDGES = [35, 200]
+CA125_BAND_LABELS = ["<=35", "35-200", ">200"]
+
+
+def cervical_cube(frame, encoders):
+    cube = PopulationCube("cervical", [
+        Dimension("region", "Region", "region", growable=True),
+        Bands("age_band", "Age", "age", AGE_BAND_EDGES, AGE_BAND_LABELS),
+        Dimension("hpv", "HPV Test Result", "hpv_result", encoders["le_hpv"].classes_),
+        Dimension("pap", "Pap Smear Result", "pap_smear_result", encoders["le_pap"].classes_),
+        Dimension("smoking", "Smoking Status", "smoking_status", encoders["le_smoking"].classes_)
+    ])
+    cube.add_frame(frame)
+    return cube
+
+
+def ovarian_cube(frame):
+    cube = PopulationCube("ovarian", [
+        Dimension("region", "Region", "region", growable=True),
+        Bands("age_band", "Age", "age", AGE_BAND_EDGES, AGE_BAND_LABELS),
+        Bands("ca125_band", "CA 125 Level", "ca125_level", CA125_BAND_EDGES, CA125_BAND_LABELS, right=True)
+    ])
+    cube.add_frame(frame)
+    return cube
@@ -0,0 +1,277 @@
+"""
+Follow-up reminder worker.
+
+Runs as its own process, separate from the API server:
+
+    python reminder_worker.py [--at 08:00] [--once]
+
+Any number of replicas may run. Only the replica holding the Firestore lease
+document (leases/reminder_worker) sends reminders; the lease expires if its
+holder stops renewing it, and another replica takes over.
+
+Each daily run reads the due follow-ups, fetches the users' phone numbers in
+bulk with get_all, and hands the messages to sms_dispatch.SmsDispatcher
+(rate-limited, coalesced, retried). Before a message is sent its idempotency
+key (follow-up path + follow-up date) is claimed by creating
+reminder_sends/<key>; a follow-up whose key already exists is skipped, so a
+failover or rerun never messages the same follow-up twice. The claim document
+then records the delivery status. Dead-lettered sends give their claim back
+so the next run retries them; numbers the provider rejects are not retried.
+A claim still "sending" after claim_timeout belongs to a run that died
+before recording its outcome; the next run takes it over and sends the
+reminder (at most one duplicate, if the dead run had already sent it).
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import signal
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import firebase_admin
+import pytz
+import schedule
+from firebase_admin import credentials, firestore
+from google.api_core import exceptions as google_exceptions
+
+from sms_dispatch import AFRICAS_TALKING_URL, DeadLetterStore, SmsDispatcher, SmsMessage
+from write_buffer import FIRESTORE_BATCH_LIMIT
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Africa's Talking credentials (set these in the environment in production)
+AFRICAS_TALKING_USERNAME = os.environ.get("AFRICAS_TALKING_USERNAME", "your_username")
+AFRICAS_TALKING_API_KEY = os.environ.get("AFRICAS_TALKING_API_KEY", "your_api_key")
+
+LEASE_COLLECTION = "leases"
+SENDS_COLLECTION = "reminder_sends"
+GET_ALL_CHUNK = 300
+
+
+class Lease:
+    """
+    Leader lease stored in one Firestore document. acquire() takes a free or
+    expired lease (or renews our own) with a compare-and-swap on the
+    document's update time, so two replicas can never both win.
+    """
+
+    def __init__(self, db, name, holder, ttl=300):
+        self.ref = db.collection(LEASE_COLLECTION).document(name)
+        self.db = db
+        self.holder = holder
+        self.ttl = ttl
+
+    def acquire(self):
+        now = datetime.now(pytz.UTC)
+        lease = {"holder": self.holder, "expires_at": now + timedelta(seconds=self.ttl), "renewed_at": now}
+        try:
+            snapshot = self.ref.get()
+            if not snapshot.exists:
+                self.ref.create(lease)
+                return True
+            current = snapshot.to_dict()
+            if current.get("holder") != self.holder and current.get("expires_at") and current["expires_at"] > now:
+                return False
+            self.ref.update(lease, option=self.db.write_option(last_update_time=snapshot.update_time))
+            return True
+        except (google_exceptions.AlreadyExists, google_exceptions.FailedPrecondition):
+            return False  # another replica got there first
+        except Exception as e:
+            logger.error(f"Error acquiring lease {self.ref.id}: {e}")
+            return False
+
+    def release(self):
+        try:
+            snapshot = self.ref.get()
+            if snapshot.exists and snapshot.to_dict().get("holder") == self.holder:
+                self.ref.update({"expires_at": datetime.now(pytz.UTC)},
+                                option=self.db.write_option(last_update_time=snapshot.update_time))
+        except Exception as e:
+            logger.warning(f"Could not release lease {self.ref.id}: {e}")
+
+
+def idempotency_key(follow_up_path, follow_up_date):
+    return hashlib.sha256(f"{follow_up_path}|{follow_up_date.isoformat()}".encode()).hexdigest()
+
+
+class ReminderWorker:
+    def __init__(self, db, dispatcher, holder, claim_timeout=3600):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.holder = holder
+        self.claim_timeout = claim_timeout
+
+    def fetch_phones(self, user_uids):
+        """{user_uid: phone} for users that exist and have a phone number, read in bulk."""
+        phones = {}
+        user_uids = list(user_uids)
+        for start in range(0, len(user_uids), GET_ALL_CHUNK):
+            refs = [self.db.collection("users").document(uid) for uid in user_uids[start:start + GET_ALL_CHUNK]]
+            for snapshot in self.db.get_all(refs, field_paths=["phone"]):
+                if snapshot.exists and (snapshot.to_dict() or {}).get("phone"):
+                    phones[snapshot.id] = snapshot.to_dict()["phone"]
+        return phones
+
+    def claim(self, key, follow_up_path, user_uid):
+        """
+        Claim a follow-up's idempotency key. False if it was already claimed,
+        unless that claim is still "sending" after claim_timeout, in which case
+        it is taken over with a compare-and-swap on its update time.
+        """
+        ref = self.db.collection(SENDS_COLLECTION).document(key)
+        claim = {
+            "follow_up": follow_up_path,
+            "user_uid": user_uid,
+            "status": "sending",
+            "claimed_by": self.holder,
+            "claimed_at": firestore.SERVER_TIMESTAMP
+        }
+        try:
+            ref.create(claim)
+            return True
+        except google_exceptions.AlreadyExists:
+            pass
+        try:
+            snapshot = ref.get()
+            current = snapshot.to_dict() if snapshot.exists else None
+            if not current or current.get("status") != "sending" or not current.get("claimed_at"):
+                return False
+            if current["claimed_at"] > datetime.now(pytz.UTC) - timedelta(seconds=self.claim_timeout):
+                return False
+            ref.update(dict(claim, reclaimed_from=current.get("claimed_by")),
+                       option=self.db.write_option(last_update_time=snapshot.update_time))
+            logger.warning(f"Reclaimed reminder send {key} left sending by {current.get('claimed_by')}")
+            return True
+        except google_exceptions.FailedPrecondition:
+            return False  # another replica reclaimed it first
+
+    def run_once(self):
+        stats = {"due": 0, "skipped": 0, "sent": 0, "rejected": 0, "dead_lettered": 0, "no_phone": 0}
+        try:
+            follow_ups = self.db.collection_group("follow_ups").where("follow_up_date", "<=", datetime.now() + timedelta(days=1)).get()
+        except Exception as e:
+            logger.error(f"Error reading due follow-ups: {e}")
+            return stats
+        stats["due"] = len(follow_ups)
+        if not follow_ups:
+            return stats
+
+        user_uids = {follow_up.reference.parent.parent.id for follow_up in follow_ups}
+        phones = self.fetch_phones(user_uids)
+
+        pending = {}
+        for follow_up in follow_ups:
+            data = follow_up.to_dict()
+            user_uid = follow_up.reference.parent.parent.id
+            if user_uid not in phones:
+                stats["no_phone"] += 1
+                continue
+            follow_up_path = str(follow_up.reference.path)
+            key = idempotency_key(follow_up_path, data["follow_up_date"])
+            if not self.claim(key, follow_up_path, user_uid):
+                stats["skipped"] += 1
+                continue
+            message = f"Reminder: Your follow-up appointment is scheduled for {data['follow_up_date'].strftime('%Y-%m-%d')}. Action: {data['action']}"
+            pending[key] = (user_uid, SmsMessage(key, phones[user_uid], message))
+
+        results = self.dispatcher.dispatch(message for _, message in pending.values())
+
+        # Two writes per sent reminder (claim update + history record)
+        chunk = FIRESTORE_BATCH_LIMIT // 2
+        for start in range(0, len(results), chunk):
+            batch = self.db.batch()
+            for result in results[start:start + chunk]:
+                stats[result.status] += 1
+                user_uid, message = pending[result.id]
+                claim_ref = self.db.collection(SENDS_COLLECTION).document(result.id)
+                if result.status == "dead_lettered":
+                    batch.delete(claim_ref)  # let the next run retry
+                    continue
+                batch.update(claim_ref, {
+                    "status": result.status,
+                    "provider_message_id": result.provider_message_id,
+                    "cost": result.cost,
+                    "attempts": result.attempts,
+                    "error": result.error,
+                    "sent_at": firestore.SERVER_TIMESTAMP
+                })
+                if result.sent:
+                    batch.set(self.db.collection("patient_history").document(user_uid).collection("reminders").document(), {
+                        "timestamp": firestore.SERVER_TIMESTAMP,
+                        "message": message.text,
+                        "status": "sent",
+                        "idempotency_key": result.id
+                    })
+            try:
+                batch.commit()
+            except Exception as e:
+                logger.error(f"Error recording reminder outcomes: {e}")
+
+        logger.info(f"Reminder run complete: {stats}")
+        return stats
+
+
+def init_db(data_dir):
+    cred = credentials.Certificate(os.path.join(data_dir, "firebase-service-account.json"))
+    firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send follow-up reminders (leader-elected, idempotent).")
+    parser.add_argument("--data-dir", default=os.path.abspath("data"))
+    parser.add_argument("--at", default=os.environ.get("REMINDER_TIME", "08:00"), help="Daily send time (HH:MM)")
+    parser.add_argument("--once", action="store_true", help="Run once now (if leader) and exit")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("REMINDER_CONCURRENCY", 4)))
+    parser.add_argument("--sms-rate", type=float, default=float(os.environ.get("SMS_RATE_PER_SECOND", 10)),
+                        help="Provider quota in recipients per second")
+    parser.add_argument("--lease-ttl", type=int, default=300)
+    parser.add_argument("--claim-timeout", type=int, default=int(os.environ.get("REMINDER_CLAIM_TIMEOUT", 3600)),
+                        help="Seconds after which a claim left 'sending' is taken over; must exceed a run's duration")
+    parser.add_argument("--poll-interval", type=float, default=60.0)
+    args = parser.parse_args()
+
+    db = init_db(args.data_dir)
+    holder = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    lease = Lease(db, "reminder_worker", holder, ttl=args.lease_ttl)
+    dispatcher = SmsDispatcher(AFRICAS_TALKING_USERNAME, AFRICAS_TALKING_API_KEY, url=AFRICAS_TALKING_URL,
+                               rate=args.sms_rate, concurrency=args.concurrency,
+                               dead_letters=DeadLetterStore(os.path.join(args.data_dir, "sms_dead_letters.jsonl")))
+    worker = ReminderWorker(db, dispatcher, holder, claim_timeout=args.claim_timeout)
+
+    if args.once:
+        if lease.acquire():
+            try:
+                worker.run_once()
+            finally:
+                lease.release()
+        else:
+            logger.info("Another replica holds the reminder lease; nothing to do.")
+        return
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    schedule.every().day.at(args.at).do(worker.run_once)
+    logger.info(f"Reminder worker {holder} started; daily run at {args.at}")
+    leader = False
+    while not stop.is_set():
+        is_leader = lease.acquire()
+        if is_leader != leader:
+            logger.info(f"Reminder worker {holder} {'acquired' if is_leader else 'lost'} the lease")
+            leader = is_leader
+        if leader:
+            schedule.run_pending()
+        stop.wait(args.poll_interval)
+    if leader:
+        lease.release()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Background PDF report generation.
+
+A report request is turned into a job and rendered on a worker pool instead
+of inside the HTTP request. Rendered PDFs go to a content-addressed store:
+the job id is the SHA-256 of the report's inputs (owner, patient data,
+recommendation, report date), so a request identical to one already rendered
+is answered from the store without rendering again, and concurrent identical
+requests share one job.
+
+Job state is kept next to the PDFs as small JSON files written atomically, so
+any worker process can answer a status poll or stream a PDF rendered by
+another. A job left "running" by a process that died is picked up again once
+it is older than stale_after seconds.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from concurrency import FanOut
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a process already has max_pending report jobs waiting."""
+
+
+def report_key(user_uid, patient_data, recommendation, report_date):
+    payload = json.dumps({"user_uid": user_uid, "patient_data": patient_data, "recommendation": recommendation,
+                          "report_date": report_date}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ReportStore:
+    """<root>/<key[:2]>/<key>.pdf plus <key>.json holding the job state."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key, suffix):
+        return os.path.join(self.root, key[:2], f"{key}{suffix}")
+
+    def pdf_path(self, key):
+        return self._path(key, ".pdf")
+
+    def has_pdf(self, key):
+        return os.path.exists(self.pdf_path(key))
+
+    def _write(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def write_pdf(self, key, render):
+        """render(path) writes the PDF; it is moved into place only once complete."""
+        self._write(self.pdf_path(key), render)
+
+    def read_job(self, key):
+        try:
+            with open(self._path(key, ".json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write_job(self, key, job):
+        def write(path):
+            with open(path, "w") as f:
+                json.dump(job, f)
+        self._write(self._path(key, ".json"), write)
+
+
+class ReportJobs:
+    def __init__(self, store, render, workers=2, max_pending=100, stale_after=300.0):
+        """render(path, user_uid, patient_data, recommendation, report_date) writes one PDF."""
+        self.store = store
+        self.render = render
+        self.max_pending = max_pending
+        self.stale_after = stale_after
+        self.pool = FanOut(max_workers=workers, name="report")
+        self.stats_counts = {"submitted": 0, "cache_hits": 0, "joined": 0, "rendered": 0, "failed": 0, "rejected": 0}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, user_uid, patient_data, recommendation, report_date):
+        """Start (or join, or answer from the store) a report job. Returns the job state."""
+        key = report_key(user_uid, patient_data, recommendation, report_date)
+        with self._lock:
+            job = self.store.read_job(key)
+            if job and job["status"] == DONE and self.store.has_pdf(key):
+                self.stats_counts["cache_hits"] += 1
+                return job
+            if job and job["status"] in (QUEUED, RUNNING) and time.time() - job["updated_at"] < self.stale_after:
+                self.stats_counts["joined"] += 1
+                return job
+            if self._pending >= self.max_pending:
+                self.stats_counts["rejected"] += 1
+                raise QueueFullError("Too many reports are being generated, try again shortly")
+            job = {"job_id": key, "user_uid": user_uid, "status": QUEUED, "error": None,
+                   "created_at": time.time(), "updated_at": time.time()}
+            self.store.write_job(key, job)
+            self._pending += 1
+            self.stats_counts["submitted"] += 1
+        self.pool.submit(self._run, key, job, user_uid, patient_data, recommendation, report_date)
+        return job
+
+    def _set_status(self, key, job, status, error=None):
+        job = dict(job, status=status, error=error, updated_at=time.time())
+        self.store.write_job(key, job)
+        return job
+
+    def _run(self, key, job, user_uid, patient_data, recommendation, report_date):
+        try:
+            job = self._set_status(key, job, RUNNING)
+            self.store.write_pdf(key, lambda path: self.render(path, user_uid, patient_data, recommendation, report_date))
+            self._set_status(key, job, DONE)
+            self.stats_counts["rendered"] += 1
+        except Exception as e:
+            logger.error(f"Error rendering report {key}: {e}")
+            self.stats_counts["failed"] += 1
+            self._set_status(key, job, FAILED, str(e))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id, user_uid):
+        """Job state, or None if there is no such job for this user."""
+        if len(job_id) != 64 or not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        job = self.store.read_job(job_id)
+        if job is None or job["user_uid"] != user_uid:
+            return None
+        return job
+
+    def stats(self):
+        return dict(self.stats_counts, pending=self._pending, workers=self.pool.max_workers)
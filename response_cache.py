@@ -0,0 +1,65 @@
+"""
+HTTP response cache for read-only aggregate endpoints.
+
+Response bodies are memoized per (endpoint, selected query arguments, dataset
+version) and served with a strong ETag and a Cache-Control header. A request
+whose If-None-Match matches the current ETag gets an empty 304. Entries never
+need explicit invalidation: when the datasets change the version changes, so
+new requests miss and old entries age out of the LRU.
+"""
+
+import hashlib
+from functools import wraps
+
+from flask import make_response, request
+
+from ttl_cache import TTLCache
+
+
+class ResponseCache:
+    def __init__(self, version, maxsize=1024, ttl=3600.0, max_age=60):
+        """version is a callable returning the current dataset version."""
+        self.version = version
+        self.max_age = max_age
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.not_modified = 0
+
+    def _key(self, vary):
+        if vary is None:
+            args = tuple(sorted((name, value.strip().lower()) for name, value in request.args.items(multi=True)))
+        else:
+            args = tuple(request.args.get(name, "").strip().lower() for name in vary)
+        return (request.endpoint, args, self.version())
+
+    def _headers(self, response, etag):
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = f"public, max-age={self.max_age}"
+        return response
+
+    def cached(self, vary=()):
+        """
+        Route decorator. vary names the query arguments that select a
+        different response; None keys on every query argument.
+        """
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                key = self._key(vary)
+                entry = self.entries.get(key)
+                if entry is None:
+                    response = make_response(f(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    entry = (body, response.mimetype, hashlib.sha256(body).hexdigest()[:32])
+                    self.entries.set(key, entry)
+                body, mimetype, etag = entry
+                if request.if_none_match.contains(etag):
+                    self.not_modified += 1
+                    return self._headers(make_response("", 304), etag)
+                return self._headers(make_response(body, 200, {"Content-Type": mimetype}), etag)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return dict(self.entries.stats(), not_modified=self.not_modified, max_age_seconds=self.max_age)
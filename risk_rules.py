@@ -0,0 +1,347 @@
+"""
+Declarative risk scoring rules.
+
+The cervical cancer and ovarian cyst risk scores are sums of points awarded by
+independent rules (age bands, yes/no risk factors, lifestyle choices, screening
+recency, symptoms), clamped to 0-100. Each rule here can evaluate one nested
+request dict or a whole DataFrame column-wise, so the same table scores a
+single assessment or rescores a cohort in one vectorized pass.
+
+Frames use either the dotted column names produced by pd.json_normalize() on
+request payloads ("patient_info.age") or, with flat=True, the flat field names
+stored on patient_history risk records ("age").
+"""
+
+import operator
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+from normalization import normalize_yes_no
+
+_OPS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "between": lambda x, bounds: (x >= bounds[0]) & (x <= bounds[1])
+}
+
+
+def _get(data, path, default=None):
+    value = data
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return default
+        value = value.get(part)
+        if value is None:
+            return default
+    return value
+
+
+def _map_unique(series, func, missing):
+    """Apply func once per distinct value of series; answers are broadcast back by code."""
+    codes, uniques = pd.factorize(series)
+    lookup = np.array([func(value) for value in uniques] + [missing])
+    return lookup[codes]  # code -1 (missing) picks the trailing entry
+
+
+def _flag_set(value):
+    # The scorers have always tested `if normalize_yes_no(value)`, which holds for
+    # every answer ("No" is a non-empty string); the tables keep that behaviour.
+    return bool(normalize_yes_no(value))
+
+
+def _flag_mask(series):
+    return _map_unique(series, _flag_set, _flag_set(None)).astype(bool)
+
+
+class Rule(ABC):
+    """Base class. Subclasses implement score() for a dict and score_columns() for a frame."""
+
+    symptom = False
+
+    @abstractmethod
+    def fields(self):
+        """Dotted paths of the fields the rule reads."""
+
+    @abstractmethod
+    def score(self, data):
+        """Points for one nested request dict."""
+
+    @abstractmethod
+    def score_columns(self, columns, n):
+        """Points for n rows, given {field: column} for the rule's fields."""
+
+
+class Bands(Rule):
+    """First matching (op, threshold, points) band on a numeric field."""
+
+    def __init__(self, field, bands):
+        self.field = field
+        self.bands = bands
+
+    def fields(self):
+        return [self.field]
+
+    def score(self, data):
+        value = _get(data, self.field)
+        if value is None:
+            return 0
+        for op, threshold, points in self.bands:
+            if _OPS[op](value, threshold):
+                return points
+        return 0
+
+    def score_columns(self, columns, n):
+        values = pd.to_numeric(columns[self.field], errors="coerce").to_numpy(dtype=float)
+        return np.select([_OPS[op](values, threshold) for op, threshold, _ in self.bands],
+                         [points for _, _, points in self.bands], 0)
+
+
+class Flag(Rule):
+    """Points when a yes/no flag is set (or, with negate, when it is not)."""
+
+    def __init__(self, field, points, negate=False, symptom=False):
+        self.field = field
+        self.points = points
+        self.negate = negate
+        self.symptom = symptom
+
+    def fields(self):
+        return [self.field]
+
+    def score(self, data):
+        return self.points if _flag_set(_get(data, self.field, "No")) != self.negate else 0
+
+    def score_columns(self, columns, n):
+        return np.where(_flag_mask(columns[self.field]) != self.negate, self.points, 0)
+
+
+class ValueRule(Rule):
+    """
+    A rule whose points depend only on one field's value. Frames are scored by
+    evaluating points() once per distinct value in the column.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def fields(self):
+        return [self.field]
+
+    @abstractmethod
+    def points(self, value):
+        """Points for one value of the field (None when it is missing)."""
+
+    def score(self, data):
+        return self.points(_get(data, self.field))
+
+    def score_columns(self, columns, n):
+        return _map_unique(columns[self.field], self.points, self.points(None))
+
+
+class Choice(ValueRule):
+    """Points by lower-cased value of a categorical field."""
+
+    def __init__(self, field, points_by_value, default=""):
+        super().__init__(field)
+        self.points_by_value = {value: points for values, points in points_by_value for value in
+                                ([values] if isinstance(values, str) else values)}
+        self.default = default
+
+    def points(self, value):
+        return self.points_by_value.get(str(self.default if value is None else value).lower(), 0)
+
+
+class Contains(ValueRule):
+    """Points when a free-text field contains all (or any) of the given substrings."""
+
+    def __init__(self, field, substrings, points, require_all=True):
+        super().__init__(field)
+        self.substrings = substrings
+        self.hit_points = points
+        self.require_all = require_all
+
+    def points(self, value):
+        value = "" if value is None else str(value).lower()
+        matches = [s in value for s in self.substrings]
+        return self.hit_points if (all(matches) if self.require_all else any(matches)) else 0
+
+
+class Recency(ValueRule):
+    """
+    Screening recency: "never" scores never_points; "<N> year(s) ..." scores by
+    the first matching (min_years, points) band; an unparsable year count
+    scores unparsable_points.
+    """
+
+    def __init__(self, field, never_points, year_bands, unparsable_points):
+        super().__init__(field)
+        self.never_points = never_points
+        self.year_bands = year_bands
+        self.unparsable_points = unparsable_points
+
+    def points(self, value):
+        value = "" if value is None else str(value).lower()
+        if value == "never":
+            return self.never_points
+        if "year" not in value:
+            return 0
+        try:
+            years = int(value.split()[0])
+        except ValueError:
+            return self.unparsable_points
+        for min_years, points in self.year_bands:
+            if years >= min_years:
+                return points
+        return 0
+
+
+class Interaction(Rule):
+    """Points when every flag in all_of and at least one flag in any_of is set."""
+
+    def __init__(self, all_of, any_of, points):
+        self.all_of = all_of
+        self.any_of = any_of
+        self.points = points
+
+    def fields(self):
+        return self.all_of + self.any_of
+
+    def score(self, data):
+        hit = all(_flag_set(_get(data, f, "No")) for f in self.all_of) and \
+              any(_flag_set(_get(data, f, "No")) for f in self.any_of)
+        return self.points if hit else 0
+
+    def score_columns(self, columns, n):
+        hit = np.logical_and.reduce([_flag_mask(columns[f]) for f in self.all_of]) & \
+              np.logical_or.reduce([_flag_mask(columns[f]) for f in self.any_of])
+        return np.where(hit, self.points, 0)
+
+
+class RuleTable:
+    """A named list of rules whose points are summed and clamped to [floor, cap]."""
+
+    def __init__(self, name, rules, floor=0, cap=100):
+        self.name = name
+        self.rules = rules
+        self.floor = floor
+        self.cap = cap
+
+    def score_parts(self, data):
+        """(risk_score, symptom_score) for one nested request dict."""
+        base = sum(rule.score(data) for rule in self.rules if not rule.symptom)
+        symptoms = sum(rule.score(data) for rule in self.rules if rule.symptom)
+        return max(self.floor, min(base + symptoms, self.cap)), symptoms
+
+    def score(self, data):
+        return self.score_parts(data)[0]
+
+    def _columns(self, frame, flat):
+        columns = {}
+        for rule in self.rules:
+            for field in rule.fields():
+                name = field.rsplit(".", 1)[-1] if flat else field
+                columns[field] = frame[name] if name in frame else pd.Series([None] * len(frame), index=frame.index, dtype=object)
+        return columns
+
+    def score_frame(self, frame, flat=False):
+        """Scores for every row of frame as an int array."""
+        columns = self._columns(frame, flat)
+        total = np.zeros(len(frame), dtype=int)
+        for rule in self.rules:
+            total += np.asarray(rule.score_columns(columns, len(frame)), dtype=int)
+        return np.clip(total, self.floor, self.cap)
+
+    def score_records(self, records):
+        """Scores for a list of nested request dicts."""
+        return self.score_frame(pd.json_normalize(records))
+
+
+LIFESTYLE_EXERCISE = Choice("lifestyle.exercise_frequency", [(("rarely", "never"), 8), ("regularly", -3)])
+LIFESTYLE_DIET = Choice("lifestyle.diet_quality", [("poor", 8), ("excellent", -3)])
+
+CERVICAL_RISK_RULES = RuleTable("cervical_risk", [
+    Bands("patient_info.age", [("between", (25, 29), 12), ("between", (30, 39), 20), ("between", (40, 49), 18),
+                               ("between", (50, 59), 12), (">=", 60, 8)]),
+    Bands("patient_info.sexual_partners", [(">=", 6, 18), (">=", 3, 12), (">=", 2, 8)]),
+    Bands("patient_info.age_first_sex", [("<=", 16, 12), ("<=", 18, 8)]),
+    Flag("patient_info.smoking", 20),
+    Flag("medical_history.family_cancer_history", 12),
+    Flag("medical_history.previous_stds", 15),
+    Flag("medical_history.hiv_status", 25),
+    Flag("medical_history.taking_immune_drugs", 15),
+    Flag("lifestyle.hpv_vaccination", -15),
+    LIFESTYLE_EXERCISE,
+    LIFESTYLE_DIET,
+    Choice("lifestyle.alcohol_consumption", [(("heavy", "excessive"), 10), ("moderate", 3)]),
+    Choice("lifestyle.stress_level", [("high", 8), ("very high", 12)]),
+    Choice("lifestyle.sleep_quality", [("poor", 6), ("very poor", 10)]),
+    Contains("lifestyle.contraceptive_use", ["oral", "long-term"], 5, require_all=True),
+    Recency("medical_history.last_screening", 20, [(5, 15), (3, 10)], 8),
+    Flag("bleeding_symptoms.bleeding_between_periods", 15, symptom=True),
+    Flag("bleeding_symptoms.bleeding_after_sex", 20, symptom=True),
+    Flag("bleeding_symptoms.bleeding_after_menopause", 25, symptom=True),
+    Flag("bleeding_symptoms.periods_heavier_than_before", 12, symptom=True),
+    Flag("bleeding_symptoms.periods_longer_than_before", 12, symptom=True),
+    Flag("other_symptoms.unusual_discharge", 12, symptom=True),
+    Flag("other_symptoms.discharge_smells_bad", 15, symptom=True),
+    Flag("other_symptoms.discharge_color_change", 12, symptom=True),
+    Flag("other_symptoms.pain_during_sex", 15, symptom=True),
+    Flag("other_symptoms.pelvic_pain", 18, symptom=True),
+    Flag("other_symptoms.painful_urination", 10, symptom=True),
+    Flag("other_symptoms.blood_in_urine", 15, symptom=True),
+    Flag("other_symptoms.frequent_urination", 8, symptom=True),
+    Flag("other_symptoms.rectal_bleeding", 20, symptom=True),
+    Flag("other_symptoms.painful_bowel_movements", 15, symptom=True),
+    Flag("general_symptoms.unexplained_weight_loss", 20, symptom=True),
+    Flag("general_symptoms.constant_tiredness", 8, symptom=True),
+    Flag("general_symptoms.leg_swelling", 15, symptom=True),
+    Flag("general_symptoms.back_pain", 12, symptom=True)
+])
+
+OVARIAN_CYSTS_RISK_RULES = RuleTable("ovarian_cysts_risk", [
+    Bands("patient_info.age", [("between", (20, 35), 15), ("between", (36, 45), 12), ("between", (46, 55), 8),
+                               (">", 55, 5)]),
+    Bands("patient_info.menstrual_cycle_length", [(">", 35, 12), ("<", 21, 12)]),
+    Flag("patient_info.menstrual_irregularity", 5),
+    Flag("patient_info.pregnancy_history", 10, negate=True),
+    Flag("patient_info.family_history_ovarian", 12),
+    Flag("medical_history.pcos_diagnosis", 30),
+    Flag("medical_history.endometriosis", 20),
+    Flag("medical_history.previous_ovarian_cysts", 25),
+    Flag("medical_history.hormone_therapy", 10),
+    Flag("medical_history.fertility_treatments", 15),
+    Flag("lifestyle.smoking_status", 10),
+    Choice("lifestyle.weight_status", [(("obese", "overweight"), 12), ("underweight", 8)], default="normal"),
+    LIFESTYLE_EXERCISE,
+    LIFESTYLE_DIET,
+    Choice("lifestyle.stress_level", [("high", 10), ("very high", 15)]),
+    Contains("lifestyle.contraceptive_use", ["oral", "pill"], -8, require_all=False),
+    Recency("medical_history.last_pelvic_exam", 15, [(3, 10), (2, 5)], 5),
+    Flag("pelvic_symptoms.pelvic_pain", 10, symptom=True),
+    Flag("pelvic_symptoms.abdominal_bloating", 8, symptom=True),
+    Flag("pelvic_symptoms.feeling_full_quickly", 8, symptom=True),
+    Flag("pelvic_symptoms.frequent_urination", 8, symptom=True),
+    Flag("pelvic_symptoms.difficulty_emptying_bladder", 8, symptom=True),
+    Flag("pelvic_symptoms.pain_during_sex", 8, symptom=True),
+    Flag("menstrual_symptoms.irregular_periods", 5, symptom=True),
+    Flag("menstrual_symptoms.heavy_periods", 8, symptom=True),
+    Flag("menstrual_symptoms.painful_periods", 6, symptom=True),
+    Flag("menstrual_symptoms.spotting_between_periods", 8, symptom=True),
+    Flag("menstrual_symptoms.missed_periods", 8, symptom=True),
+    Flag("hormonal_symptoms.breast_tenderness", 6, symptom=True),
+    Flag("hormonal_symptoms.mood_changes", 6, symptom=True),
+    Flag("hormonal_symptoms.weight_gain", 6, symptom=True),
+    Flag("hormonal_symptoms.acne_changes", 6, symptom=True),
+    Flag("hormonal_symptoms.hair_growth_changes", 6, symptom=True),
+    Flag("general_symptoms.nausea_vomiting", 8, symptom=True),
+    Flag("general_symptoms.back_pain", 6, symptom=True),
+    Flag("general_symptoms.leg_pain", 6, symptom=True),
+    Flag("general_symptoms.fatigue", 6, symptom=True),
+    Interaction(["medical_history.pcos_diagnosis"],
+                ["menstrual_symptoms.irregular_periods", "pelvic_symptoms.pelvic_pain"], 10)
+])
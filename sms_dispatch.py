@@ -0,0 +1,281 @@
+"""
+Bulk SMS dispatch through the Africa's Talking messaging API.
+
+SmsDispatcher.dispatch() takes a list of SmsMessage and:
+
+- normalises phone numbers to E.164 (stored numbers are as users typed
+  them, while the provider reports recipients in E.164), so per-recipient
+  results are matched on the normalised number; numbers that cannot be
+  normalised are rejected without a send;
+- coalesces messages with identical text into multi-recipient sends (the API
+  accepts a comma-separated "to"), up to max_recipients per request;
+- paces requests with a token bucket matching the provider quota, charging
+  one token per recipient;
+- sends over one shared keep-alive requests.Session from a small thread pool,
+  with connect/read timeouts;
+- retries transport errors, HTTP 429/5xx and retryable per-recipient
+  statuses with exponential backoff and full jitter, re-sending only the
+  recipients that still need it;
+- appends messages that exhausted their retries to a JSONL dead-letter file;
+- returns a DeliveryResult per message (status, provider message id, cost,
+  attempts).
+
+For load tests, start sms_stub_server.py and point the dispatcher at it:
+
+    python sms_stub_server.py --port 8025 &
+    python sms_dispatch.py --url http://127.0.0.1:8025/version1/messaging --messages 5000
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+AFRICAS_TALKING_URL = os.environ.get("AFRICAS_TALKING_URL", "https://api.africastalking.com/version1/messaging")
+
+# Per-recipient statusCode values in the messaging API response
+SENT_CODES = {100, 101, 102}           # Processed, Sent, Queued
+RETRYABLE_CODES = {405, 500, 501, 502}  # InsufficientBalance, InternalServerError, GatewayError, RejectedByGateway
+RETRYABLE_HTTP = {429, 500, 502, 503, 504}
+DEFAULT_COUNTRY_CODE = os.environ.get("SMS_DEFAULT_COUNTRY_CODE", "254")
+
+SmsMessage = namedtuple("SmsMessage", ["id", "phone", "text"])
+
+
+class DeliveryResult(namedtuple("DeliveryResult", ["id", "phone", "status", "provider_message_id", "cost", "attempts", "error"])):
+    """status is "sent", "rejected" (permanent provider refusal) or "dead_lettered"."""
+
+    @property
+    def sent(self):
+        return self.status == "sent"
+
+
+def to_e164(phone, country_code=DEFAULT_COUNTRY_CODE):
+    """
+    "+<country code><number>" for a phone number in international ("+254...",
+    "00254...", "254...") or national ("07...", "7...") form; None if it is
+    not a plausible number.
+    """
+    if phone is None:
+        return None
+    raw = str(phone).strip()
+    digits = "".join(c for c in raw if c.isdigit())
+    if raw.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif digits.startswith(country_code) and len(digits) > 10:
+        pass
+    elif digits.startswith("0"):
+        digits = country_code + digits[1:]
+    else:
+        digits = country_code + digits
+    if not 8 <= len(digits) <= 15 or any(c.isalpha() for c in raw):
+        return None
+    return "+" + digits
+
+
+class TokenBucket:
+    """Blocking token bucket: rate tokens per second, at most capacity banked."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class DeadLetterStore:
+    """Append-only JSONL file of messages that could not be delivered."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, message, attempts, error):
+        record = {"id": message.id, "phone": message.phone, "text": message.text,
+                  "attempts": attempts, "error": error, "failed_at": datetime.utcnow().isoformat()}
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+def make_session(api_key, pool_size=8):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "ApiKey": api_key,
+        "Accept": "application/json",
+        "Content-Type": "application/x-www-form-urlencoded"
+    })
+    return session
+
+
+class SmsDispatcher:
+    def __init__(self, username, api_key, url=AFRICAS_TALKING_URL, rate=10.0, burst=None, max_recipients=100,
+                 concurrency=4, max_attempts=4, base_delay=0.5, max_delay=30.0, timeout=(5, 15),
+                 dead_letters=None, session=None):
+        self.username = username
+        self.url = url
+        self.bucket = TokenBucket(rate, burst if burst is not None else max(rate, 1))
+        self.max_recipients = max(1, min(max_recipients, int(self.bucket.capacity)))
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.dead_letters = dead_letters
+        self.session = session or make_session(api_key, pool_size=concurrency)
+        self._stats_lock = threading.Lock()
+        self.stats = {"messages": 0, "requests": 0, "sent": 0, "rejected": 0, "dead_lettered": 0, "retries": 0}
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def _groups(self, messages):
+        by_text = OrderedDict()
+        for message in messages:
+            by_text.setdefault(message.text, []).append(message)
+        for text, group in by_text.items():
+            for start in range(0, len(group), self.max_recipients):
+                yield text, group[start:start + self.max_recipients]
+
+    def _post(self, text, phones):
+        """
+        One API call to E.164 numbers. Returns ({E.164 number: recipient
+        entry}, error); error is set only for retryable failures.
+        """
+        self.bucket.acquire(len(phones))
+        self._count(requests=1)
+        try:
+            response = self.session.post(self.url, data={
+                "username": self.username,
+                "to": ",".join(phones),
+                "message": text
+            }, timeout=self.timeout)
+        except requests.RequestException as e:
+            return {}, f"transport error: {e}"
+        if response.status_code in RETRYABLE_HTTP:
+            return {}, f"HTTP {response.status_code}"
+        if response.status_code != 201:
+            # Bad request/credentials: every recipient is refused the same way
+            entry = {"statusCode": response.status_code, "status": f"HTTP {response.status_code}"}
+            return {phone: entry for phone in phones}, None
+        try:
+            recipients = response.json()["SMSMessageData"]["Recipients"]
+        except (ValueError, KeyError, TypeError):
+            return {}, "unreadable response"
+        return {to_e164(entry.get("number")): entry for entry in recipients}, None
+
+    def _send_group(self, text, group):
+        results = []
+        numbers = {message.id: to_e164(message.phone) for message in group}
+        for message in group:
+            if numbers[message.id] is None:
+                results.append(DeliveryResult(message.id, message.phone, "rejected", None, None, 0, "invalid phone number"))
+        pending = [message for message in group if numbers[message.id] is not None]
+        attempt = 0
+        error = None
+        while pending:
+            attempt += 1
+            entries, error = self._post(text, list(dict.fromkeys(numbers[message.id] for message in pending)))
+            retry = []
+            for message in pending:
+                entry = entries.get(numbers[message.id])
+                code = entry.get("statusCode") if entry else None
+                if code in SENT_CODES:
+                    results.append(DeliveryResult(message.id, message.phone, "sent", entry.get("messageId"),
+                                                  entry.get("cost"), attempt, None))
+                elif entry is not None and code not in RETRYABLE_CODES:
+                    results.append(DeliveryResult(message.id, message.phone, "rejected", entry.get("messageId"),
+                                                  entry.get("cost"), attempt, entry.get("status")))
+                else:
+                    retry.append(message)
+            if retry and attempt >= self.max_attempts:
+                last_error = error or "retryable provider status"
+                for message in retry:
+                    results.append(DeliveryResult(message.id, message.phone, "dead_lettered", None, None, attempt, last_error))
+                    if self.dead_letters is not None:
+                        self.dead_letters.append(message, attempt, last_error)
+                break
+            if retry:
+                self._count(retries=1)
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))))
+            pending = retry
+        return results
+
+    def dispatch(self, messages):
+        """Send every message; returns a DeliveryResult per message in input order."""
+        messages = list(messages)
+        if not messages:
+            return []
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="sms-dispatch") as pool:
+            futures = [pool.submit(self._send_group, text, group) for text, group in self._groups(messages)]
+            by_id = {result.id: result for future in futures for result in future.result()}
+        results = [by_id[message.id] for message in messages]
+        self._count(messages=len(results),
+                    sent=sum(r.status == "sent" for r in results),
+                    rejected=sum(r.status == "rejected" for r in results),
+                    dead_lettered=sum(r.status == "dead_lettered" for r in results))
+        return results
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Load-test the SMS dispatcher against sms_stub_server.py.")
+    parser.add_argument("--url", default="http://127.0.0.1:8025/version1/messaging")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--distinct-texts", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=500.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--dead-letters", default="data/sms_dead_letters.jsonl")
+    args = parser.parse_args()
+
+    dispatcher = SmsDispatcher("sandbox", "stub-key", url=args.url, rate=args.rate, concurrency=args.concurrency,
+                               dead_letters=DeadLetterStore(args.dead_letters))
+    messages = [SmsMessage(str(i), f"+2547{i:08d}", f"Load test message {i % args.distinct_texts}")
+                for i in range(args.messages)]
+    started = time.perf_counter()
+    results = dispatcher.dispatch(messages)
+    elapsed = time.perf_counter() - started
+    logger.info(f"{len(results)} messages in {elapsed:.2f}s ({len(results) / elapsed:.0f} msg/s): {dispatcher.stats}")
+
+
+if __name__ == "__main__":
+    main()
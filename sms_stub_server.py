@@ -0,0 +1,118 @@
+"""
+Local stand-in for the Africa's Talking messaging endpoint, for load tests.
+
+    python sms_stub_server.py --port 8025 [--latency 0.05] [--fail-rate 0.02] [--rate-limit 200]
+
+POST /version1/messaging answers like the real API (201 with an
+SMSMessageData.Recipients entry per number). It can add latency, fail a
+fraction of recipients with a retryable status, and answer 429 when more
+than rate-limit recipients arrive within one second. GET /stats returns the
+request and recipient counters.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class StubState:
+    def __init__(self, latency, fail_rate, rate_limit):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.stats = {"requests": 0, "recipients": 0, "sent": 0, "failed": 0, "throttled": 0}
+
+    def admit(self, recipients):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1.0:
+                self.window_start, self.window_count = now, 0
+            self.stats["requests"] += 1
+            if self.rate_limit and self.window_count + recipients > self.rate_limit:
+                self.stats["throttled"] += 1
+                return False
+            self.window_count += recipients
+            self.stats["recipients"] += recipients
+            return True
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+    state = None
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.state.lock:
+                self._reply(200, dict(self.state.stats))
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        if self.path != "/version1/messaging":
+            return self._reply(404, {"error": "not found"})
+        if not self.headers.get("ApiKey") or "to" not in form or "message" not in form:
+            return self._reply(400, {"error": "username, to and message are required"})
+        numbers = [n for n in form["to"][0].split(",") if n]
+        if not self.state.admit(len(numbers)):
+            return self._reply(429, {"error": "Too many requests"})
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        recipients = []
+        # Like the real API, recipients are reported in E.164 whatever form they were sent in
+        for number in ("+" + "".join(c for c in n if c.isdigit()) for n in numbers):
+            if random.random() < self.state.fail_rate:
+                recipients.append({"statusCode": 500, "number": number, "status": "InternalServerError",
+                                   "cost": "0", "messageId": "None"})
+            else:
+                recipients.append({"statusCode": 101, "number": number, "status": "Success",
+                                   "cost": "KES 0.8000", "messageId": f"ATXid_{uuid.uuid4().hex}"})
+        sent = sum(r["statusCode"] == 101 for r in recipients)
+        with self.state.lock:
+            self.state.stats["sent"] += sent
+            self.state.stats["failed"] += len(recipients) - sent
+        self._reply(201, {"SMSMessageData": {"Message": f"Sent to {sent}/{len(recipients)}", "Recipients": recipients}})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Africa's Talking SMS endpoint for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every send")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of recipients failed with status 500")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Recipients per second before answering 429 (0 = off)")
+    args = parser.parse_args()
+
+    StubHandler.state = StubState(args.latency, args.fail_rate, args.rate_limit)
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"SMS stub listening on http://{args.host}:{args.port}/version1/messaging")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
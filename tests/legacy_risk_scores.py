@@ -0,0 +1,359 @@
+"""
+The risk scorers that risk_rules.py replaced, copied unchanged from the baseline
+app.py (commit 3d1d4a9): the two if-ladders and the normalize_yes_no() they
+called at runtime, which was the second of app.py's two definitions. test_risk_rules.py checks the rule tables against them.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Helper function - modified to return Yes/No instead of 0/1
+def normalize_yes_no(value):
+    """Convert various inputs to Yes/No format"""
+    if value is None:
+        return "No"
+    value = str(value).strip().lower()
+    return "Yes" if value in ['yes', 'y', '1', 'true'] else "No"
+
+
+def calculate_cervical_risk_score(data):
+    """
+    Calculate cervical cancer risk score based on clinical factors, lifestyle, and symptoms.
+    """
+    risk_score = 0
+    
+    # Age-based risk (cervical cancer peaks in 30s-40s)
+    age = data['patient_info']['age']
+    if 25 <= age <= 29:
+        risk_score += 12
+    elif 30 <= age <= 39:
+        risk_score += 20
+    elif 40 <= age <= 49:
+        risk_score += 18
+    elif 50 <= age <= 59:
+        risk_score += 12
+    elif age >= 60:
+        risk_score += 8
+    
+    # Sexual activity risk factors
+    sexual_partners = data['patient_info']['sexual_partners']
+    if sexual_partners >= 6:
+        risk_score += 18
+    elif sexual_partners >= 3:
+        risk_score += 12
+    elif sexual_partners >= 2:
+        risk_score += 8
+    
+    # Early sexual activity
+    age_first_sex = data['patient_info']['age_first_sex']
+    if age_first_sex <= 16:
+        risk_score += 12
+    elif age_first_sex <= 18:
+        risk_score += 8
+    
+    # Smoking (major risk factor)
+    if normalize_yes_no(data['patient_info']['smoking']):
+        risk_score += 20
+    
+    # Medical history risk factors
+    if normalize_yes_no(data['medical_history']['family_cancer_history']):
+        risk_score += 12
+    
+    if normalize_yes_no(data['medical_history']['previous_stds']):
+        risk_score += 15
+    
+    if normalize_yes_no(data['medical_history']['hiv_status']):
+        risk_score += 25
+    
+    if normalize_yes_no(data['medical_history']['taking_immune_drugs']):
+        risk_score += 15
+    
+    # HPV vaccination (protective factor)
+    if normalize_yes_no(data['lifestyle']['hpv_vaccination']):
+        risk_score -= 15  # Reduces risk significantly
+    
+    # Lifestyle factors
+    exercise_freq = data['lifestyle']['exercise_frequency'].lower()
+    if exercise_freq in ['rarely', 'never']:
+        risk_score += 8
+    elif exercise_freq == 'regularly':
+        risk_score -= 3
+    
+    diet_quality = data['lifestyle']['diet_quality'].lower()
+    if diet_quality == 'poor':
+        risk_score += 8
+    elif diet_quality == 'excellent':
+        risk_score -= 3
+    
+    alcohol_consumption = data['lifestyle']['alcohol_consumption'].lower()
+    if alcohol_consumption in ['heavy', 'excessive']:
+        risk_score += 10
+    elif alcohol_consumption == 'moderate':
+        risk_score += 3
+    
+    stress_level = data['lifestyle']['stress_level'].lower()
+    if stress_level == 'high':
+        risk_score += 8
+    elif stress_level == 'very high':
+        risk_score += 12
+    
+    sleep_quality = data['lifestyle']['sleep_quality'].lower()
+    if sleep_quality == 'poor':
+        risk_score += 6
+    elif sleep_quality == 'very poor':
+        risk_score += 10
+    
+    # Contraceptive use (long-term oral contraceptives slightly increase risk)
+    contraceptive = data['lifestyle']['contraceptive_use'].lower()
+    if 'oral' in contraceptive and 'long-term' in contraceptive:
+        risk_score += 5
+    
+    # Lack of screening (major risk factor)
+    last_screening = data['medical_history']['last_screening'].lower()
+    if last_screening == 'never':
+        risk_score += 20
+    elif 'year' in last_screening:
+        try:
+            years_ago = int(last_screening.split()[0])
+            if years_ago >= 5:
+                risk_score += 15
+            elif years_ago >= 3:
+                risk_score += 10
+        except:
+            risk_score += 8
+    
+    # Symptom-based risk assessment
+    symptom_score = 0
+    
+    # Bleeding symptoms (high concern)
+    bleeding_symptoms = data.get('bleeding_symptoms', {})
+    if normalize_yes_no(bleeding_symptoms.get('bleeding_between_periods', 'No')):
+        symptom_score += 15
+    if normalize_yes_no(bleeding_symptoms.get('bleeding_after_sex', 'No')):
+        symptom_score += 20
+    if normalize_yes_no(bleeding_symptoms.get('bleeding_after_menopause', 'No')):
+        symptom_score += 25
+    if normalize_yes_no(bleeding_symptoms.get('periods_heavier_than_before', 'No')):
+        symptom_score += 12
+    if normalize_yes_no(bleeding_symptoms.get('periods_longer_than_before', 'No')):
+        symptom_score += 12
+    
+    # Discharge symptoms
+    other_symptoms = data.get('other_symptoms', {})
+    if normalize_yes_no(other_symptoms.get('unusual_discharge', 'No')):
+        symptom_score += 12
+    if normalize_yes_no(other_symptoms.get('discharge_smells_bad', 'No')):
+        symptom_score += 15
+    if normalize_yes_no(other_symptoms.get('discharge_color_change', 'No')):
+        symptom_score += 12
+    
+    # Pain symptoms
+    if normalize_yes_no(other_symptoms.get('pain_during_sex', 'No')):
+        symptom_score += 15
+    if normalize_yes_no(other_symptoms.get('pelvic_pain', 'No')):
+        symptom_score += 18
+    
+    # Urinary symptoms
+    if normalize_yes_no(other_symptoms.get('painful_urination', 'No')):
+        symptom_score += 10
+    if normalize_yes_no(other_symptoms.get('blood_in_urine', 'No')):
+        symptom_score += 15
+    if normalize_yes_no(other_symptoms.get('frequent_urination', 'No')):
+        symptom_score += 8
+    
+    # Bowel symptoms
+    if normalize_yes_no(other_symptoms.get('rectal_bleeding', 'No')):
+        symptom_score += 20
+    if normalize_yes_no(other_symptoms.get('painful_bowel_movements', 'No')):
+        symptom_score += 15
+    
+    # General symptoms
+    general_symptoms = data.get('general_symptoms', {})
+    if normalize_yes_no(general_symptoms.get('unexplained_weight_loss', 'No')):
+        symptom_score += 20
+    if normalize_yes_no(general_symptoms.get('constant_tiredness', 'No')):
+        symptom_score += 8
+    if normalize_yes_no(general_symptoms.get('leg_swelling', 'No')):
+        symptom_score += 15
+    if normalize_yes_no(general_symptoms.get('back_pain', 'No')):
+        symptom_score += 12
+    
+    # Add symptom score to risk score
+    risk_score += symptom_score
+    
+    # Ensure risk score is reasonable (not negative, capped at 100)
+    risk_score = max(0, min(risk_score, 100))
+    
+    logger.info(f"Cervical cancer risk calculation: base_risk={risk_score-symptom_score}, symptom_score={symptom_score}, total={risk_score}")
+    
+    return risk_score
+
+
+def calculate_ovarian_cysts_risk_score(data):
+    """
+    Calculate ovarian cysts risk score based on clinical, lifestyle, and symptom factors.
+    Uses weight_status to align with endpoint validation, includes smoking status and PCOS-symptom interactions,
+    with adjusted symptom weights for moderate risk differentiation.
+    """
+    risk_score = 0
+    symptom_score = 0
+    
+    # Age-based risk (ovarian cysts more common in reproductive years)
+    age = data['patient_info']['age']
+    if 20 <= age <= 35:
+        risk_score += 15
+    elif 36 <= age <= 45:
+        risk_score += 12
+    elif 46 <= age <= 55:
+        risk_score += 8
+    elif age > 55:
+        risk_score += 5
+    
+    # Menstrual cycle factors
+    cycle_length = data['patient_info']['menstrual_cycle_length']
+    if cycle_length > 35 or cycle_length < 21:
+        risk_score += 12
+    
+    if normalize_yes_no(data['patient_info']['menstrual_irregularity']):
+        risk_score += 5  # Reduced for moderate risk
+    
+    # Pregnancy history (nulliparity increases risk)
+    if not normalize_yes_no(data['patient_info']['pregnancy_history']):
+        risk_score += 10
+    
+    # Family history
+    if normalize_yes_no(data['patient_info']['family_history_ovarian']):
+        risk_score += 12
+    
+    # Medical history risk factors
+    if normalize_yes_no(data['medical_history']['pcos_diagnosis']):
+        risk_score += 30  # Strong risk factor
+    
+    if normalize_yes_no(data['medical_history']['endometriosis']):
+        risk_score += 20
+    
+    if normalize_yes_no(data['medical_history']['previous_ovarian_cysts']):
+        risk_score += 25  # High recurrence risk
+    
+    if normalize_yes_no(data['medical_history']['hormone_therapy']):
+        risk_score += 10
+    
+    if normalize_yes_no(data['medical_history']['fertility_treatments']):
+        risk_score += 15
+    
+    # Smoking history (increases hormonal disruption risk)
+    smoking_status = data.get('lifestyle', {}).get('smoking_status', 'No')
+    if normalize_yes_no(smoking_status):
+        risk_score += 10
+    
+    # Weight status (aligned with endpoint validation)
+    weight_status = data.get('lifestyle', {}).get('weight_status', 'normal').lower()
+    if weight_status in ['obese', 'overweight']:
+        risk_score += 12
+    elif weight_status == 'underweight':
+        risk_score += 8
+    
+    # Lifestyle factors
+    exercise_freq = data['lifestyle']['exercise_frequency'].lower()
+    if exercise_freq in ['rarely', 'never']:
+        risk_score += 8
+    elif exercise_freq == 'regularly':
+        risk_score -= 3
+    
+    diet_quality = data['lifestyle']['diet_quality'].lower()
+    if diet_quality == 'poor':
+        risk_score += 8
+    elif diet_quality == 'excellent':
+        risk_score -= 3
+    
+    stress_level = data['lifestyle']['stress_level'].lower()
+    if stress_level == 'high':
+        risk_score += 10
+    elif stress_level == 'very high':
+        risk_score += 15
+    
+    # Contraceptive use (oral contraceptives may reduce risk)
+    contraceptive = data['lifestyle']['contraceptive_use'].lower()
+    if 'oral' in contraceptive or 'pill' in contraceptive:
+        risk_score -= 8
+    
+    # Lack of recent screening
+    last_exam = data['medical_history']['last_pelvic_exam'].lower()
+    if last_exam == 'never':
+        risk_score += 15
+    elif 'year' in last_exam:
+        try:
+            years_ago = int(last_exam.split()[0])
+            if years_ago >= 3:
+                risk_score += 10
+            elif years_ago >= 2:
+                risk_score += 5
+        except:
+            risk_score += 5
+    
+    # Symptom-based risk assessment with adjusted weights
+    pelvic_symptoms = data.get('pelvic_symptoms', {})
+    if normalize_yes_no(pelvic_symptoms.get('pelvic_pain', 'No')):
+        symptom_score += 10  # Reduced from 25
+    if normalize_yes_no(pelvic_symptoms.get('abdominal_bloating', 'No')):
+        symptom_score += 8
+    if normalize_yes_no(pelvic_symptoms.get('feeling_full_quickly', 'No')):
+        symptom_score += 8
+    if normalize_yes_no(pelvic_symptoms.get('frequent_urination', 'No')):
+        symptom_score += 8
+    if normalize_yes_no(pelvic_symptoms.get('difficulty_emptying_bladder', 'No')):
+        symptom_score += 8
+    if normalize_yes_no(pelvic_symptoms.get('pain_during_sex', 'No')):
+        symptom_score += 8
+    
+    menstrual_symptoms = data.get('menstrual_symptoms', {})
+    if normalize_yes_no(menstrual_symptoms.get('irregular_periods', 'No')):
+        symptom_score += 5  # Reduced from 20
+    if normalize_yes_no(menstrual_symptoms.get('heavy_periods', 'No')):
+        symptom_score += 8
+    if normalize_yes_no(menstrual_symptoms.get('painful_periods', 'No')):
+        symptom_score += 6
+    if normalize_yes_no(menstrual_symptoms.get('spotting_between_periods', 'No')):
+        symptom_score += 8
+    if normalize_yes_no(menstrual_symptoms.get('missed_periods', 'No')):
+        symptom_score += 8
+    
+    hormonal_symptoms = data.get('hormonal_symptoms', {})
+    if normalize_yes_no(hormonal_symptoms.get('breast_tenderness', 'No')):
+        symptom_score += 6
+    if normalize_yes_no(hormonal_symptoms.get('mood_changes', 'No')):
+        symptom_score += 6
+    if normalize_yes_no(hormonal_symptoms.get('weight_gain', 'No')):
+        symptom_score += 6
+    if normalize_yes_no(hormonal_symptoms.get('acne_changes', 'No')):
+        symptom_score += 6
+    if normalize_yes_no(hormonal_symptoms.get('hair_growth_changes', 'No')):
+        symptom_score += 6
+    
+    general_symptoms = data.get('general_symptoms', {})
+    if normalize_yes_no(general_symptoms.get('nausea_vomiting', 'No')):
+        symptom_score += 8
+    if normalize_yes_no(general_symptoms.get('back_pain', 'No')):
+        symptom_score += 6
+    if normalize_yes_no(general_symptoms.get('leg_pain', 'No')):
+        symptom_score += 6
+    if normalize_yes_no(general_symptoms.get('fatigue', 'No')):
+        symptom_score += 6
+    
+    # Interaction term: PCOS + irregular periods or pelvic pain
+    if (normalize_yes_no(data['medical_history']['pcos_diagnosis']) and
+        (normalize_yes_no(menstrual_symptoms.get('irregular_periods', 'No')) or
+         normalize_yes_no(pelvic_symptoms.get('pelvic_pain', 'No')))):
+        risk_score += 10  # Synergistic effect
+    
+    # Add symptom score to risk score
+    risk_score += symptom_score
+    
+    # Ensure risk score is reasonable (not negative, capped at 100)
+    risk_score = max(0, min(risk_score, 100))
+    
+    logger.info(f"Ovarian cysts risk calculation: base_risk={risk_score-symptom_score}, symptom_score={symptom_score}, total={risk_score}")
+    
+    return risk_score
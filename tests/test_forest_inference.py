@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from forest_inference import CompiledForest, ForestParityError, FusedForest, check_parity, compile_models
+
+FEATURES = ["Age", "Sexual Partners", "HPV Test Result", "Score"]
+
+
+def make_data(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({
+        "Age": rng.integers(15, 80, n),
+        "Sexual Partners": rng.integers(0, 10, n),
+        "HPV Test Result": rng.integers(0, 2, n),
+        "Score": rng.normal(0, 1, n).round(3)
+    })
+    return X, rng
+
+
+def fit(X, y, **params):
+    return RandomForestClassifier(random_state=0, **{"n_estimators": 15, **params}).fit(X, y)
+
+
+def grid(X, rng):
+    """Training rows, values sitting exactly on split thresholds, and unseen rows."""
+    fresh = pd.DataFrame({column: rng.permutation(X[column].to_numpy()) for column in X.columns})
+    return pd.concat([X, X.round(0), fresh], ignore_index=True)
+
+
+def assert_exact(model, compiled, X):
+    assert np.array_equal(compiled.predict_proba(X), model.predict_proba(X))
+    assert np.array_equal(compiled.predict(X), model.predict(X))
+
+
+@pytest.fixture
+def data():
+    return make_data()
+
+
+def test_binary(data):
+    X, rng = data
+    y = ((X["Age"] > 40) ^ (X["HPV Test Result"] == 1)).astype(int)
+    model = fit(X, y)
+    assert_exact(model, CompiledForest.from_sklearn(model), grid(X, rng))
+
+
+def test_multiclass_string_labels(data):
+    X, rng = data
+    y = np.array(["Colposcopy", "Observation", "Repeat Pap", "Surgery"])[(X["Sexual Partners"] + X["HPV Test Result"] * 3) % 4]
+    model = fit(X, y, max_depth=6)
+    compiled = CompiledForest.from_sklearn(model)
+    assert list(compiled.classes_) == list(model.classes_)
+    assert_exact(model, compiled, grid(X, rng))
+
+
+def test_single_leaf_trees(data):
+    X, rng = data
+    y = (X["Score"] > 0).astype(int)
+    model = fit(X, y, min_samples_split=10_000)
+    compiled = CompiledForest.from_sklearn(model)
+    assert (compiled.feature == -1).all()
+    assert_exact(model, compiled, grid(X, rng))
+
+
+def test_single_class(data):
+    X, rng = data
+    model = fit(X, np.zeros(len(X), dtype=int))
+    assert_exact(model, CompiledForest.from_sklearn(model), grid(X, rng))
+
+
+def test_bootstrap_off_and_class_weights(data):
+    X, rng = data
+    y = (X["Age"] // 20).to_numpy()
+    model = fit(X, y, bootstrap=False, class_weight="balanced", max_features=None)
+    assert_exact(model, CompiledForest.from_sklearn(model), grid(X, rng))
+
+
+def test_dataframe_columns_are_selected_by_name(data):
+    X, rng = data
+    y = (X["Score"] + X["HPV Test Result"] > 0.5).astype(int)
+    model = fit(X, y)
+    compiled = CompiledForest.from_sklearn(model)
+    shuffled = grid(X, rng)[["Score", "HPV Test Result", "Sexual Partners", "Age"]].assign(Extra=1)
+    assert np.array_equal(compiled.predict_proba(shuffled), model.predict_proba(shuffled[FEATURES]))
+
+
+def test_single_row(data):
+    X, _ = data
+    y = (X["Age"] > 50).astype(int)
+    model = fit(X, y)
+    compiled = CompiledForest.from_sklearn(model)
+    row = X.iloc[:1]
+    assert np.array_equal(compiled.predict_proba(row), model.predict_proba(row))
+    assert np.array_equal(compiled.predict_proba(row.to_numpy()[0]), model.predict_proba(row))
+
+
+def test_fused_heads_match_each_model(data):
+    X, rng = data
+    models = {
+        "action": fit(X, np.array(["a", "b", "c"])[X["Sexual Partners"] % 3], n_estimators=10),
+        "insurance": fit(X, (X["Age"] > 30).astype(int), n_estimators=25, max_depth=4),
+        "stump": fit(X, (X["Score"] > 0).astype(int), n_estimators=5, min_samples_split=10_000)
+    }
+    fused = FusedForest(compile_models(models))
+    rows = grid(X, rng)
+    heads = fused.predict(rows)
+    assert set(heads) == set(models)
+    for name, model in models.items():
+        assert np.array_equal(heads[name].proba, model.predict_proba(rows))
+        assert np.array_equal(heads[name].labels, model.predict(rows))
+
+
+def test_fused_rejects_heads_with_different_features(data):
+    X, _ = data
+    y = (X["Age"] > 50).astype(int)
+    first = CompiledForest.from_sklearn(fit(X, y))
+    second = CompiledForest.from_sklearn(fit(X[FEATURES[::-1]], y))
+    with pytest.raises(ValueError):
+        FusedForest({"first": first, "second": second})
+
+
+def test_check_parity_detects_a_mismatch(data):
+    X, _ = data
+    y = (X["Age"] > 50).astype(int)
+    model = fit(X, y)
+    compiled = CompiledForest.from_sklearn(model)
+    assert check_parity(model, compiled, X) == 0.0
+    compiled.leaf_proba = compiled.leaf_proba[:, ::-1].copy()
+    with pytest.raises(ForestParityError):
+        check_parity(model, compiled, X)
+
+
+def test_missing_values_follow_the_learned_direction(data):
+    X, rng = data
+    X = X.astype(float)
+    X.loc[rng.random(len(X)) < 0.2, "Score"] = np.nan
+    y = (X["Score"].fillna(2) > 0).astype(int)
+    try:
+        model = fit(X, y)
+    except ValueError:
+        pytest.skip("this sklearn version does not fit forests on missing values")
+    rows = pd.concat([X, X.assign(Age=np.nan)], ignore_index=True)
+    assert_exact(model, CompiledForest.from_sklearn(model), rows)
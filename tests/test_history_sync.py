@@ -0,0 +1,179 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sklearn.preprocessing import LabelEncoder
+
+from history_sync import ChunkStore, HistorySync
+
+LABELS = {
+    "le_hpv": ["Negative", "Positive"],
+    "le_pap": ["Negative", "Positive"],
+    "le_smoking": ["No", "Yes"],
+    "le_std": ["No", "Yes"],
+    "le_insurance": ["No", "Yes"],
+    "le_screening": ["HPV DNA", "PAP SMEAR", "VIA"],
+    "le_action": ["Colposcopy", "Repeat Pap Smear In 3 Years"],
+    "le_menopause": ["Post-Menopausal", "Pre-Menopausal"],
+    "le_ultrasound": ["Complex Cyst", "Simple Cyst"],
+    "le_management": ["Observation", "Surgery"]
+}
+EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class Snapshot:
+    def __init__(self, path, data):
+        self.reference = type("Ref", (), {"path": path})()
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class Query:
+    """The collection_group query chain HistorySync uses, over an in-memory list of docs."""
+
+    def __init__(self, docs, since=None, size=None, after=None):
+        self.docs, self.since, self.size, self.after = docs, since, size, after
+
+    def where(self, field, op, value):
+        assert (field, op) == ("timestamp", ">=")
+        return Query(self.docs, value, self.size, self.after)
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, size):
+        return Query(self.docs, self.since, size, self.after)
+
+    def start_after(self, snapshot):
+        return Query(self.docs, self.since, self.size, snapshot)
+
+    def get(self):
+        docs = sorted(self.docs.items(), key=lambda item: (item[1]["timestamp"], item[0]))
+        snapshots = [Snapshot(path, data) for path, data in docs if self.since is None or data["timestamp"] >= self.since]
+        if self.after is not None:
+            paths = [s.reference.path for s in snapshots]
+            snapshots = snapshots[paths.index(self.after.reference.path) + 1:]
+        return snapshots[:self.size]
+
+
+class FakeDb:
+    def __init__(self):
+        self.docs = {"cervical": {}, "ovarian": {}}
+
+    def collection_group(self, name):
+        return Query(self.docs[name])
+
+    def add_cervical(self, doc_id, seconds):
+        self.docs["cervical"][f"patient_history/u1/cervical/{doc_id}"] = {
+            "timestamp": EPOCH + timedelta(seconds=seconds), "age": 30, "sexual_partners": 2,
+            "first_sexual_activity_age": 17, "hpv_result": "Positive", "pap_smear_result": "Negative",
+            "smoking_status": "No", "stds_history": "No", "region": "Pumwani", "insurance_covered": "Yes",
+            "screening_type_last": "VIA", "recommended_action": "Colposcopy"
+        }
+
+
+@pytest.fixture
+def encoders():
+    return {name: LabelEncoder().fit(labels) for name, labels in LABELS.items()}
+
+
+def make_sync(db, path, encoders, applied, events=None):
+    def on_rows(condition, frame):
+        if events is not None:
+            events.append(("on_rows", len(frame)))
+        applied.extend(frame["_doc"])
+    sync = HistorySync(db, ChunkStore(str(path)), encoders, on_rows, page_size=2)
+    if events is not None:
+        append = sync.store.append
+        sync.store.append = lambda condition, frame: events.append(("append", len(frame))) or append(condition, frame)
+    return sync
+
+
+def stored_docs(path):
+    frame = ChunkStore(str(path)).load("cervical")
+    return [] if frame is None else list(frame["_doc"])
+
+
+def release_writer(sync):
+    sync.store._lock_file.close()
+    sync.store._lock_file = None
+
+
+def test_rows_are_applied_before_they_are_stored_and_stored_once(tmp_path, encoders):
+    db, applied, events = FakeDb(), [], []
+    for i in range(3):
+        db.add_cervical(f"d{i}", i)
+    sync = make_sync(db, tmp_path, encoders, applied, events)
+
+    assert sync.sync_once() == {"cervical": 3}
+    assert sync.sync_once() == {}
+    db.add_cervical("d3", 2)  # same timestamp as the last synced record
+    assert sync.sync_once() == {"cervical": 1}
+
+    assert events == [("on_rows", 3), ("append", 3), ("on_rows", 1), ("append", 1)]
+    assert sorted(applied) == sorted(stored_docs(tmp_path)) == sorted(db.docs["cervical"])
+    assert len(ChunkStore(str(tmp_path)).chunks("cervical")) == 2
+
+
+def test_failed_on_rows_stores_nothing_and_is_retried(tmp_path, encoders):
+    db, applied = FakeDb(), []
+    db.add_cervical("d0", 0)
+    sync = make_sync(db, tmp_path, encoders, applied)
+    sync.on_rows = lambda condition, frame: (_ for _ in ()).throw(KeyError("Unnamed: 12"))
+    with pytest.raises(KeyError):
+        sync.sync_once()
+    assert stored_docs(tmp_path) == []
+
+    sync.on_rows = lambda condition, frame: applied.extend(frame["_doc"])
+    assert sync.sync_once() == {"cervical": 1}
+    assert applied == stored_docs(tmp_path) == ["patient_history/u1/cervical/d0"]
+
+
+def test_new_writer_stores_rows_the_dead_writer_never_stored(tmp_path, encoders):
+    db, applied_a, applied_b = FakeDb(), [], []
+    db.add_cervical("d0", 0)
+    writer = make_sync(db, tmp_path, encoders, applied_a)
+    follower = make_sync(db, tmp_path, encoders, applied_b)
+    writer.sync_once()
+
+    # The follower applies d1 to its memory; the writer dies before storing it
+    db.add_cervical("d1", 1)
+    follower.sync_once()
+    assert applied_b == ["patient_history/u1/cervical/d0", "patient_history/u1/cervical/d1"]
+    release_writer(writer)
+
+    assert follower.sync_once() == {}
+    assert sorted(stored_docs(tmp_path)) == sorted(db.docs["cervical"])
+    assert len(applied_b) == 2
+
+
+def test_new_writer_does_not_store_rows_twice(tmp_path, encoders):
+    db, applied_a, applied_b = FakeDb(), [], []
+    db.add_cervical("d0", 0)
+    writer = make_sync(db, tmp_path, encoders, applied_a)
+    follower = make_sync(db, tmp_path, encoders, applied_b)
+    writer.sync_once()
+    follower.sync_once()
+
+    # The writer stores d1 and d2 and dies before the follower has seen them
+    db.add_cervical("d1", 1)
+    db.add_cervical("d2", 1)
+    writer.sync_once()
+    release_writer(writer)
+
+    assert follower.sync_once() == {"cervical": 2}
+    docs = stored_docs(tmp_path)
+    assert sorted(docs) == sorted(set(docs)) == sorted(db.docs["cervical"])
+
+
+def test_replay_restores_memory_and_watermark(tmp_path, encoders):
+    db, applied = FakeDb(), []
+    for i in range(3):
+        db.add_cervical(f"d{i}", i)
+    make_sync(db, tmp_path, encoders, []).sync_once()
+
+    restarted = make_sync(db, tmp_path, encoders, applied)
+    restarted.replay_store()
+    assert sorted(applied) == sorted(db.docs["cervical"])
+    assert restarted.sync_once() == {}
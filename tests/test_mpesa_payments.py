@@ -0,0 +1,127 @@
+import json
+import sqlite3
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from mpesa_payments import CallbackJournal, PaymentStore
+
+
+def callback(checkout_request_id, result_code=0, receipt="RCPT1"):
+    items = [{"Name": "Amount", "Value": 10}, {"Name": "PhoneNumber", "Value": 254712345678},
+             {"Name": "TransactionDate", "Value": 20261017101010}]
+    if result_code == 0:
+        items.append({"Name": "MpesaReceiptNumber", "Value": receipt})
+    return {"Body": {"stkCallback": {"MerchantRequestID": "m1", "CheckoutRequestID": checkout_request_id,
+                                     "ResultCode": result_code, "ResultDesc": "ok" if result_code == 0 else "Cancelled",
+                                     "CallbackMetadata": {"Item": items}}}}
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return CallbackJournal(str(tmp_path / "callbacks.jsonl"), fsync=False)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PaymentStore(str(tmp_path / "payments.db"))
+
+
+def stored_offset(store):
+    with sqlite3.connect(store.path) as conn:
+        return conn.execute("SELECT offset FROM journal_offset WHERE id = 1").fetchone()[0]
+
+
+def test_duplicate_callback_does_not_change_a_final_result(journal, store):
+    store.record_request("ws_1", "m1", "254712345678", 10, "PAY1")
+    journal.append(callback("ws_1"))
+    assert store.apply_journal(journal) == (1, 1, 0, 0)
+
+    journal.append(callback("ws_1", result_code=1032))
+    journal.append(callback("ws_1", receipt="RCPT2"))
+    assert store.apply_journal(journal) == (2, 0, 2, 0)
+
+    payment = store.get("ws_1")
+    assert payment["status"] == "completed"
+    assert payment["result_code"] == 0
+    assert payment["mpesa_receipt_number"] == "RCPT1"
+    assert payment["callback_count"] == 3
+
+
+def test_callback_before_record_request(journal, store):
+    journal.append(callback("ws_1", result_code=1032))
+    assert store.apply_journal(journal) == (1, 1, 0, 0)
+    store.record_request("ws_1", "m1", "254700000000", 25, "PAY1")
+
+    payment = store.get("ws_1")
+    assert payment["status"] == "failed"
+    assert payment["result_code"] == 1032
+    assert payment["phone_number"] == "254700000000"
+    assert payment["amount"] == 25
+    assert payment["account_reference"] == "PAY1"
+
+
+def test_partially_written_line_is_picked_up_on_the_next_pass(journal, store):
+    journal.append(callback("ws_1"))
+    line = json.dumps({"received_at": "2026-10-17T10:00:00", "payload": callback("ws_2")}) + "\n"
+    with open(journal.path, "a") as f:
+        f.write(line[:40])
+    assert store.apply_journal(journal) == (1, 1, 0, 0)
+    assert store.get("ws_2") is None
+
+    with open(journal.path, "a") as f:
+        f.write(line[40:])
+    assert store.apply_journal(journal) == (1, 1, 0, 0)
+    assert store.get("ws_2")["status"] == "completed"
+    assert stored_offset(store) == Path(journal.path).stat().st_size
+
+
+def test_processing_resumes_from_the_stored_offset_after_a_crash(journal, store):
+    for i in range(5):
+        journal.append(callback(f"ws_{i}"))
+    assert store.apply_journal(journal, max_entries=2) == (2, 2, 0, 0)
+    committed = stored_offset(store)
+
+    # A process dies after applying two more entries but before its transaction commits
+    crash = textwrap.dedent(f"""
+        import os, sys
+        sys.path.insert(0, {str(Path(__file__).resolve().parents[1])!r})
+        from mpesa_payments import CallbackJournal, PaymentStore
+        apply = PaymentStore._apply
+        applied = []
+        def apply_then_die(conn, entry):
+            outcome = apply(conn, entry)
+            applied.append(outcome)
+            if len(applied) == 2:
+                os._exit(1)
+            return outcome
+        PaymentStore._apply = staticmethod(apply_then_die)
+        PaymentStore({store.path!r}).apply_journal(CallbackJournal({journal.path!r}, fsync=False))
+    """)
+    assert subprocess.run([sys.executable, "-c", crash]).returncode == 1
+    assert stored_offset(store) == committed
+    assert store.get("ws_2") is None
+
+    restarted = PaymentStore(store.path)
+    assert restarted.apply_journal(journal) == (3, 3, 0, 0)
+    assert [restarted.get(f"ws_{i}")["callback_count"] for i in range(5)] == [1] * 5
+    assert restarted.apply_journal(journal) == (0, 0, 0, 0)
+
+
+def test_unappliable_payloads_are_dead_lettered_without_blocking(journal, store):
+    journal.append("not an object")
+    journal.append([1, 2])
+    journal.append({"Body": "x"})
+    with open(journal.path, "a") as f:
+        f.write("[\"not an entry\"]\n")
+    journal.append(callback("ws_1"))
+
+    assert store.apply_journal(journal) == (5, 1, 0, 4)
+    assert store.get("ws_1")["status"] == "completed"
+    assert stored_offset(store) == Path(journal.path).stat().st_size
+    with sqlite3.connect(store.path) as conn:
+        dead = [json.loads(payload) for payload, in conn.execute("SELECT payload FROM dead_callbacks ORDER BY journal_offset")]
+    assert dead == ["not an object", [1, 2], {"Body": "x"}, ["not an entry"]]
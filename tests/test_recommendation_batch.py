@@ -0,0 +1,138 @@
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import firebase_admin
+import jwt
+import pytest
+import pytz
+from firebase_admin import credentials, firestore
+
+ROOT = Path(__file__).resolve().parents[1]
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", str(ROOT / "data" / "artifacts"))
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(ARTIFACT_DIR),
+                                reason="needs an artifact bundle (python train_models.py)")
+
+CERVICAL_RECORDS = [
+    {"age": 34, "sexual_partners": 3, "first_sexual_activity_age": 17, "hpv_result": "pos",
+     "pap_smear_result": "neg", "smoking_status": "no", "stds_history": "yes", "screening_type_last": "pap"},
+    {"age": 40, "sexual_partners": 1, "first_sexual_activity_age": 20, "hpv_result": "Negative",
+     "pap_smear_result": "Negative", "smoking_status": "No", "stds_history": "No", "screening_type_last": "VIA"},
+    {"age": 29, "sexual_partners": 1, "first_sexual_activity_age": 20, "hpv_result": "bogus",
+     "pap_smear_result": "Negative", "smoking_status": "No", "stds_history": "No", "screening_type_last": "VIA"},
+    {"age": 45, "sexual_partners": 6, "first_sexual_activity_age": 15, "hpv_result": "Positive",
+     "pap_smear_result": "abnormal", "smoking_status": "y", "stds_history": "n", "screening_type_last": "hpv"},
+    "not a record",
+    {"age": 22, "sexual_partners": 2, "first_sexual_activity_age": 16, "hpv_result": "+",
+     "pap_smear_result": "normal", "smoking_status": "true", "stds_history": "false", "screening_type_last": "dna"},
+    {"age": 31, "sexual_partners": 2, "first_sexual_activity_age": 18, "hpv_result": "Positive",
+     "pap_smear_result": "Negative", "smoking_status": "No", "stds_history": "No"}
+]
+CERVICAL_ERRORS = {2: "Invalid HPV result", 4: "Record must be an object", 6: "screening_type_last"}
+
+OVARIAN_RECORDS = [
+    {"age": 45, "menopause_status": "pre-menopausal", "cyst_size": 6.2, "ca125_level": 40,
+     "symptoms": ["Bloating", "Nausea"]},
+    {"age": 30, "menopause_status": "Pre-Menopausal", "cyst_size": 2.1, "ca125_level": 12, "symptoms": ["Bloating", 3]},
+    {"age": 58, "menopause_status": "post-menopausal", "cyst_size": 4.0, "ca125_level": 80,
+     "symptoms": ["pelvic pain", "FATIGUE"], "cyst_growth_rate": 0.4},
+    {"age": 38, "menopause_status": "Pre-Menopausal", "cyst_size": 3.0, "ca125_level": 20, "symptoms": "Nausea"},
+    {"age": 41, "menopause_status": "Pre-Menopausal", "cyst_size": 5.5, "ca125_level": 30, "symptoms": [],
+     "ultrasound_features": "Banana"},
+    {"age": 52, "menopause_status": "unknown", "cyst_size": 1.5, "ca125_level": 9, "symptoms": ["Irregular Periods"]}
+]
+OVARIAN_ERRORS = {1: "symptoms must be a list of strings", 3: "symptoms must be a list of strings",
+                  4: "Invalid ultrasound_features"}
+
+
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("app")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("ARTIFACT_DIR", ARTIFACT_DIR)
+        mp.setenv("TOKEN_VERIFICATION_MODE", "stateless")
+        mp.setenv("HISTORY_STORE_DIR", str(tmp / "history_store"))
+        mp.setenv("REPORT_STORE_DIR", str(tmp / "reports"))
+        mp.setattr(credentials, "Certificate", lambda path: None)
+        mp.setattr(firebase_admin, "initialize_app", lambda *args, **kwargs: None)
+        mp.setattr(firestore, "client", lambda *args, **kwargs: MagicMock())
+        import app
+        mp.setattr(app, "validate_region", lambda user_uid, region=None: "Pumwani")
+        yield app
+
+
+@pytest.fixture(scope="module")
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture(scope="module")
+def headers(app_module):
+    token = jwt.encode({"user_uid": "u1", "exp": datetime.now(pytz.UTC) + timedelta(hours=1)},
+                       app_module.JWT_SECRET, algorithm=app_module.JWT_ALGORITHM)
+    return {"Authorization": f"Bearer {token}"}
+
+
+def post_batch(client, headers, path, records):
+    response = client.post(path, json={"records": records}, headers=headers)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [item["index"] for item in body["results"]] == list(range(len(records)))
+    return body
+
+
+def assert_errors(body, expected):
+    errors = {item["index"]: item["message"] for item in body["results"] if item["status"] == "error"}
+    assert errors.keys() == expected.keys()
+    for index, message in expected.items():
+        assert message in errors[index]
+    assert body["failed"] == len(expected)
+    assert body["processed"] == len(body["results"]) - len(expected)
+
+
+def test_cervical_batch_matches_single_requests(client, headers):
+    body = post_batch(client, headers, "/cervical_recommendation/batch", CERVICAL_RECORDS)
+    assert_errors(body, CERVICAL_ERRORS)
+    for item in body["results"]:
+        if item["status"] == "error":
+            continue
+        single = client.post("/cervical_recommendation?view=doctor", json=CERVICAL_RECORDS[item["index"]],
+                             headers=headers)
+        assert single.status_code == 200
+        single = single.get_json()
+        assert item["recommended_action"] == single["recommended_action"]
+        assert item["insurance_covered"] == single["insurance_covered"]
+        assert item["percentile_risk"]["risk_score"] == single["percentile_risk"]["risk_score"]
+
+
+def test_cervical_batch_applies_guideline_overrides(client, headers):
+    body = post_batch(client, headers, "/cervical_recommendation/batch", CERVICAL_RECORDS)
+    actions = {item["index"]: item["recommended_action"] for item in body["results"] if item["status"] == "success"}
+    assert actions[1] == "Repeat Pap Smear In 3 Years"
+    assert actions[3] == "Colposcopy, Biopsy, Cytology"
+    assert actions[5] == "Hpv Vaccine And Sexual Education"
+
+
+def test_ovarian_batch_matches_single_requests(client, headers):
+    body = post_batch(client, headers, "/ovarian_recommendation/batch", OVARIAN_RECORDS)
+    assert_errors(body, OVARIAN_ERRORS)
+    for item in body["results"]:
+        if item["status"] == "error":
+            continue
+        single = client.post("/ovarian_recommendation?view=doctor", json=OVARIAN_RECORDS[item["index"]],
+                             headers=headers)
+        assert single.status_code == 200
+        single = single.get_json()
+        assert item["recommended_management"] == single["recommended_management"]
+        assert item["ultrasound_features"] == single["ultrasound_features"]
+        assert item["percentile_risk"]["risk_score"] == single["percentile_risk"]["risk_score"]
+
+
+def test_single_requests_reject_what_the_batch_reports(client, headers):
+    for path, records, errors in [("/cervical_recommendation", CERVICAL_RECORDS, CERVICAL_ERRORS),
+                                  ("/ovarian_recommendation", OVARIAN_RECORDS, OVARIAN_ERRORS)]:
+        for index in errors:
+            if isinstance(records[index], dict):
+                assert client.post(path, json=records[index], headers=headers).status_code == 400
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from firebase_admin import firestore
+from google.api_core import exceptions as google_exceptions
+
+from reminder_worker import SENDS_COLLECTION, ReminderWorker
+
+
+class Snapshot:
+    def __init__(self, data, update_time):
+        self.exists = data is not None
+        self._data = data
+        self.update_time = update_time
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class DocRef:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def _write(self, data):
+        self.db.clock += 1
+        self.db.docs[self.path] = ({key: datetime.now(pytz.UTC) if value is firestore.SERVER_TIMESTAMP else value
+                                    for key, value in data.items()}, self.db.clock)
+
+    def create(self, data):
+        if self.path in self.db.docs:
+            raise google_exceptions.AlreadyExists(self.path)
+        self._write(data)
+
+    def get(self):
+        data, update_time = self.db.docs.get(self.path, (None, None))
+        return Snapshot(data, update_time)
+
+    def update(self, data, option=None):
+        current, update_time = self.db.docs[self.path]
+        if option is not None and option != update_time:
+            raise google_exceptions.FailedPrecondition(self.path)
+        self._write({**current, **data})
+
+
+class FakeDb:
+    """The document create/get/update calls claim() makes, with update-time preconditions."""
+
+    def __init__(self):
+        self.docs = {}
+        self.clock = 0
+
+    def collection(self, name):
+        return type("Collection", (), {"document": lambda _, doc_id: DocRef(self, f"{name}/{doc_id}")})()
+
+    def write_option(self, last_update_time):
+        return last_update_time
+
+    def claim_doc(self, key):
+        return self.docs[f"{SENDS_COLLECTION}/{key}"][0]
+
+    def age_claim(self, key, seconds):
+        self.claim_doc(key)["claimed_at"] -= timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def db():
+    return FakeDb()
+
+
+def worker(db, holder):
+    return ReminderWorker(db, dispatcher=None, holder=holder, claim_timeout=600)
+
+
+def test_claim_is_exclusive(db):
+    assert worker(db, "a").claim("k", "follow_ups/f1", "u1")
+    assert not worker(db, "b").claim("k", "follow_ups/f1", "u1")
+    assert db.claim_doc("k")["claimed_by"] == "a"
+
+
+def test_stale_sending_claim_is_reclaimed_once(db):
+    assert worker(db, "a").claim("k", "follow_ups/f1", "u1")
+    db.age_claim("k", 601)  # "a" died before recording an outcome
+    assert worker(db, "b").claim("k", "follow_ups/f1", "u1")
+    assert not worker(db, "c").claim("k", "follow_ups/f1", "u1")
+    claim = db.claim_doc("k")
+    assert claim["claimed_by"] == "b"
+    assert claim["reclaimed_from"] == "a"
+
+
+def test_recent_sending_claim_is_not_reclaimed(db):
+    assert worker(db, "a").claim("k", "follow_ups/f1", "u1")
+    db.age_claim("k", 599)
+    assert not worker(db, "b").claim("k", "follow_ups/f1", "u1")
+
+
+def test_claim_with_an_outcome_is_never_reclaimed(db):
+    assert worker(db, "a").claim("k", "follow_ups/f1", "u1")
+    DocRef(db, f"{SENDS_COLLECTION}/k").update({"status": "sent"})
+    db.age_claim("k", 86400)
+    assert not worker(db, "b").claim("k", "follow_ups/f1", "u1")
+
+
+def test_concurrent_reclaim_has_one_winner(db, monkeypatch):
+    assert worker(db, "a").claim("k", "follow_ups/f1", "u1")
+    db.age_claim("k", 601)
+    get = DocRef.get
+
+    def get_then_race(ref):
+        snapshot = get(ref)
+        ref.update({"claimed_by": "c"})  # another replica reclaims between our read and write
+        return snapshot
+
+    monkeypatch.setattr(DocRef, "get", get_then_race)
+    assert not worker(db, "b").claim("k", "follow_ups/f1", "u1")
+    assert db.claim_doc("k")["claimed_by"] == "c"
@@ -0,0 +1,128 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import legacy_risk_scores
+from risk_rules import CERVICAL_RISK_RULES, OVARIAN_CYSTS_RISK_RULES, Rule, ValueRule
+
+PAYLOADS = 3000
+ANSWERS = ["Yes", "No", "yes", "NO", "y", "n", "true", "0", "positive", "neg", "unsure", ""]
+EXERCISE = ["Rarely", "never", "Regularly", "sometimes"]
+DIET = ["Poor", "Excellent", "average"]
+STRESS = ["High", "very high", "low"]
+
+CERVICAL_SYMPTOMS = {
+    "bleeding_symptoms": ["bleeding_between_periods", "bleeding_after_sex", "bleeding_after_menopause",
+                          "periods_heavier_than_before", "periods_longer_than_before"],
+    "other_symptoms": ["unusual_discharge", "discharge_smells_bad", "discharge_color_change", "pain_during_sex",
+                       "pelvic_pain", "painful_urination", "blood_in_urine", "frequent_urination", "rectal_bleeding",
+                       "painful_bowel_movements"],
+    "general_symptoms": ["unexplained_weight_loss", "constant_tiredness", "leg_swelling", "back_pain"]
+}
+OVARIAN_SYMPTOMS = {
+    "pelvic_symptoms": ["pelvic_pain", "abdominal_bloating", "feeling_full_quickly", "frequent_urination",
+                        "difficulty_emptying_bladder", "pain_during_sex"],
+    "menstrual_symptoms": ["irregular_periods", "heavy_periods", "painful_periods", "spotting_between_periods",
+                           "missed_periods"],
+    "hormonal_symptoms": ["breast_tenderness", "mood_changes", "weight_gain", "acne_changes", "hair_growth_changes"],
+    "general_symptoms": ["nausea_vomiting", "back_pain", "leg_pain", "fatigue"]
+}
+
+
+def symptom_groups(rng, groups):
+    """Symptom sections with some answers, and some whole sections, left out."""
+    return {group: {field: rng.choice(ANSWERS) for field in fields if rng.random() < 0.8}
+            for group, fields in groups.items() if rng.random() < 0.9}
+
+
+def cervical_payload(rng):
+    return {
+        "patient_info": {"age": rng.randint(15, 80), "sexual_partners": rng.randint(0, 10),
+                         "age_first_sex": rng.randint(12, 30), "smoking": rng.choice(ANSWERS)},
+        "medical_history": {
+            **{field: rng.choice(ANSWERS) for field in
+               ["family_cancer_history", "previous_stds", "hiv_status", "taking_immune_drugs"]},
+            "last_screening": rng.choice(["Never", "1 year ago", "3 years ago", "5 years ago", "10 years ago",
+                                          "some years ago", "recently"])
+        },
+        "lifestyle": {"hpv_vaccination": rng.choice(ANSWERS), "exercise_frequency": rng.choice(EXERCISE),
+                      "diet_quality": rng.choice(DIET),
+                      "alcohol_consumption": rng.choice(["Heavy", "excessive", "Moderate", "none"]),
+                      "stress_level": rng.choice(STRESS), "sleep_quality": rng.choice(["Poor", "very poor", "good"]),
+                      "contraceptive_use": rng.choice(["Oral long-term", "oral", "None", "IUD long-term"])},
+        **symptom_groups(rng, CERVICAL_SYMPTOMS)
+    }
+
+
+def ovarian_payload(rng):
+    lifestyle = {"exercise_frequency": rng.choice(EXERCISE), "diet_quality": rng.choice(DIET),
+                 "stress_level": rng.choice(STRESS), "contraceptive_use": rng.choice(["Oral", "the pill", "None"])}
+    if rng.random() < 0.9:
+        lifestyle["smoking_status"] = rng.choice(ANSWERS)
+    if rng.random() < 0.9:
+        lifestyle["weight_status"] = rng.choice(["Obese", "overweight", "Underweight", "normal"])
+    return {
+        "patient_info": {"age": rng.randint(15, 80), "menstrual_cycle_length": rng.randint(15, 45),
+                         **{field: rng.choice(ANSWERS) for field in
+                            ["menstrual_irregularity", "pregnancy_history", "family_history_ovarian"]}},
+        "medical_history": {
+            **{field: rng.choice(ANSWERS) for field in
+               ["pcos_diagnosis", "endometriosis", "previous_ovarian_cysts", "hormone_therapy", "fertility_treatments"]},
+            "last_pelvic_exam": rng.choice(["Never", "1 year ago", "2 years ago", "4 years ago", "some years ago",
+                                            "recently"])
+        },
+        "lifestyle": lifestyle,
+        **symptom_groups(rng, OVARIAN_SYMPTOMS)
+    }
+
+
+def flatten(payload):
+    """The flat field names a stored patient_history risk record uses."""
+    return {field: value for section in payload.values() for field, value in section.items()}
+
+
+CASES = [
+    (CERVICAL_RISK_RULES, cervical_payload, legacy_risk_scores.calculate_cervical_risk_score),
+    (OVARIAN_CYSTS_RISK_RULES, ovarian_payload, legacy_risk_scores.calculate_ovarian_cysts_risk_score)
+]
+
+
+@pytest.fixture(params=CASES, ids=lambda case: case[0].name)
+def scored(request):
+    table, make_payload, legacy_score = request.param
+    rng = random.Random(table.name)
+    payloads = [make_payload(rng) for _ in range(PAYLOADS)]
+    return table, payloads, np.array([legacy_score(payload) for payload in payloads])
+
+
+def test_dict_scores_match_legacy_scorer(scored):
+    table, payloads, expected = scored
+    assert np.array_equal([table.score(payload) for payload in payloads], expected)
+
+
+def test_request_frame_scores_match_legacy_scorer(scored):
+    table, payloads, expected = scored
+    assert np.array_equal(table.score_records(payloads), expected)
+
+
+def test_stored_record_scores_match_legacy_scorer(scored):
+    table, payloads, expected = scored
+    frame = pd.DataFrame([flatten(payload) for payload in payloads])
+    assert np.array_equal(table.score_frame(frame, flat=True), expected)
+
+
+def test_score_parts_split_out_symptoms(scored):
+    table, payloads, expected = scored
+    for payload, score in zip(payloads[:200], expected):
+        total, symptom_score = table.score_parts(payload)
+        assert total == score
+        assert symptom_score == sum(rule.score(payload) for rule in table.rules if rule.symptom)
+
+
+def test_rule_bases_are_abstract():
+    with pytest.raises(TypeError):
+        Rule()
+    with pytest.raises(TypeError):
+        ValueRule("patient_info.age")
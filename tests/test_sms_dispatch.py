@@ -0,0 +1,59 @@
+import pytest
+
+from sms_dispatch import SmsDispatcher, SmsMessage, to_e164
+
+
+class FakeResponse:
+    status_code = 201
+
+    def __init__(self, recipients):
+        self.recipients = recipients
+
+    def json(self):
+        return {"SMSMessageData": {"Recipients": self.recipients}}
+
+
+class ProviderSession:
+    """Answers like Africa's Talking, reporting each recipient in the given format."""
+
+    def __init__(self, report_number):
+        self.report_number = report_number
+        self.sent_to = []
+
+    def post(self, url, data, timeout):
+        numbers = data["to"].split(",")
+        self.sent_to.append(numbers)
+        return FakeResponse([{"statusCode": 101, "number": self.report_number(number), "status": "Success",
+                              "cost": "KES 0.8000", "messageId": f"ATXid_{number}"} for number in numbers])
+
+
+def make_dispatcher(session):
+    return SmsDispatcher("sandbox", "key", url="http://provider.test", rate=1000, max_attempts=3,
+                         base_delay=0, session=session)
+
+
+@pytest.mark.parametrize("phone", ["0712 345 678", "0712345678", "712345678", "254712345678", "+254712345678"])
+def test_to_e164(phone):
+    assert to_e164(phone) == "+254712345678"
+
+
+@pytest.mark.parametrize("report_number", [
+    lambda number: number,                  # E.164, as the real API reports
+    lambda number: number.lstrip("+"),      # country code without "+"
+])
+def test_results_match_when_provider_reports_numbers_differently(report_number):
+    session = ProviderSession(report_number)
+    messages = [SmsMessage("a", "0712 345 678", "hi"), SmsMessage("b", "+254722000111", "hi"),
+                SmsMessage("c", "0733000222", "hi")]
+    results = make_dispatcher(session).dispatch(messages)
+
+    assert [(r.id, r.status, r.attempts) for r in results] == [("a", "sent", 1), ("b", "sent", 1), ("c", "sent", 1)]
+    assert session.sent_to == [["+254712345678", "+254722000111", "+254733000222"]]
+    assert results[0].phone == "0712 345 678"
+
+
+def test_invalid_numbers_are_rejected_without_a_send():
+    session = ProviderSession(lambda number: number)
+    results = make_dispatcher(session).dispatch([SmsMessage("a", "not a phone", "hi")])
+    assert [(r.status, r.error) for r in results] == [("rejected", "invalid phone number")]
+    assert session.sent_to == []
@@ -0,0 +1,87 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+from token_revocation import RevocationList, RevocationListUnavailable, token_digest
+
+
+class Doc:
+    def __init__(self, doc_id):
+        self.id = doc_id
+
+
+class RevokedTokens:
+    """The revoked_tokens reads and writes RevocationList makes; reads can be held or made to fail."""
+
+    def __init__(self, digests):
+        self.digests = digests
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.failures = 0
+        self.reads = 0
+
+    def collection(self, name):
+        return self
+
+    def where(self, field, op, value):
+        return self
+
+    def document(self, doc_id):
+        return self
+
+    def set(self, data):
+        pass
+
+    def get(self):
+        self.reads += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("firestore unavailable")
+        return [Doc(digest) for digest in self.digests]
+
+
+def revocations(db):
+    return RevocationList(db, refresh_interval=3600)
+
+
+def test_concurrent_first_checks_wait_for_the_initial_load():
+    db = RevokedTokens({token_digest("revoked")})
+    db.release.clear()
+    revocation_list = revocations(db)
+    results = []
+    first = threading.Thread(target=lambda: results.append(revocation_list.is_revoked("revoked")))
+    first.start()
+    assert db.started.wait(5)
+    others = [threading.Thread(target=lambda: results.append(revocation_list.is_revoked("revoked"))) for _ in range(4)]
+    for thread in others:
+        thread.start()
+    db.release.set()
+    for thread in [first] + others:
+        thread.join(5)
+    assert results == [True] * 5
+    assert db.reads == 1
+
+
+def test_failed_initial_load_rejects_checks_until_a_load_succeeds():
+    db = RevokedTokens({token_digest("revoked")})
+    db.failures = 1
+    revocation_list = revocations(db)
+    with pytest.raises(RevocationListUnavailable):
+        revocation_list.is_revoked("revoked")
+    assert revocation_list.is_revoked("revoked")
+    assert not revocation_list.is_revoked("valid")
+
+
+def test_stats_report_the_list_size():
+    db = RevokedTokens({token_digest("a"), token_digest("b")})
+    revocation_list = revocations(db)
+    revocation_list.is_revoked("a")
+    assert revocation_list.stats["size"] == 2
+    revocation_list.revoke("c", "u1", datetime.now(pytz.UTC) + timedelta(hours=1))
+    assert revocation_list.stats["size"] == 3
+    assert revocation_list.is_revoked("c")
@@ -0,0 +1,127 @@
+import pytest
+from flask import Flask, jsonify
+
+from write_buffer import FIRESTORE_BATCH_LIMIT, after_commit, buffered_writes, record_write
+
+
+class Batch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, doc_ref, data):
+        self.writes.append((doc_ref, data))
+
+    def commit(self):
+        if self.db.fail_commits:
+            raise RuntimeError("firestore unavailable")
+        self.db.commits.append(self.writes)
+
+
+class Collection:
+    def __init__(self, db):
+        self.db = db
+
+    def document(self):
+        self.db.next_id += 1
+        return f"doc{self.db.next_id}"
+
+    def add(self, data):
+        self.db.direct_adds.append(data)
+        return None, self.document()
+
+
+class FakeDb:
+    """The batch()/document()/add() calls write_buffer makes; commits can be made to fail."""
+
+    def __init__(self):
+        self.commits = []
+        self.direct_adds = []
+        self.next_id = 0
+        self.fail_commits = False
+
+    def batch(self):
+        return Batch(self)
+
+    def collection(self, name):
+        return Collection(self)
+
+
+@pytest.fixture
+def db():
+    return FakeDb()
+
+
+@pytest.fixture
+def client(db):
+    app = Flask(__name__)
+    events = app.config["EVENTS"] = []
+
+    @app.route("/write/<int:count>/<int:status>")
+    @buffered_writes(db)
+    def write(count, status):
+        for i in range(count):
+            record_write(db.collection("records"), {"i": i})
+        after_commit(lambda: events.append("after_commit"))
+        return jsonify({"status": "ok"}), status
+
+    @app.route("/raise")
+    @buffered_writes(db)
+    def raise_error():
+        record_write(db.collection("records"), {"i": 0})
+        after_commit(lambda: events.append("after_commit"))
+        raise RuntimeError("view failed")
+
+    return app.test_client()
+
+
+def events(client):
+    return client.application.config["EVENTS"]
+
+
+def test_successful_response_commits_once_then_runs_callbacks(client, db):
+    response = client.get("/write/3/201")
+    assert response.status_code == 201
+    assert [[data for _, data in batch] for batch in db.commits] == [[{"i": 0}, {"i": 1}, {"i": 2}]]
+    assert db.direct_adds == []
+    assert events(client) == ["after_commit"]
+
+
+@pytest.mark.parametrize("status", [400, 404, 500])
+def test_error_response_discards_the_buffer(client, db, status):
+    assert client.get(f"/write/3/{status}").status_code == status
+    assert db.commits == []
+    assert db.direct_adds == []
+    assert events(client) == []
+
+
+def test_view_exception_discards_the_buffer(client, db):
+    client.application.testing = False
+    assert client.get("/raise").status_code == 500
+    assert db.commits == []
+    assert events(client) == []
+
+
+def test_large_buffer_is_split_across_commits(client, db):
+    count = 2 * FIRESTORE_BATCH_LIMIT + 1
+    assert client.get(f"/write/{count}/200").status_code == 200
+    assert [len(batch) for batch in db.commits] == [FIRESTORE_BATCH_LIMIT, FIRESTORE_BATCH_LIMIT, 1]
+    assert [data["i"] for batch in db.commits for _, data in batch] == list(range(count))
+    assert events(client) == ["after_commit"]
+
+
+def test_failed_commit_returns_500_and_skips_callbacks(client, db):
+    db.fail_commits = True
+    response = client.get("/write/2/200")
+    assert response.status_code == 500
+    assert response.get_json() == {"status": "error", "message": "Internal server error"}
+    assert events(client) == []
+
+
+def test_outside_a_request_writes_and_callbacks_run_immediately(db):
+    ran = []
+    record_write(db.collection("records"), {"i": 0})
+    after_commit(lambda: ran.append(True))
+    assert db.direct_adds == [{"i": 0}]
+    assert db.commits == []
+    assert ran == [True]
@@ -0,0 +1,138 @@
+"""
+Token revocation list for stateless JWT verification.
+
+In stateless mode token_required trusts the signed ``exp`` claim and only
+checks the token against this in-memory denylist instead of reading
+users/{uid}/tokens/{token} from Firestore. The denylist is a Bloom filter
+(fast negative answer for the common, non-revoked case) backed by an exact set
+of SHA-256 token digests, rebuilt periodically from the ``revoked_tokens``
+collection by a background thread. Each process loads the list before it
+answers its first check; until that load has succeeded, checks raise
+RevocationListUnavailable rather than pass every token.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import threading
+from datetime import datetime
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class RevocationListUnavailable(RuntimeError):
+    """Raised by is_revoked() while the denylist has not been loaded in this process."""
+
+
+class BloomFilter:
+    def __init__(self, capacity=10000, error_rate=0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest):
+        # Double hashing over two 64-bit halves of the SHA-256 digest
+        h1 = int(digest[:16], 16)
+        h2 = int(digest[16:32], 16) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, digest):
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+
+class RevocationList:
+    def __init__(self, db, collection="revoked_tokens", refresh_interval=60.0, error_rate=0.001):
+        self.db = db
+        self.collection = collection
+        self.refresh_interval = refresh_interval
+        self.error_rate = error_rate
+        self._bloom = BloomFilter(1, error_rate)
+        self._revoked = set()
+        self._local = {}  # digest -> expires_at for revocations made by this process
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self.last_refresh = None
+        self.stats = {"checks": 0, "bloom_negatives": 0, "revoked_hits": 0, "refreshes": 0, "size": 0}
+
+    def _ensure_started(self):
+        """
+        Load the denylist once per process, then keep it fresh from a background
+        thread (restarted after fork). Checks arriving during the first load wait
+        for it; if it fails they raise, and the next check tries again.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if not self.refresh():
+                raise RevocationListUnavailable("Token revocation list could not be loaded")
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name="revocation-refresh", daemon=True).start()
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.refresh_interval):
+            self.refresh()
+
+    def refresh(self):
+        """Rebuild the Bloom filter and exact set from revoked tokens that have not yet expired."""
+        try:
+            docs = self.db.collection(self.collection).where("expires_at", ">", datetime.now(pytz.UTC)).get()
+            digests = {doc.id for doc in docs}
+        except Exception as e:
+            logger.error(f"Error refreshing token revocation list: {e}")
+            return False
+        now = datetime.now(pytz.UTC)
+        with self._lock:
+            # Local revocations may not be visible to the query yet
+            self._local = {d: exp for d, exp in self._local.items() if exp > now}
+            digests |= set(self._local)
+            bloom = BloomFilter(len(digests) * 2 + 1000, self.error_rate)
+            for digest in digests:
+                bloom.add(digest)
+            self._bloom, self._revoked = bloom, digests
+            self.stats["size"] = len(digests)
+        self.last_refresh = datetime.now(pytz.UTC)
+        self.stats["refreshes"] += 1
+        return True
+
+    def is_revoked(self, token):
+        self._ensure_started()
+        digest = token_digest(token)
+        self.stats["checks"] += 1
+        if digest not in self._bloom:
+            self.stats["bloom_negatives"] += 1
+            return False
+        revoked = digest in self._revoked
+        if revoked:
+            self.stats["revoked_hits"] += 1
+        return revoked
+
+    def revoke(self, token, user_uid, expires_at):
+        """Persist a revocation and apply it to this process immediately."""
+        digest = token_digest(token)
+        self.db.collection(self.collection).document(digest).set({
+            "user_uid": user_uid,
+            "expires_at": expires_at,
+            "revoked_at": datetime.now(pytz.UTC)
+        })
+        with self._lock:
+            self._local[digest] = expires_at
+            self._revoked.add(digest)
+            self._bloom.add(digest)
+            self.stats["size"] = len(self._revoked)
+        return digest
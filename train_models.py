@@ -0,0 +1,315 @@
+"""
+Offline training pipeline.
+
+Reads the four Excel workbooks, cleans them, trains the cervical, insurance,
+management and ultrasound RandomForest models and writes everything the API
+needs into a new versioned artifact bundle (see artifacts.py).
+
+Usage:
+    python train_models.py [--data-dir data] [--artifact-dir data/artifacts]
+"""
+
+import argparse
+import logging
+import os
+
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import cross_val_score, GridSearchCV
+from sklearn.metrics import classification_report
+from imblearn.over_sampling import SMOTE
+
+from artifacts import save_bundle, cervical_features, ovarian_features
+from forest_inference import compile_models, check_parity
+from normalization import normalize_series, HPV_RESULT, PAP_RESULT, YES_NO, SCREENING_TYPE
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Symptoms for ovarian cyst dataset
+symptoms = ["Pelvic Pain", "Bloating", "Nausea", "Fatigue", "Irregular Periods"]
+
+param_grid = {
+    "n_estimators": [100, 200],
+    "max_depth": [5, 10, None],
+    "min_samples_split": [2, 5],
+    "min_samples_leaf": [1, 2]
+}
+
+
+# Step 1: Clean Cervical Cancer Dataset
+def clean_cervical_data(df):
+    logger.info("Cleaning Cervical Cancer data...")
+    df = df.rename(columns={"Insrance Covered": "Insurance Covered"})
+    df["Region"] = df["Region"].str.strip().str.title().replace({
+        "Pumwani ": "Pumwani",
+        "Kakamega ": "Kakamega",
+        "Machakos ": "Machakos"
+    })
+    df["HPV Test Result"] = normalize_series(df["HPV Test Result"], HPV_RESULT).fillna(df["HPV Test Result"].str.strip().str.title())
+    df["Pap Smear Result"] = normalize_series(df["Pap Smear Result"], PAP_RESULT).fillna(df["Pap Smear Result"].str.strip().str.title())
+    for column in ["Smoking Status", "STDs History", "Insurance Covered"]:
+        df[column] = normalize_series(df[column], YES_NO).fillna(df[column].str.strip().str.title())
+    df["Screening Type Last"] = normalize_series(df["Screening Type Last"], SCREENING_TYPE).fillna(df["Screening Type Last"].str.strip().str.upper())
+    df["Recommended Action"] = df["Recommended Action"].str.strip().str.title().replace({
+        "Coloscopy": "Colposcopy",
+        "Biospy": "Biopsy",
+        "Colposocpy": "Colposcopy",
+        "Repeat In 3 Years": "Repeat Pap Smear In 3 Years",
+        "Follow-Up": "Repeat Pap Smear In 3 Years",
+        "Follow Up": "Repeat Pap Smear In 3 Years",
+        "For Annual Follow Up And Pap Smear In 3 Years": "Annual Follow Up And Pap Smear In 3 Years",
+        "For Anual Follow Up And Pap Smear In 3 Years": "Annual Follow Up And Pap Smear In 3 Years",
+        "For Colposcopy Biospy, Cytology": "Colposcopy, Biopsy, Cytology",
+        "For Coloscopy Biosy, Cytology": "Colposcopy, Biopsy, Cytology",
+        "Forcolposcopy, Cytology Then Laser Therapy": "Colposcopy, Cytology, Laser Therapy",
+        "For Biopsy And Cytology With Tah Not Recommended": "Colposcopy, Biopsy, Cytology",
+        "For Colposcopy Cytology": "Colposcopy, Biopsy, Cytology",
+        "For Hpv Vaccine And Sexual Education": "Hpv Vaccine And Sexual Education",
+        "For Hpv Vaccination And Sexual Education": "Hpv Vaccine And Sexual Education",
+        "For Colposcopy Biopsy, Cytology +/- Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
+        "For Colposcopy Biopsy, Cytology +/-Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
+        "For Colposcopy Biospy, Cytology +/- Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
+        "For Colposcopy Biosy, Cytology+/- Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
+        "For Colposcopy Biopsy And Cytology+/- Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
+        "For Colposcpy Biopsy, Cytology": "Colposcopy, Biopsy, Cytology",
+        "For Colposocpy Biopsy, Cytology With Tah Not Recommended": "Colposcopy, Biopsy, Cytology",
+        "For Laser Therapy": "Laser Therapy",
+        "For Pap Smear": "Repeat Pap Smear In 3 Years",
+        "Repeat Pap Smear In 3Years": "Repeat Pap Smear In 3 Years",
+        "Repeat Pap Smear In 3 Years And For Hpv Vaccine": "Repeat Pap Smear In 3 Years",
+        "For Repeat Hpv Testing Annually And Pap Smear In 3 Years": "Repeat Pap Smear In 3 Years",
+        "For Hpv Vaccine, Lifestyle And Sexual Education": "Hpv Vaccine And Sexual Education",
+        "For Colposcopy Biopsy, Cytology +/-Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
+        "For Colposcopy Biopsy And Cytology+/- Tah": "Colposcopy, Biopsy, Cytology +/- Tah",
+        "For Colposcopy Biospy, Cytology": "Colposcopy, Biopsy, Cytology",
+        "Repeat Pap Smear In 3Years": "Repeat Pap Smear In 3 Years"
+    })
+
+    # Handle missing values
+    df = df.fillna({
+        "Age": df["Age"].median(),
+        "Sexual Partners": df["Sexual Partners"].median(),
+        "First Sexual Activity Age": df["First Sexual Activity Age"].median(),
+        "HPV Test Result": "Negative",
+        "Pap Smear Result": "Negative",
+        "Smoking Status": "No",
+        "STDs History": "No",
+        "Insurance Covered": "No",
+        "Screening Type Last": "PAP SMEAR",
+        "Recommended Action": "Repeat Pap Smear In 3 Years",
+        "Region": ""  # Placeholder for region, validated in API
+    })
+
+    # Encode categorical variables
+    encoders = {}
+    for column, name in [
+        ("HPV Test Result", "le_hpv"), ("Pap Smear Result", "le_pap"), ("Smoking Status", "le_smoking"),
+        ("STDs History", "le_std"), ("Insurance Covered", "le_insurance"),
+        ("Screening Type Last", "le_screening"), ("Recommended Action", "le_action")
+    ]:
+        encoders[name] = LabelEncoder()
+        df[column] = encoders[name].fit_transform(df[column])
+
+    logger.info("Cervical data cleaned!")
+    return df, encoders
+
+
+# Step 2: Clean Ovarian Cyst Dataset
+def clean_ovarian_data(df):
+    logger.info("Cleaning Ovarian Cyst data...")
+    df.loc[df["Age"] < 40, "Menopause Status"] = "Pre-Menopausal"
+    df["Menopause Status"] = df["Menopause Status"].str.strip().str.title()
+    df["Ultrasound Features"] = df["Ultrasound Features"].str.strip().str.title()
+    df["Recommended Management"] = df["Recommended Management"].str.strip().str.title()
+    df["Region"] = df["Region"].str.strip().str.title()
+
+    # Create binary columns for symptoms
+    for symptom in symptoms:
+        df[symptom] = df["Reported Symptoms"].apply(
+            lambda x: 1 if symptom.lower() in str(x).lower() else 0
+        )
+
+    df = df.fillna({
+        "Age": df["Age"].median(),
+        "Cyst Size cm": df["Cyst Size cm"].median(),
+        "Cyst Growth Rate cm/month": df["Cyst Growth Rate cm/month"].median(),
+        "CA 125 Level": df["CA 125 Level"].median(),
+        "Menopause Status": "Pre-Menopausal",
+        "Ultrasound Features": "Simple Cyst",
+        "Recommended Management": "Observation",
+        "Reported Symptoms": "",
+        "Date of Exam": pd.Timestamp.now().floor("D"),
+        "Region": ""  # Placeholder for region, validated in API
+    })
+
+    encoders = {}
+    for column, name in [
+        ("Menopause Status", "le_menopause"), ("Ultrasound Features", "le_ultrasound"),
+        ("Recommended Management", "le_management")
+    ]:
+        encoders[name] = LabelEncoder()
+        df[column] = encoders[name].fit_transform(df[column])
+
+    logger.info("Ovarian data cleaned!")
+    return df, encoders
+
+
+# Step 3: Clean Inventory and Costs Datasets
+def clean_inventory_and_costs(inventory_data, costs_data):
+    logger.info("Cleaning Inventory and Costs data...")
+    inventory_data["Facility"] = inventory_data["Facility"].str.strip().str.title()
+    inventory_data["Region"] = inventory_data["Region"].str.strip().str.title()
+    costs_data["Facility"] = costs_data["Facility"].str.strip().str.title()
+    costs_data["Region"] = costs_data["Region"].str.strip().str.title()
+    costs_data["Service"] = costs_data["Service"].str.strip().str.title()
+    costs_data["Category"] = costs_data["Category"].str.strip().str.title()
+    costs_data["NHIF Covered"] = normalize_series(costs_data["NHIF Covered"], YES_NO).fillna(costs_data["NHIF Covered"].str.strip().str.title())
+
+    inventory_data = inventory_data.fillna({
+        "Available Stock": 0,
+        "Cost (KES)": inventory_data["Cost (KES)"].median()
+    })
+    costs_data = costs_data.fillna({
+        "Base Cost (KES)": costs_data["Base Cost (KES)"].median(),
+        "Insurance Copay (KES)": 0,
+        "Out-of-Pocket (KES)": costs_data["Out-of-Pocket (KES)"].median()
+    })
+
+    costs_data["Base Cost (KES)"] = costs_data["Base Cost (KES)"].round(2)
+    costs_data["Insurance Copay (KES)"] = costs_data["Insurance Copay (KES)"].round(2)
+    costs_data["Out-of-Pocket (KES)"] = costs_data["Out-of-Pocket (KES)"].round(2)
+
+    logger.info("Inventory and Costs data cleaned!")
+    return inventory_data, costs_data
+
+
+def train_forest(X, y, label, n_jobs=-1):
+    """
+    Oversample with SMOTE where the class counts allow it, grid-search a
+    RandomForest, log its cross-validation accuracy and refit on the
+    resampled data.
+    """
+    min_samples = min(y.value_counts()) if not y.empty else 2
+    cv_folds = min(5, max(2, min_samples))
+    if min_samples >= 2:
+        smote = SMOTE(random_state=42, k_neighbors=min(5, min_samples-1))
+        try:
+            X_resampled, y_resampled = smote.fit_resample(X, y)
+        except ValueError as e:
+            logger.error(f"SMOTE failed for {label}: {e}. Falling back to original data.")
+            X_resampled, y_resampled = X, y
+    else:
+        logger.warning(f"Not enough samples for SMOTE in {label} data. Using original data.")
+        X_resampled, y_resampled = X, y
+        cv_folds = 2
+
+    grid_search = GridSearchCV(RandomForestClassifier(random_state=42), param_grid, cv=cv_folds, scoring="accuracy", n_jobs=n_jobs)
+    grid_search.fit(X_resampled, y_resampled)
+    model = grid_search.best_estimator_
+    logger.info(f"{label} Model Best parameters: {grid_search.best_params_}")
+
+    if cv_folds >= 2:
+        cv_scores = cross_val_score(model, X_resampled, y_resampled, cv=cv_folds, scoring="accuracy")
+        logger.info(f"{label} Model Cross-Validation Accuracy: {cv_scores.mean() * 100:.2f}% ± {cv_scores.std() * 100:.2f}%")
+    else:
+        logger.info(f"Cross-validation skipped for {label} model due to insufficient samples.")
+
+    model.fit(X_resampled, y_resampled)
+    return model, grid_search.best_params_
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the HerHealth models and write a versioned artifact bundle.")
+    parser.add_argument("--data-dir", default=os.path.abspath("data"), help="Directory holding the source Excel workbooks")
+    parser.add_argument("--artifact-dir", default=None, help="Bundle output directory (default: <data-dir>/artifacts)")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Parallel jobs for GridSearchCV")
+    args = parser.parse_args()
+    data_dir = args.data_dir
+    artifact_dir = args.artifact_dir or os.path.join(data_dir, "artifacts")
+
+    # Load datasets
+    logger.info("Loading datasets...")
+    cervical_data = pd.read_excel(os.path.join(data_dir, "Cervical Cancer Datasets_.xlsx"))
+    ovarian_data = pd.read_excel(os.path.join(data_dir, "Ovarian Cyst Track Data.xlsx"))
+    inventory_data = pd.read_excel(os.path.join(data_dir, "Resources Inventory Cost Sheet.xlsx"))
+    costs_data = pd.read_excel(os.path.join(data_dir, "Treatment Costs Sheet.xlsx"))
+
+    cervical_data, cervical_encoders = clean_cervical_data(cervical_data)
+    ovarian_data, ovarian_encoders = clean_ovarian_data(ovarian_data)
+    inventory_data, costs_data = clean_inventory_and_costs(inventory_data, costs_data)
+    encoders = {**cervical_encoders, **ovarian_encoders}
+    best_params = {}
+
+    # Step 4: Train Cervical Cancer Model
+    logger.info("Training Cervical Cancer model...")
+    X = cervical_data[cervical_features]
+    y = cervical_data["Recommended Action"]
+
+    class_counts = y.value_counts()
+    valid_classes = class_counts[class_counts >= 2].index
+    if len(valid_classes) < len(class_counts):
+        logger.info(f"Filtering out classes with fewer than 2 samples: {list(class_counts[class_counts < 2].index)}")
+        valid_mask = y.isin(valid_classes)
+        X = X[valid_mask]
+        y = y[valid_mask]
+        cervical_data = cervical_data[valid_mask]
+
+    cervical_model, best_params["cervical_model"] = train_forest(X, y, "Cervical", args.n_jobs)
+    predictions = cervical_model.predict(X)
+    logger.info("Cervical Model Classification Report:")
+    logger.info(classification_report(y, predictions, target_names=encoders["le_action"].classes_[valid_classes], zero_division=0))
+
+    # Train Insurance Covered Model
+    logger.info("Training Insurance Covered model...")
+    insurance_model, best_params["insurance_model"] = train_forest(
+        cervical_data[cervical_features], cervical_data["Insurance Covered"], "Insurance", args.n_jobs
+    )
+
+    # Step 5: Train Ovarian Cyst Models
+    logger.info("Training Ovarian Cyst models...")
+    X_ovarian = ovarian_data[ovarian_features]
+
+    y_management = ovarian_data["Recommended Management"]
+    management_model, best_params["management_model"] = train_forest(X_ovarian, y_management, "Management", args.n_jobs)
+    logger.info("Management Model Classification Report:")
+    logger.info(classification_report(y_management, management_model.predict(X_ovarian), target_names=encoders["le_management"].classes_, zero_division=0))
+
+    y_ultrasound = ovarian_data["Ultrasound Features"]
+    ultrasound_model, best_params["ultrasound_model"] = train_forest(X_ovarian, y_ultrasound, "Ultrasound", args.n_jobs)
+    logger.info("Ultrasound Model Classification Report:")
+    logger.info(classification_report(y_ultrasound, ultrasound_model.predict(X_ovarian), target_names=encoders["le_ultrasound"].classes_, zero_division=0))
+
+    # The API serves compiled copies of these forests; refuse to publish a
+    # bundle whose compiled models disagree with sklearn
+    models = {
+        "cervical_model": cervical_model,
+        "insurance_model": insurance_model,
+        "management_model": management_model,
+        "ultrasound_model": ultrasound_model
+    }
+    compiled = compile_models(models)
+    parity = {}
+    for name, X_check in [("cervical_model", cervical_data[cervical_features]), ("insurance_model", cervical_data[cervical_features]),
+                          ("management_model", X_ovarian), ("ultrasound_model", X_ovarian)]:
+        parity[name] = check_parity(models[name], compiled[name], X_check)
+    logger.info(f"Compiled forests match sklearn (max probability diff per model: {parity})")
+
+    version = save_bundle(
+        artifact_dir,
+        models=models,
+        encoders=encoders,
+        frames={
+            "cervical": cervical_data,
+            "ovarian": ovarian_data,
+            "inventory": inventory_data,
+            "costs": costs_data
+        },
+        metadata={"best_params": best_params, "compiled_parity_max_diff": parity}
+    )
+    logger.info(f"Training complete. Artifact bundle version: {version}")
+
+
+if __name__ == "__main__":
+    main()
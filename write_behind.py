@@ -0,0 +1,218 @@
+"""
+Write-behind queue for audit records that are never read on the request path
+(education content, advanced education, risk comparisons).
+
+Requests hand records to submit() and return immediately. A background
+flusher thread drains the bounded queue into Firestore WriteBatch commits,
+retrying failed commits with exponential backoff and full jitter. Records that
+cannot be queued (queue full) or committed (Firestore unreachable after all
+retries) are appended to a local JSONL spill file, which is replayed the next
+time the flusher starts.
+
+Every record gets its document id when it is submitted, so a replayed record
+overwrites itself instead of creating a duplicate.
+"""
+
+import glob
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from firebase_admin import firestore
+
+logger = logging.getLogger(__name__)
+
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def _encode(value):
+    if value is firestore.SERVER_TIMESTAMP:
+        return {"__sentinel__": "SERVER_TIMESTAMP"}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if hasattr(value, "item"):  # NumPy scalars
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode(obj):
+    if obj.get("__sentinel__") == "SERVER_TIMESTAMP":
+        return firestore.SERVER_TIMESTAMP
+    if "__datetime__" in obj and len(obj) == 1:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WriteBehindQueue:
+    def __init__(self, db, spill_path, maxsize=10000, batch_size=FIRESTORE_BATCH_LIMIT,
+                 flush_interval=1.0, max_retries=5, base_delay=0.5, max_delay=30.0, put_timeout=0.05):
+        self.db = db
+        self.spill_path = spill_path
+        self.maxsize = maxsize
+        self.batch_size = min(batch_size, FIRESTORE_BATCH_LIMIT)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.put_timeout = put_timeout
+        self.stats = {"submitted": 0, "committed": 0, "spilled": 0, "replayed": 0, "retries": 0}
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+
+    # Lifecycle
+    def _ensure_started(self):
+        """Start the flusher in this process (again after a fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.maxsize)
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="write-behind-flusher", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def start(self):
+        self._ensure_started()
+        return self
+
+    def stop(self, timeout=10.0):
+        """Flush what is queued, spilling anything that cannot be committed in time."""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        leftover = self._drain(self.maxsize)
+        if leftover:
+            self._spill(leftover)
+
+    # Producer side
+    def submit(self, collection_path, data):
+        """
+        Queue a document for collection_path (e.g. "patient_history/<uid>/education").
+        Applies backpressure by waiting briefly for queue space, then spills to
+        disk rather than blocking the request.
+        """
+        self._ensure_started()
+        record = {"path": collection_path, "id": uuid.uuid4().hex, "data": data}
+        self.stats["submitted"] += 1
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            logger.warning(f"Write-behind queue full, spilling record for {collection_path}")
+            self._spill([record])
+        return record["id"]
+
+    def depth(self):
+        return self._queue.qsize() if self._pid == os.getpid() else 0
+
+    # Flusher side
+    def _run(self):
+        self._replay_spill()
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            records = [first] + self._drain(self.batch_size - 1)
+            self._commit_with_retry(records)
+
+    def _drain(self, limit):
+        records = []
+        while len(records) < limit:
+            try:
+                records.append(self._queue.get_nowait())
+            except (queue.Empty, AttributeError):
+                break
+        return records
+
+    def _commit(self, records):
+        batch = self.db.batch()
+        for record in records:
+            batch.set(self.db.collection(record["path"]).document(record["id"]), record["data"])
+        batch.commit()
+
+    def _commit_with_retry(self, records):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._commit(records)
+                self.stats["committed"] += len(records)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Write-behind commit failed after {attempt + 1} attempts, spilling {len(records)} records: {e}")
+                    self._spill(records)
+                    return False
+                self.stats["retries"] += 1
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                logger.warning(f"Write-behind commit failed ({e}), retrying in {delay:.2f}s")
+                if self._stop.wait(delay):
+                    self._spill(records)
+                    return False
+
+    # Durable spill file
+    def _spill(self, records):
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            with open(self.spill_path, "a") as f:
+                for record in records:
+                    f.write(json.dumps(record, default=_encode) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self.stats["spilled"] += len(records)
+
+    def _replay_spill(self):
+        """
+        Claim the spill file by renaming it (so only one process replays it)
+        and commit its records. Replay files left by a crashed process are
+        picked up as well.
+        """
+        if os.path.exists(self.spill_path):
+            try:
+                os.replace(self.spill_path, f"{self.spill_path}.replay-{os.getpid()}-{int(time.time())}")
+            except OSError as e:
+                logger.error(f"Could not claim write-behind spill file: {e}")
+        for replay_path in sorted(glob.glob(f"{self.spill_path}.replay-*")):
+            if ".claimed-" in replay_path and _pid_alive(int(replay_path.rsplit("-", 1)[1])):
+                continue  # being replayed by a live process
+            claimed = f"{replay_path.split('.claimed-')[0]}.claimed-{os.getpid()}"
+            try:
+                os.replace(replay_path, claimed)
+            except OSError:
+                continue  # another process took it
+            records = []
+            with open(claimed) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        records.append(json.loads(line, object_hook=_decode))
+                    except json.JSONDecodeError:
+                        logger.error(f"Skipping corrupt write-behind spill line in {claimed}")
+            logger.info(f"Replaying {len(records)} spilled write-behind records from {claimed}")
+            for start in range(0, len(records), self.batch_size):
+                if self._commit_with_retry(records[start:start + self.batch_size]):
+                    self.stats["replayed"] += len(records[start:start + self.batch_size])
+            try:
+                os.remove(claimed)
+            except FileNotFoundError:
+                pass
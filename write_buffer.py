@@ -0,0 +1,103 @@
+"""
+Request-scoped Firestore write buffer.
+
+Side-effect helpers (guideline validations, risk comparisons, alerts, care
+plans, ...) call record_write() instead of collection.add(). Inside a view
+wrapped with @buffered_writes the documents are collected on flask.g and
+flushed as one WriteBatch commit when the view succeeds, so a request costs a
+single Firestore round trip and its records land atomically. Outside a
+buffered request record_write() falls back to a direct add().
+
+after_commit() registers work that must only run once the request's writes
+are in Firestore, such as dropping cached reads they make stale.
+"""
+
+import logging
+from functools import wraps
+
+from flask import g, has_request_context, jsonify, make_response
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_BATCH_LIMIT = 500
+
+
+class WriteBuffer:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+        self.callbacks = []
+
+    def __len__(self):
+        return len(self.writes)
+
+    def add(self, collection_ref, data):
+        """Queue a new document in collection_ref and return its reference."""
+        doc_ref = collection_ref.document()
+        self.writes.append((doc_ref, data))
+        return doc_ref
+
+    def commit(self):
+        """
+        Commit the queued writes. Up to FIRESTORE_BATCH_LIMIT writes go in one
+        atomic WriteBatch; larger buffers are split into several commits.
+        """
+        writes, self.writes = self.writes, []
+        for start in range(0, len(writes), FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            for doc_ref, data in writes[start:start + FIRESTORE_BATCH_LIMIT]:
+                batch.set(doc_ref, data)
+            batch.commit()
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+        return len(writes)
+
+
+def current_write_buffer():
+    if not has_request_context():
+        return None
+    return g.get("write_buffer")
+
+
+def record_write(collection_ref, data):
+    """Buffer a document write for the current request, or add it immediately."""
+    buffer = current_write_buffer()
+    if buffer is None:
+        return collection_ref.add(data)[1]
+    return buffer.add(collection_ref, data)
+
+
+def after_commit(callback):
+    """Run callback once the current request's buffered writes are committed, or now if there are none."""
+    buffer = current_write_buffer()
+    if buffer is None:
+        return callback()
+    buffer.callbacks.append(callback)
+
+
+def buffered_writes(db):
+    """
+    Decorator: collect record_write() calls made while the view runs and commit
+    them in one batch if the view returns a non-error response. Error
+    responses discard the buffer, so a rejected request leaves no partial
+    records behind.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            g.write_buffer = WriteBuffer(db)
+            try:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code < 400 and (len(g.write_buffer) or g.write_buffer.callbacks):
+                    try:
+                        g.write_buffer.commit()
+                    except Exception as e:
+                        logger.error(f"Error committing buffered writes in {f.__name__}: {e}")
+                        return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
+                return response
+            finally:
+                g.write_buffer = None
+        return decorated
+    return decorator